@@ -0,0 +1,172 @@
+"""
+Проверка исходящего слоя Bot API (utils.bot_session.ThrottledSession) на локальной
+заглушке Telegram: рассылка (bulk) по множеству чатов и параллельно ответы
+пользователям (interactive). Заглушка, как Telegram, отвечает 429 с retry_after,
+если за последнюю секунду превышен общий или по-чатовый лимит.
+
+    python -m benchmarks.bot_api_burst [--bulk 600] [--chats 200] [--interactive 50]
+        [--server-global 30] [--server-chat 5] [--latency-ms 30] [--baseline]
+
+--baseline — то же самое через обычную AiohttpSession (без ограничителя), для сравнения.
+Для проверки живого бота против заглушки её можно запустить отдельно (--serve) и указать
+BOT_API_URL=http://127.0.0.1:8081.
+"""
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict, deque
+from aiohttp import web
+
+TOKEN = "123456:stub"
+
+class StubTelegram:
+    """
+    Минимальный Bot API: sendMessage и прочие методы отвечают ok, с лимитами
+    global_limit / chat_limit сообщений за скользящую секунду.
+    """
+    def __init__(self, global_limit: int, chat_limit: int, latency: float, retry_after: int = 1):
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.latency = latency
+        self.retry_after = retry_after
+        self.sent = deque()
+        self.per_chat = defaultdict(deque)
+        self.accepted = 0
+        self.rejected = 0
+        self.max_global_per_second = 0
+        self.message_id = 0
+
+    @staticmethod
+    def _trim(window: deque, now: float):
+        while window and window[0] <= now - 1:
+            window.popleft()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        form = await request.post()
+        chat_id = form.get("chat_id")
+        if chat_id is None:
+            return web.json_response({"ok": True, "result": True})
+        now = time.monotonic()
+        chat_window = self.per_chat[chat_id]
+        self._trim(self.sent, now)
+        self._trim(chat_window, now)
+        if len(self.sent) >= self.global_limit or len(chat_window) >= self.chat_limit:
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        self.sent.append(now)
+        chat_window.append(now)
+        self.accepted += 1
+        self.max_global_per_second = max(self.max_global_per_second, len(self.sent))
+        self.message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.message_id, "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"}, "text": form.get("text", ""),
+        }})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[max(0, int(len(values) * p / 100 + 0.999999) - 1)] if values else 0.0
+
+async def run(args):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from utils.bot_session import ThrottledSession, RateLimiter, bulk_lane
+
+    stub = StubTelegram(args.server_global, args.server_chat, args.latency_ms / 1000)
+    runner = web.AppRunner(stub.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+    if args.baseline:
+        session = AiohttpSession(api=api)
+    else:
+        session = ThrottledSession(api=api, limiter=RateLimiter())
+    bot = Bot(TOKEN, session=session)
+
+    bulk_failed = 0
+    interactive_latencies = []
+    interactive_failed = 0
+
+    async def bulk_send(chat_id: int):
+        nonlocal bulk_failed
+        with bulk_lane():
+            try:
+                await bot.send_message(chat_id, "Напоминание: бенчмарк")
+            except Exception:
+                bulk_failed += 1
+
+    async def interactive():
+        nonlocal interactive_failed
+        rng = random.Random(1)
+        for _ in range(args.interactive):
+            await asyncio.sleep(args.interactive_interval_ms / 1000)
+            started = time.perf_counter()
+            try:
+                await bot.send_message(1_000_000 + rng.randint(0, 10_000), "Ответ пользователю")
+                interactive_latencies.append(time.perf_counter() - started)
+            except Exception:
+                interactive_failed += 1
+
+    # Как в ReminderDispatcher: ограниченное число одновременных отправок
+    semaphore = asyncio.Semaphore(args.bulk_concurrency)
+
+    async def bulk_worker(chat_id: int):
+        async with semaphore:
+            await bulk_send(chat_id)
+
+    started = time.perf_counter()
+    bulk = asyncio.gather(*(bulk_worker(i % args.chats) for i in range(args.bulk)))
+    await asyncio.gather(bulk, interactive())
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    await runner.cleanup()
+
+    mode = "без ограничителя" if args.baseline else "ThrottledSession"
+    print(f"{mode}: {args.bulk} рассылочных в {args.chats} чатов + {args.interactive} ответов за {elapsed:.1f} с")
+    print(f"  заглушка: принято {stub.accepted}, ответов 429: {stub.rejected}, "
+          f"максимум за секунду: {stub.max_global_per_second} (лимит {args.server_global})")
+    print(f"  ошибки: рассылка {bulk_failed}, ответы {interactive_failed}")
+    if interactive_latencies:
+        print(f"  задержка ответов p50/p95/max: {percentile(interactive_latencies, 50) * 1000:.0f}/"
+              f"{percentile(interactive_latencies, 95) * 1000:.0f}/{max(interactive_latencies) * 1000:.0f} мс")
+
+async def serve(args):
+    stub = StubTelegram(args.server_global, args.server_chat, args.latency_ms / 1000)
+    runner = web.AppRunner(stub.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    print(f"Заглушка Bot API: BOT_API_URL=http://127.0.0.1:{args.port}")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", type=int, default=600)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--bulk-concurrency", type=int, default=25)
+    parser.add_argument("--interactive", type=int, default=50)
+    parser.add_argument("--interactive-interval-ms", type=float, default=200)
+    parser.add_argument("--server-global", type=int, default=30)
+    parser.add_argument("--server-chat", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--serve", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(serve(args) if args.serve else run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Замер колоночной выборки (database.columnar) против построчной: память на строку и время
+преобразования для 10k / 100k / 1M операций.
+
+Без базы вывод бинарного COPY генерируется, а построчный вариант — кортежи
+(Decimal, str, str, datetime), как в asyncpg.Record; сверяются и итоги по дням.
+Отдельно — пиковая память итогов по дням при чтении COPY пачками:
+она не должна расти с числом строк.
+Каждый размер считается в отдельном процессе, чтобы max RSS не накапливался.
+
+    python -m benchmarks.columnar [10000 100000 1000000]
+
+С --db <telegram_id> обе выборки идут из настоящей базы (нужен PostgreSQL с операциями
+пользователя, например после python -m benchmarks.load):
+
+    python -m benchmarks.columnar --db 9000000000
+"""
+import sys
+import time
+import asyncio
+import resource
+import tracemalloc
+import subprocess
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+from database import columnar
+
+CURRENCIES = ["EUR", "RUB", "TJS", "USD"]
+CATEGORIES = ["Еда", "Здоровье", "Коммуналка", "Одежда", "Связь", "Транспорт", None]
+SUMMARY = {
+    "base_currency": "TJS",
+    "rates": {"TJS": Decimal(1), "USD": Decimal("10.93500000"), "EUR": Decimal("11.87250000"), "RUB": Decimal("0.11830000")},
+}
+
+def make_columns(n: int) -> dict:
+    rng = np.random.default_rng(1)
+    start = np.datetime64("2022-01-01T08:00:00", "us")
+    return {
+        "amount": rng.integers(100, 5_000_000, n, dtype=np.int64),
+        "created_at": np.sort(start + rng.integers(0, 3 * 365 * 86400, n) * np.timedelta64(1_000_000, "us")),
+        "currency": rng.integers(0, len(CURRENCIES), n).astype(np.int32),
+        "category": rng.integers(0, len(CATEGORIES), n).astype(np.int32),
+    }
+
+def make_copy(data: dict) -> bytes:
+    """
+    Бинарный вывод COPY, как его отдаёт PostgreSQL для columnar.COLUMNS_SQL.
+    """
+    rows = np.zeros(len(data["amount"]), dtype=columnar.ROW_DTYPE)
+    rows["fields"] = 4
+    for name, length in columnar.FIELD_LENGTHS.items():
+        rows[name] = length
+    rows["amount"] = data["amount"]
+    rows["created_at"] = data["created_at"].astype(np.int64) - columnar.PG_EPOCH_US
+    rows["currency"] = data["currency"]
+    rows["category"] = data["category"]
+    header = columnar.COPY_SIGNATURE + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+    return header + rows.tobytes() + (-1).to_bytes(2, "big", signed=True)
+
+def to_columns(payload: bytes) -> columnar.TransactionColumns:
+    return columnar.columns_from_copy(payload, CURRENCIES, CATEGORIES)
+
+def stream_daily_totals(payload: bytes, chunk_size: int = 65536) -> list:
+    # Поток COPY приходит фрагментами, как из сокета
+    totals = columnar.DailyTotals(CURRENCIES, CATEGORIES)
+    reader = columnar.CopyReader(lambda rows: totals.add(columnar.columns_from_rows(rows, CURRENCIES, CATEGORIES)))
+
+    async def feed():
+        for start in range(0, len(payload), chunk_size):
+            await reader(payload[start:start + chunk_size])
+        reader.finish()
+
+    asyncio.run(feed())
+    return totals.result(SUMMARY)
+
+def to_records(data: dict) -> list:
+    # Объекты, которые asyncpg создаёт на каждую строку
+    epoch = datetime(1970, 1, 1)
+    return [
+        (Decimal(amount).scaleb(-2), CURRENCIES[currency], CATEGORIES[category], epoch + timedelta(microseconds=ts))
+        for amount, currency, category, ts in zip(
+            data["amount"].tolist(), data["currency"].tolist(), data["category"].tolist(),
+            data["created_at"].astype(np.int64).tolist(),
+        )
+    ]
+
+def daily_totals_rows(records: list, summary: dict) -> list:
+    # Построчная группировка — эталон для сверки; ROUND в PostgreSQL округляет половину от нуля
+    rates = summary["rates"]
+    totals = {}
+    for amount, currency, category, created_at in records:
+        key = (created_at.date().isoformat(), category)
+        totals[key] = totals.get(key, 0) + amount * rates[currency]
+    base_rate = rates[summary["base_currency"]]
+    return [(day, category, (total / base_rate).quantize(columnar.CENT, ROUND_HALF_UP)) for (day, category), total in totals.items()]
+
+def measure(func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, size
+
+def measure_peak(func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def report(n: int, title: str, elapsed: float, size: int):
+    print(f"{n:>8} строк, {title:<22} {elapsed:7.3f} с, {size / 2**20:8.1f} МБ ({size / max(n, 1):6.1f} байт/строку)", flush=True)
+
+def run(n: int):
+    data = make_columns(n)
+    payload = make_copy(data)
+    columns, elapsed, size = measure(to_columns, payload)
+    report(n, "колонки из COPY", elapsed, size)
+    records, elapsed, size = measure(to_records, data)
+    report(n, "кортежи объектов", elapsed, size)
+
+    started = time.perf_counter()
+    vectorized = columnar.daily_totals(columns, SUMMARY)
+    vectorized_time = time.perf_counter() - started
+    started = time.perf_counter()
+    reference = daily_totals_rows(records, SUMMARY)
+    reference_time = time.perf_counter() - started
+    streamed, streamed_time, peak = measure_peak(stream_daily_totals, payload)
+    print(f"{n:>8} строк, итоги по дням пачками COPY: {streamed_time:.3f} с, пик {peak / 2**20:.1f} МБ", flush=True)
+    same = sorted(vectorized, key=str) == sorted(reference, key=str) and streamed == vectorized
+    print(f"{n:>8} строк, итоги по дням: numpy {vectorized_time:.3f} с, построчно {reference_time:.3f} с, "
+          f"{'совпадают' if same else 'НЕ СОВПАДАЮТ'}; max RSS "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ", flush=True)
+    if not same:
+        sys.exit(1)
+
+async def run_db(telegram_id: int):
+    from database import db
+    from database import export
+    pool = await db.get_pool()
+    try:
+        user_id = await db.get_user_id(telegram_id, pool)
+        async with pool.acquire() as conn:
+            for table in export.TRANSACTION_TABLES:
+                tracemalloc.start()
+                started = time.perf_counter()
+                records = await conn.fetch(export.DETAIL_SQL.format(table=table), user_id)
+                elapsed = time.perf_counter() - started
+                size = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                report(len(records), f"{table}: Record", elapsed, size)
+                del records
+                tracemalloc.start()
+                started = time.perf_counter()
+                columns = await columnar.fetch_columns(conn, table, user_id)
+                elapsed = time.perf_counter() - started
+                size = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                report(len(columns), f"{table}: колонки", elapsed, size)
+    finally:
+        await db.close_pool()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--one":
+        run(int(sys.argv[2]))
+    elif len(sys.argv) == 3 and sys.argv[1] == "--db":
+        asyncio.run(run_db(int(sys.argv[2])))
+    else:
+        sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+        for n in sizes:
+            subprocess.run([sys.executable, "-m", "benchmarks.columnar", "--one", str(n)], check=True)
@@ -0,0 +1,92 @@
+"""
+Замер импорта операций из файла: разбор CSV и XLSX на 1k / 10k / 100k строк, время и пик памяти.
+База не нужна — файл генерируется, строки проходят разбор и проверку до пачек для COPY.
+Каждый размер и формат считается в отдельном процессе, чтобы max RSS не накапливался.
+
+    python -m benchmarks.import_file [1000 10000 100000]
+
+С --db <telegram_id> файл целиком загружается пользователю дважды (нужен PostgreSQL):
+второй проход должен вставить 0 строк.
+
+    python -m benchmarks.import_file --db 9000000000 [100000]
+"""
+import io
+import sys
+import csv
+import time
+import asyncio
+import resource
+import subprocess
+from datetime import datetime, timedelta
+from utils.transaction_import import read_rows, iter_chunks
+
+CATEGORIES = ["Еда", "Транспорт", "Коммуналка", "Связь", "Одежда", "Здоровье"]
+HEADER = ["Дата", "Сумма", "Валюта", "Категория"]
+
+def make_rows(n: int) -> list:
+    start = datetime(2020, 1, 1, 9, 0)
+    return [
+        [(start + timedelta(minutes=37 * i)).strftime("%Y-%m-%d %H:%M"), -(i % 1000 + 0.5), "TJS", CATEGORIES[i % len(CATEGORIES)]]
+        for i in range(n)
+    ]
+
+def make_file(n: int, fmt: str) -> bytes:
+    rows = make_rows(n)
+    if fmt == "csv":
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+        return text.getvalue().encode("utf-8")
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def run(n: int, fmt: str):
+    data = make_file(n, fmt)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    problems = {"invalid": 0, "errors": []}
+    started = time.perf_counter()
+    valid = sum(len(chunk) for chunk in iter_chunks(read_rows(data, f"bench.{fmt}"), problems))
+    elapsed = time.perf_counter() - started
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    growth_mb = rss_mb - base_rss / 1024
+    print(f"{fmt:>4} {n:>7} строк: {elapsed:6.2f} с ({n / elapsed:8.0f} строк/с), max RSS {rss_mb:6.1f} МБ "
+          f"(+{growth_mb:.1f} МБ), файл {len(data) / 2**20:5.2f} МБ, ошибок {problems['invalid']}, "
+          f"принято {valid}", flush=True)
+
+async def run_db(telegram_id: int, n: int):
+    from database import db
+    from utils import report_pool
+    from utils.transaction_import import import_transactions
+    await db.init_db_schema()
+    pool = await db.get_pool()
+    try:
+        user_id = await db.get_user_id(telegram_id, pool)
+        data = make_file(n, "csv")
+        for attempt in (1, 2):
+            started = time.perf_counter()
+            result = await import_transactions(user_id, data, "bench.csv")
+            elapsed = time.perf_counter() - started
+            print(f"проход {attempt}: {elapsed:6.2f} с, вставлено {result['inserted']}, "
+                  f"повторов {result['duplicates']}, ошибок {result['invalid']}", flush=True)
+    finally:
+        report_pool.shutdown()
+        await db.close_pool()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--one":
+        run(int(sys.argv[2]), sys.argv[3])
+    elif len(sys.argv) >= 3 and sys.argv[1] == "--db":
+        asyncio.run(run_db(int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 100000))
+    else:
+        sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+        for fmt in ("csv", "xlsx"):
+            for n in sizes:
+                subprocess.run([sys.executable, "-m", "benchmarks.import_file", "--one", str(n), fmt], check=True)
@@ -0,0 +1,403 @@
+"""
+Нагрузочный бенчмарк: приложение из main.create_app() поднимается на локальном порту,
+Bot API подменяется заглушкой, а на /webhook отправляются сгенерированные апдейты.
+Каждый виртуальный пользователь проходит сценарий целиком (доход, расход, напоминание
+или «Статистика»); задержка шага — от POST апдейта до последнего ответа бота на него.
+
+Нужен локальный PostgreSQL (DATABASE_URL или DB_*). Лучше отдельная база: бенчмарк
+применяет миграции и заводит пользователей с telegram_id от BENCH_TELEGRAM_ID_BASE,
+которым раскладывает --transactions доходов и расходов.
+
+    python -m benchmarks.load --transactions 100000 [--users 200] [--concurrency 50]
+        [--flows 500] [--scenarios income expense reminder statistics]
+        [--api-latency-ms 0] [--output benchmarks/results/load.json]
+
+Каждый сценарий идёт в отдельном процессе, чтобы пик RSS не накапливался. Результаты
+(пропускная способность, p50/p95/p99, пик RSS) печатаются и пишутся в JSON для сравнения
+запусков. Режимы бота задаются как обычно переменными окружения (WRITE_BATCHING,
+INGEST_QUEUE, FSM_STORAGE, ...), они тоже попадают в файл результатов.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import resource
+import subprocess
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+BENCH_TELEGRAM_ID_BASE = 9_000_000_000
+SCENARIOS = ("income", "expense", "reminder", "statistics")
+# Переменные окружения, от которых зависят результаты
+RECORDED_ENV = (
+    "FSM_STORAGE", "WRITE_BATCHING", "INGEST_QUEUE", "INGEST_WORKERS", "WEBHOOK_REPLY_IN_RESPONSE", "DB_POOL_MAX_SIZE",
+    "REPORT_EXECUTOR", "REPORT_WORKERS", "REPORT_QUEUE_SIZE", "WEB_WORKERS",
+)
+
+INCOME_CATEGORIES = ["Зарплата", "Фриланс", "Подарок", "Продажа", "Бонус"]
+EXPENSE_CATEGORIES = ["Еда", "Транспорт", "Коммуналка", "Связь", "Одежда", "Здоровье"]
+
+def bench_telegram_ids(users: int) -> list:
+    return [BENCH_TELEGRAM_ID_BASE + i for i in range(users)]
+
+# === Подготовка базы ===
+
+async def seed(transactions: int, users: int):
+    """
+    Раскладывает transactions операций (поровну доходы и расходы) по users пользователям.
+    Если у них уже ровно столько операций — ничего не делает.
+    """
+    from database import db
+    await db.init_db_schema()
+    pool = await db.get_pool()
+    telegram_ids = bench_telegram_ids(users)
+    async with pool.acquire() as conn:
+        user_ids = [row["id"] for row in await conn.fetch(
+            """
+            INSERT INTO users (telegram_id) SELECT unnest($1::bigint[])
+            ON CONFLICT (telegram_id) DO UPDATE SET telegram_id = EXCLUDED.telegram_id
+            RETURNING id
+            """,
+            telegram_ids
+        )]
+        existing = await conn.fetchval(
+            """
+            SELECT (SELECT count(*) FROM incomes WHERE user_id = ANY($1))
+                 + (SELECT count(*) FROM expenses WHERE user_id = ANY($1))
+            """,
+            user_ids
+        )
+        if existing == transactions:
+            print(f"База уже заполнена: {existing} операций у {users} пользователей")
+            return
+        print(f"Заполняем базу: {transactions} операций у {users} пользователей...")
+        started = time.perf_counter()
+        async with conn.transaction():
+            for table in ("reminders", "incomes", "expenses"):
+                await conn.execute(f"DELETE FROM {table} WHERE user_id = ANY($1)", user_ids)
+            rng = random.Random(42)
+            now = datetime.now()
+            for table, categories, count in (
+                ("incomes", INCOME_CATEGORIES, transactions // 2),
+                ("expenses", EXPENSE_CATEGORIES, transactions - transactions // 2),
+            ):
+                records = (
+                    (
+                        user_ids[i % len(user_ids)],
+                        Decimal(rng.randint(100, 500_000)) / 100,
+                        "TJS",
+                        rng.choice(categories),
+                        now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600)),
+                    )
+                    for i in range(count)
+                )
+                await conn.copy_records_to_table(
+                    table, records=records,
+                    columns=["user_id", "amount", "currency", "category", "created_at"],
+                )
+        print(f"Готово за {time.perf_counter() - started:.1f} с")
+    await db.close_pool()
+
+# === Заглушка Bot API ===
+
+STUB_FILE_CONTENT = b"stub file content"
+
+def make_stub_session(latency: float):
+    from aiogram.methods import SendMessage, SendDocument
+    from aiogram.types import Message
+    from utils.bot_session import PreparedMarkupSession
+
+    class StubSession(PreparedMarkupSession):
+        """
+        Отвечает на запросы к Bot API без сети (тело запроса при этом собирается, как
+        в настоящей сессии). Ответы пользователю (sendMessage, sendDocument) отмечаются
+        в ожиданиях сценария, остальное (answerCallbackQuery, editMessageReplyMarkup)
+        просто возвращает True.
+        """
+        def __init__(self):
+            super().__init__()
+            self.latency = latency
+            self.message_id = 0
+            self.waiters = {}
+            self.unexpected = 0
+
+        def expect(self, chat_id: int, replies: int) -> asyncio.Future:
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[chat_id] = [replies, future]
+            return future
+
+        def record_reply(self, chat_id: int):
+            waiter = self.waiters.get(chat_id)
+            if waiter is None:
+                self.unexpected += 1
+                return
+            waiter[0] -= 1
+            if waiter[0] == 0:
+                del self.waiters[chat_id]
+                if not waiter[1].done():
+                    waiter[1].set_result(time.perf_counter())
+
+        async def make_request(self, bot, method, timeout=None):
+            self.build_form_data(bot, method)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if not isinstance(method, (SendMessage, SendDocument)):
+                return True
+            self.message_id += 1
+            result = {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": method.chat_id, "type": "private"},
+            }
+            if isinstance(method, SendDocument):
+                result["document"] = {"file_id": f"stub-{self.message_id}", "file_unique_id": f"stub-{self.message_id}"}
+            else:
+                result["text"] = method.text
+            self.record_reply(method.chat_id)
+            return Message.model_validate(result, context={"bot": bot})
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            # Скачивание файлов сценарий не измеряет: отдаём заглушку с той же задержкой
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            yield STUB_FILE_CONTENT
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+# === Апдейты и сценарии ===
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = random.randint(1, 1_000_000) * 1000
+        self.message_id = 0
+
+    def _user(self, telegram_id: int) -> dict:
+        return {"id": telegram_id, "is_bot": False, "first_name": "Bench", "language_code": "ru"}
+
+    def message(self, telegram_id: int, text: str) -> dict:
+        self.update_id += 1
+        self.message_id += 1
+        return {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "from": self._user(telegram_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, telegram_id: int, data: str) -> dict:
+        self.update_id += 1
+        return {
+            "update_id": self.update_id,
+            "callback_query": {
+                "id": str(self.update_id),
+                "from": self._user(telegram_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": self.message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": telegram_id, "type": "private"},
+                    "text": "bench",
+                },
+            },
+        }
+
+def scenario_steps(name: str, updates: UpdateFactory, telegram_id: int, rng: random.Random) -> list:
+    """
+    :return: [(апдейт, сколько ответов бота ждать)]
+    """
+    if name == "income":
+        return [
+            (updates.message(telegram_id, "Добавить доход"), 1),
+            (updates.message(telegram_id, f"{rng.randint(100, 50_000)}.50"), 1),
+            (updates.message(telegram_id, rng.choice(INCOME_CATEGORIES)), 1),
+        ]
+    if name == "expense":
+        return [
+            (updates.message(telegram_id, "Добавить расход"), 1),
+            (updates.message(telegram_id, f"{rng.randint(10, 5_000)}"), 1),
+            (updates.message(telegram_id, rng.choice(EXPENSE_CATEGORIES)), 1),
+        ]
+    if name == "reminder":
+        from aiogram_calendar import SimpleCalendarCallback
+        from aiogram_calendar.schemas import SimpleCalAct
+        day = datetime.now() + timedelta(days=1)
+        hour = rng.randint(8, 20)
+        return [
+            (updates.message(telegram_id, "Создать напоминание"), 1),
+            (updates.message(telegram_id, "Оплатить интернет"), 1),
+            (updates.callback(telegram_id, SimpleCalendarCallback(
+                act=SimpleCalAct.day, year=day.year, month=day.month, day=day.day
+            ).pack()), 1),
+            (updates.callback(telegram_id, f"set_hour_{hour}"), 1),
+            (updates.callback(telegram_id, f"set_minute_{hour}_{rng.choice((0, 15, 30, 45))}"), 1),
+            (updates.callback(telegram_id, f"set_repeat_{rng.choice(('none', 'daily', 'weekly', 'monthly'))}"), 1),
+        ]
+    if name == "statistics":
+        # Сводка и файл отчёта
+        return [(updates.message(telegram_id, "Статистика"), 2)]
+    raise ValueError(f"Неизвестный сценарий: {name}")
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+async def run_scenario(name: str, args) -> dict:
+    import aiohttp
+    from aiohttp.test_utils import TestServer
+    import logging
+    import main
+
+    # Строка лога на каждый апдейт заметно искажает замер
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    session = make_stub_session(args.api_latency_ms / 1000)
+    app = main.create_app(setup_webhook=False, session=session)
+    server = TestServer(app)
+    await server.start_server()
+    url = server.make_url(main.WEBHOOK_PATH)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": main.WEBHOOK_SECRET}
+    updates = UpdateFactory()
+    telegram_ids = bench_telegram_ids(args.users)
+    # У пользователя в каждый момент идёт не больше одного сценария, иначе шаги FSM перемешаются
+    concurrency = min(args.concurrency, args.users)
+    step_latencies, flow_latencies = [], []
+    errors = 0
+
+    async def run_flow(client: aiohttp.ClientSession, telegram_id: int, rng: random.Random):
+        nonlocal errors
+        flow_started = time.perf_counter()
+        for update, replies in scenario_steps(name, updates, telegram_id, rng):
+            waiter = session.expect(telegram_id, replies)
+            started = time.perf_counter()
+            try:
+                async with client.post(url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"HTTP {response.status}")
+                    # WEBHOOK_REPLY_IN_RESPONSE=1: ответ пришёл прямо в теле ответа на вебхук
+                    if b'name="method"' in await response.read():
+                        session.record_reply(telegram_id)
+                finished = await asyncio.wait_for(waiter, timeout=args.step_timeout)
+            except Exception:
+                session.waiters.pop(telegram_id, None)
+                errors += 1
+                return
+            step_latencies.append(finished - started)
+        flow_latencies.append(time.perf_counter() - flow_started)
+
+    async def worker(index: int, client: aiohttp.ClientSession):
+        rng = random.Random(index)
+        own = telegram_ids[index::concurrency]
+        for number, _ in enumerate(range(index, args.flows, concurrency)):
+            await run_flow(client, own[number % len(own)], rng)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    await server.close()
+
+    return {
+        "flows": len(flow_latencies),
+        "steps": len(step_latencies),
+        "errors": errors,
+        "unexpected_replies": session.unexpected,
+        "seconds": round(elapsed, 3),
+        "flows_per_second": round(len(flow_latencies) / elapsed, 2),
+        "updates_per_second": round(len(step_latencies) / elapsed, 2),
+        "step_ms": {
+            "p50": round(percentile(step_latencies, 50) * 1000, 2),
+            "p95": round(percentile(step_latencies, 95) * 1000, 2),
+            "p99": round(percentile(step_latencies, 99) * 1000, 2),
+            "max": round(max(step_latencies, default=0) * 1000, 2),
+        },
+        "flow_ms": {
+            "p50": round(percentile(flow_latencies, 50) * 1000, 2),
+            "p95": round(percentile(flow_latencies, 95) * 1000, 2),
+            "p99": round(percentile(flow_latencies, 99) * 1000, 2),
+        },
+        # Сервер и генератор нагрузки в одном процессе; воркеры отчётов — дочерние процессы
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=10_000, help="операций в базе (10k–1M)")
+    parser.add_argument("--users", type=int, default=200, help="виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных сценариев")
+    parser.add_argument("--flows", type=int, default=500, help="сценариев на каждый вид")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="имитация задержки Bot API")
+    parser.add_argument("--step-timeout", type=float, default=60)
+    parser.add_argument("--output", default=None, help="файл результатов (JSON)")
+    parser.add_argument("--one", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        # Дочерний процесс: один сценарий, результат — последней строкой stdout
+        print(json.dumps(asyncio.run(run_scenario(args.one, args))))
+        return
+
+    asyncio.run(seed(args.transactions, args.users))
+    env = dict(os.environ, REMINDERS_ENABLED="0", METRICS_ENABLED="0")
+    passthrough = [
+        "--users", str(args.users), "--concurrency", str(args.concurrency), "--flows", str(args.flows),
+        "--api-latency-ms", str(args.api_latency_ms), "--step-timeout", str(args.step_timeout),
+    ]
+    results = {}
+    for name in args.scenarios:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.load", "--one", name] + passthrough,
+            capture_output=True, text=True, env=env,
+        )
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(completed.returncode)
+        result = results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{name:<11} {result['flows']:>6} сценариев, {result['updates_per_second']:>8.1f} апд/с, "
+              f"шаг p50/p95/p99 {result['step_ms']['p50']:.1f}/{result['step_ms']['p95']:.1f}/"
+              f"{result['step_ms']['p99']:.1f} мс, ошибок {result['errors']}, "
+              f"RSS {result['peak_rss_mb']:.0f} МБ (воркеры {result['children_peak_rss_mb']:.0f} МБ)")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"load-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "params": {
+                "transactions": args.transactions, "users": args.users, "concurrency": args.concurrency,
+                "flows": args.flows, "api_latency_ms": args.api_latency_ms,
+            },
+            "env": {name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+            "scenarios": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Замер генерации PDF-отчёта: время и пик памяти для 1k / 10k / 100k строк.
+База не нужна — на вход подаются синтетические агрегированные строки.
+Каждый размер считается в отдельном процессе, чтобы max RSS не накапливался.
+
+    python -m benchmarks.pdf_render [1000 10000 100000]
+"""
+import sys
+import time
+import resource
+import subprocess
+from datetime import date, timedelta
+from decimal import Decimal
+from utils.pdf_export import build_pdf_report
+
+CATEGORIES = ["Еда", "Транспорт", "Коммуналка", "Связь", "Одежда", "Здоровье"]
+
+def make_rows(n: int) -> list:
+    start = date(2020, 1, 1)
+    return [
+        ((start + timedelta(days=i // len(CATEGORIES))).isoformat(), CATEGORIES[i % len(CATEGORIES)], Decimal(i % 1000) + Decimal("0.50"))
+        for i in range(n)
+    ]
+
+def make_summary(rows: list) -> dict:
+    by_month = {}
+    for day, _, total in rows:
+        by_month[day[:7]] = by_month.get(day[:7], Decimal(0)) + total
+    return {"income_by_month": by_month, "expense_by_month": {}}
+
+def run(n: int):
+    rows = make_rows(n)
+    summary = make_summary(rows)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    data = build_pdf_report(summary, rows, [])
+    elapsed = time.perf_counter() - started
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    growth_mb = rss_mb - base_rss / 1024
+    print(f"{n:>7} строк: {elapsed:7.2f} с, max RSS {rss_mb:7.1f} МБ (+{growth_mb:.1f} МБ на рендер), "
+          f"PDF {len(data) / 2**20:6.2f} МБ", flush=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--one":
+        run(int(sys.argv[2]))
+    else:
+        sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+        for n in sizes:
+            subprocess.run([sys.executable, "-m", "benchmarks.pdf_render", "--one", str(n)], check=True)
@@ -0,0 +1,75 @@
+"""
+Замер холодного старта: время импорта main и создания приложения (create_app)
+в свежем процессе, самые дорогие модули по `python -X importtime` и проверка,
+что тяжёлые библиотеки отчётов не загружаются при старте.
+
+    python -m benchmarks.startup [--top 15] [--max-ms 6000]
+
+С --max-ms скрипт завершается с кодом 1, если старт дольше порога или
+при старте подгрузился модуль из LAZY_MODULES, — удобно для CI.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+# Нужны только при генерации отчётов и в календаре напоминаний — при старте их быть не должно
+LAZY_MODULES = ("pandas", "numpy", "xlsxwriter", "reportlab", "aiogram_calendar")
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app(setup_webhook=False)
+created = time.perf_counter()
+print(f"{(imported - started) * 1000:.1f} {(created - imported) * 1000:.1f}")
+print(" ".join(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+def parse_importtime(stderr: str) -> list:
+    """
+    :return: [(cumulative_us, self_us, module)] по строкам вывода -X importtime
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ, BOT_TOKEN=os.getenv("BOT_TOKEN", "123456:benchmark"), REMINDERS_ENABLED="0")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+    timings, loaded = result.stdout.strip().splitlines()[-2:]
+    import_ms, create_ms = map(float, timings.split())
+    loaded = set(loaded.split())
+
+    print(f"import main: {import_ms:8.1f} мс")
+    print(f"create_app:  {create_ms:8.1f} мс")
+    print(f"итого:       {import_ms + create_ms:8.1f} мс\n")
+    print("Самые дорогие модули (собственное / накопленное время):")
+    rows = sorted(parse_importtime(result.stderr), key=lambda row: row[1], reverse=True)
+    for cumulative_us, self_us, module in rows[:args.top]:
+        print(f"  {self_us / 1000:8.1f} / {cumulative_us / 1000:8.1f} мс  {module.strip()}")
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"\nПри старте загружены тяжёлые модули: {', '.join(eager)}")
+    if args.max_ms is not None and (eager or import_ms + create_ms > args.max_ms):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Колоночная выборка операций: строки incomes/expenses читаются через COPY ... TO STDOUT
+в бинарном формате и разбираются numpy прямо в непрерывные массивы, без asyncpg.Record,
+Decimal, datetime и str на каждую строку:
+
+    amount      int64, копейки (amount * 100 — точно, NUMERIC(12,2))
+    created_at  datetime64[us]
+    currency    int32, код в currencies
+    category    int32, код в categories (NULL — тоже отдельный код)
+
+Около 24 байт на строку против сотен у Record. Суммы складываются в int64 и
+переводятся в Decimal только после группировки, поэтому итоги точные. Поток COPY
+можно читать пачками (CopyReader) и сразу сворачивать в итоги по дням (DailyTotals),
+тогда память не растёт с числом операций. Отчёты Excel и PDF считают итоги по дням
+в базе (export.fetch_daily_totals) — модуль для аналитики и замеров.
+
+    python -m benchmarks.columnar — замер памяти и времени разбора
+"""
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+import numpy as np
+from database import export
+
+CENT = Decimal("0.01")
+
+# Все поля фиксированной длины, поэтому строка бинарного COPY без NULL занимает одинаковое
+# число байт и читается одним структурным dtype (big-endian). У NULL длина -1 и нет данных:
+# такие строки (created_at в ещё не секционированных таблицах) разбираются по одной и пропускаются
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+ROW_DTYPE = np.dtype([
+    ("fields", ">i2"),
+    ("amount_len", ">i4"), ("amount", ">i8"),
+    ("created_at_len", ">i4"), ("created_at", ">i8"),
+    ("currency_len", ">i4"), ("currency", ">i4"),
+    ("category_len", ">i4"), ("category", ">i4"),
+])
+FIELD_LENGTHS = {"amount_len": 8, "created_at_len": 8, "currency_len": 4, "category_len": 4}
+# Сколько строк COPY копится перед разбором: ~2 МБ буфера
+COPY_BATCH_ROWS = 50_000
+# Бинарный timestamp — микросекунды от 2000-01-01
+PG_EPOCH_US = np.datetime64("2000-01-01T00:00:00", "us").astype(np.int64)
+
+LABELS_SQL = """
+    SELECT ARRAY(SELECT DISTINCT currency FROM {table} WHERE user_id = $1 ORDER BY 1),
+           ARRAY(SELECT DISTINCT category FROM {table} WHERE user_id = $1 ORDER BY 1)
+"""
+
+# array_position сравнивает через IS NOT DISTINCT FROM, поэтому NULL-категория тоже получает код.
+# Коды идут в порядке сортировки базы (NULL — последним), как ORDER BY в export.DAILY_TOTALS_SQL
+COLUMNS_SQL = """
+    SELECT (amount * 100)::int8, created_at,
+           array_position($2::varchar[], currency) - 1,
+           array_position($3::varchar[], category) - 1
+    FROM {table} WHERE user_id = $1
+    ORDER BY created_at, id
+"""
+
+class TransactionColumns:
+    """
+    Операции одной таблицы в виде колонок. Строки упорядочены по (created_at, id).
+    """
+    def __init__(self, amount, created_at, currency, category, currencies: list, categories: list):
+        self.amount = amount
+        self.created_at = created_at
+        self.currency = currency
+        self.category = category
+        self.currencies = currencies
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    @property
+    def nbytes(self) -> int:
+        return self.amount.nbytes + self.created_at.nbytes + self.currency.nbytes + self.category.nbytes
+
+def take_rows(data) -> tuple:
+    """
+    Разбирает целые строки бинарного COPY для COLUMNS_SQL с начала data (после заголовка).
+    Строки с NULL пропускаются; неполная последняя строка и маркер конца остаются неразобранными.
+    :return: (структурный массив ROW_DTYPE — копия, сколько байт data разобрано)
+    :raises ValueError: если формат не совпадает с ожидаемым
+    """
+    size = ROW_DTYPE.itemsize
+    chunks = []
+    pos = 0
+    while True:
+        count = (len(data) - pos) // size
+        if count:
+            rows = np.frombuffer(data, dtype=ROW_DTYPE, count=count, offset=pos)
+            bad = rows["fields"] != 4
+            for name, length in FIELD_LENGTHS.items():
+                bad |= rows[name] != length
+            fixed = int(bad.argmax()) if bad.any() else count
+            if fixed:
+                chunks.append(rows[:fixed].copy())
+                pos += fixed * size
+        skipped = _skip_null_row(data, pos)
+        if skipped is None:
+            break
+        pos += skipped
+    if not chunks:
+        return np.empty(0, ROW_DTYPE), pos
+    return (chunks[0] if len(chunks) == 1 else np.concatenate(chunks)), pos
+
+def _skip_null_row(data, pos: int):
+    """
+    :return: длина строки с NULL по смещению pos; None — если строка не пришла целиком или это маркер конца
+    :raises ValueError: если это строка без NULL, но с неожиданными полями
+    """
+    if len(data) - pos < 2:
+        return None
+    fields = int.from_bytes(data[pos:pos + 2], "big", signed=True)
+    if fields == -1:
+        return None
+    if fields != 4:
+        raise ValueError("Неожиданные поля в выводе COPY")
+    end = pos + 2
+    has_null = False
+    for _ in range(fields):
+        if len(data) - end < 4:
+            return None
+        length = int.from_bytes(data[end:end + 4], "big", signed=True)
+        end += 4
+        if length == -1:
+            has_null = True
+        else:
+            end += length
+    if end > len(data):
+        return None
+    if not has_null:
+        raise ValueError("Неожиданные поля в выводе COPY")
+    return end - pos
+
+def parse_header(data) -> int:
+    """
+    :return: длина заголовка бинарного COPY
+    :raises ValueError: если это не бинарный COPY
+    """
+    if bytes(data[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+        raise ValueError("Не бинарный вывод COPY")
+    return 19 + int.from_bytes(data[15:19], "big")
+
+def parse_copy(data) -> np.ndarray:
+    """
+    Разбирает вывод COPY ... (FORMAT binary) для COLUMNS_SQL целиком.
+    :return: структурный массив ROW_DTYPE без строк с NULL
+    :raises ValueError: если формат не совпадает с ожидаемым
+    """
+    data = memoryview(data)
+    start = parse_header(data)
+    rows, parsed = take_rows(data[start:])
+    # В конце — маркер -1 (int16)
+    if bytes(data[start + parsed:]) != b"\xff\xff":
+        raise ValueError("Неполный вывод COPY")
+    return rows
+
+class CopyReader:
+    """
+    Приёмник для conn.copy_from_query(output=...): разбирает поток бинарного COPY
+    по мере поступления и отдаёт on_rows пачки целых строк (не больше ~batch_rows
+    за раз, плюс один фрагмент из сокета).
+    """
+    def __init__(self, on_rows, batch_rows: int = COPY_BATCH_ROWS):
+        self.on_rows = on_rows
+        self.batch_rows = batch_rows
+        self._buffer = bytearray()
+        self._header = False
+
+    async def __call__(self, data):
+        self._buffer += data
+        if not self._header:
+            if len(self._buffer) < 19 or len(self._buffer) < parse_header(self._buffer):
+                return
+            del self._buffer[:parse_header(self._buffer)]
+            self._header = True
+        if len(self._buffer) >= self.batch_rows * ROW_DTYPE.itemsize:
+            self._emit()
+
+    def _emit(self):
+        # take_rows копирует строки, поэтому буфер можно сдвигать
+        rows, parsed = take_rows(self._buffer)
+        del self._buffer[:parsed]
+        if len(rows):
+            self.on_rows(rows)
+
+    def finish(self):
+        """
+        Отдаёт последнюю пачку. Вызывать после окончания COPY.
+        :raises ValueError: если поток оборвался не на маркере конца
+        """
+        if not self._header:
+            raise ValueError("Неполный вывод COPY")
+        self._emit()
+        # В конце — маркер -1 (int16)
+        if bytes(self._buffer) != b"\xff\xff":
+            raise ValueError("Неполный вывод COPY")
+
+async def copy_rows(conn, table: str, user_id: int, on_rows) -> tuple:
+    """
+    Читает операции пользователя бинарным COPY и отдаёт их пачками в on_rows(currencies, categories, rows).
+    Открывает свою транзакцию — не вызывать внутри conn.transaction().
+    :return: (currencies, categories) — справочники кодов
+    """
+    export.check_table(table)
+    # Справочники и строки — из одного снимка, иначе новая категория между запросами осталась бы без кода
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        currencies, categories = await conn.fetchrow(LABELS_SQL.format(table=table), user_id)
+        currencies, categories = list(currencies), list(categories)
+        reader = CopyReader(lambda rows: on_rows(currencies, categories, rows))
+        await conn.copy_from_query(
+            COLUMNS_SQL.format(table=table), user_id, currencies, categories, output=reader, format="binary",
+        )
+    reader.finish()
+    return currencies, categories
+
+async def fetch_columns(conn, table: str, user_id: int) -> TransactionColumns:
+    """
+    Все операции пользователя из incomes или expenses колонками numpy. Держит в памяти
+    всю таблицу пользователя — для разовых выборок и замеров; для больших историй
+    передайте свой on_rows в copy_rows.
+    Открывает свою транзакцию — не вызывать внутри conn.transaction().
+    """
+    chunks = []
+    currencies, categories = await copy_rows(
+        conn, table, user_id, lambda currencies, categories, rows: chunks.append(columns_from_rows(rows, currencies, categories)),
+    )
+    return TransactionColumns(
+        amount=np.concatenate([c.amount for c in chunks] or [np.empty(0, np.int64)]),
+        created_at=np.concatenate([c.created_at for c in chunks] or [np.empty(0, "datetime64[us]")]),
+        currency=np.concatenate([c.currency for c in chunks] or [np.empty(0, np.int32)]),
+        category=np.concatenate([c.category for c in chunks] or [np.empty(0, np.int32)]),
+        currencies=currencies,
+        categories=categories,
+    )
+
+def columns_from_copy(data, currencies: list, categories: list) -> TransactionColumns:
+    """
+    Колонки из полного вывода COPY для COLUMNS_SQL.
+    """
+    return columns_from_rows(parse_copy(data), currencies, categories)
+
+def columns_from_rows(rows: np.ndarray, currencies: list, categories: list) -> TransactionColumns:
+    """
+    Массивы копируются из строк COPY в нативный порядок байт, после этого rows больше не нужен.
+    """
+    return TransactionColumns(
+        amount=rows["amount"].astype(np.int64),
+        created_at=(rows["created_at"].astype(np.int64) + PG_EPOCH_US).view("datetime64[us]"),
+        currency=rows["currency"].astype(np.int32),
+        category=rows["category"].astype(np.int32),
+        currencies=currencies,
+        categories=categories,
+    )
+
+def group_sums(keys: np.ndarray, amount: np.ndarray) -> tuple:
+    """
+    Точные суммы amount (int64) по значениям keys.
+    :return: (уникальные ключи по возрастанию, суммы)
+    """
+    if not len(keys):
+        return keys[:0], amount[:0]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(amount[order], starts)
+
+class DailyTotals:
+    """
+    Накопитель сумм в копейках по (день, категория, валюта). Пачки складываются
+    по мере поступления; групп — дни × категории × валюты, их немного.
+    """
+    def __init__(self, currencies: list, categories: list):
+        self.currencies = currencies
+        self.categories = categories
+        self.keys = np.empty(0, np.int64)
+        self.sums = np.empty(0, np.int64)
+
+    def add(self, columns: TransactionColumns):
+        # Ключ — (день от 1970-01-01, код категории, код валюты) в одном int64
+        days = columns.created_at.astype("datetime64[D]").astype(np.int64)
+        keys = (days * len(self.categories) + columns.category) * len(self.currencies) + columns.currency
+        self.keys, self.sums = group_sums(np.concatenate([self.keys, keys]), np.concatenate([self.sums, columns.amount]))
+
+    def result(self, summary: dict) -> list:
+        """
+        :return: [(день "YYYY-MM-DD", категория, Decimal)] по дню и категории, в валюте summary
+        """
+        n_currencies = len(self.currencies)
+        n_categories = len(self.categories)
+        rates = summary["rates"]
+        base_rate = rates[summary["base_currency"]]
+        currency_rates = [rates.get(currency) for currency in self.currencies]
+        result = []
+
+        def flush(group, total):
+            day, category = divmod(group, n_categories)
+            result.append((
+                str(np.datetime64(day, "D")), self.categories[category],
+                (total / 100 / base_rate).quantize(CENT, ROUND_HALF_UP),
+            ))
+
+        # Пересчёт по курсам уже в Decimal. Как в SQL, валюты без курса в итоги не попадают,
+        # ROUND округляет половину от нуля
+        current, total = None, None
+        with localcontext() as ctx:
+            ctx.prec = 50
+            for key, minor in zip(self.keys.tolist(), self.sums.tolist()):
+                group, currency = divmod(key, n_currencies)
+                rate = currency_rates[currency]
+                if rate is None:
+                    continue
+                if group != current:
+                    if current is not None:
+                        flush(current, total)
+                    current, total = group, Decimal(0)
+                total += minor * rate
+            if current is not None:
+                flush(current, total)
+        return result
+
+def daily_totals(columns: TransactionColumns, summary: dict) -> list:
+    """
+    Суммы по дням и категориям по уже выбранным колонкам.
+    :param summary: итоги из database.stats.fetch_summary (base_currency и rates)
+    :return: [(день "YYYY-MM-DD", категория, Decimal)] по дню и категории
+    """
+    totals = DailyTotals(columns.currencies, columns.categories)
+    totals.add(columns)
+    return totals.result(summary)
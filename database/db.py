@@ -1,7 +1,10 @@
 import os
+import time
+from collections import OrderedDict
 import asyncpg
 from dotenv import load_dotenv
 from urllib.parse import urlparse
+from utils import metrics
 
 load_dotenv()
 
@@ -22,30 +25,210 @@ else:
     DB_HOST = os.getenv("DB_HOST", "localhost")
     DB_PORT = int(os.getenv("DB_PORT", 5432))
 
-async def get_pool():
-    return await asyncpg.create_pool(
+# Настройки пула соединений
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Часовой пояс сессии (TimeZone), например Asia/Dushanbe. В нём LOCALTIMESTAMP, значения
+# CURRENT_TIMESTAMP в столбцах TIMESTAMP и время напоминаний; по умолчанию — настройка сервера
+DB_TIMEZONE = os.getenv("DB_TIMEZONE")
+SERVER_SETTINGS = {"timezone": DB_TIMEZONE} if DB_TIMEZONE else None
+
+# Настройки кэша telegram_id -> users.id
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 3600))
+
+# Один пул на процесс: создаётся при старте приложения и закрывается при остановке
+_pool = None
+
+class InstrumentedPool:
+    """
+    Обёртка над asyncpg.Pool для /metrics: считает ожидающих соединения и время
+    ожидания. Остальные атрибуты и методы передаются пулу как есть.
+    """
+    def __init__(self, pool: asyncpg.Pool):
+        self._pool = pool
+        self.waiting = 0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def acquire(self, *, timeout: float = None):
+        return _AcquireContext(self, timeout)
+
+    async def _acquire(self, timeout: float = None):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            return await self._pool.acquire(timeout=timeout)
+        finally:
+            self.waiting -= 1
+            metrics.DB_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+
+class _AcquireContext:
+    # Как asyncpg.pool.PoolAcquireContext: `async with pool.acquire()` и `await pool.acquire()`
+    __slots__ = ("pool", "timeout", "conn")
+
+    def __init__(self, pool: InstrumentedPool, timeout: float = None):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = await self.pool._acquire(self.timeout)
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        conn, self.conn = self.conn, None
+        await self.pool._pool.release(conn)
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+async def _init_connection(conn):
+    conn.add_query_logger(metrics.observe_query)
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {"size": 0, "in_use": 0, "idle": 0, "waiting": 0}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {"size": size, "in_use": size - idle, "idle": idle, "waiting": _pool.waiting}
+
+metrics.Gauge(
+    "planbot_db_pool_connections", "Соединения пула: size, in_use, idle и waiting (ждущие свободного соединения)",
+    ("state",), function=lambda: {(state,): value for state, value in pool_stats().items()},
+)
+
+async def create_pool():
+    global _pool
+    if _pool is None:
+        _pool = InstrumentedPool(await asyncpg.create_pool(
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            host=DB_HOST,
+            port=DB_PORT,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            server_settings=SERVER_SETTINGS,
+            init=_init_connection,
+        ))
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+async def connect():
+    # Отдельное соединение вне пула — для воркеров генерации отчётов
+    return await asyncpg.connect(
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
         host=DB_HOST,
-        port=DB_PORT
+        port=DB_PORT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        server_settings=SERVER_SETTINGS,
     )
 
+async def get_pool():
+    # Возвращает общий пул; создаёт его лениво, если приложение ещё не стартовало (скрипты)
+    return await create_pool()
+
 async def init_db_schema():
-    schema_path = os.path.join(os.path.dirname(__file__), "schema.sql")
-    with open(schema_path, "r", encoding="utf-8") as f:
-        schema_sql = f.read()
+    # Схема ведётся миграциями из database/migrations; schema.sql — справочный снимок
+    from database.migrate import run_migrations
+    pool = await get_pool()
+    return await run_migrations(pool)
+
+async def get_setting(key: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(schema_sql)
+        return await conn.fetchval("SELECT value FROM app_settings WHERE key = $1", key)
 
-async def register_user_if_not_exists(telegram_id: int):
+async def set_setting(key: str, value: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
+            """
+            INSERT INTO app_settings (key, value) VALUES ($1, $2)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+            """,
+            key, value
+        )
+
+class UserIdCache:
+    """
+    Ограниченный LRU-кэш с TTL: telegram_id -> внутренний users.id.
+    Попадания и промахи (planbot_user_id_cache_requests_total) нужны для подбора размера кэша.
+    """
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, telegram_id: int):
+        item = self._data.get(telegram_id)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[telegram_id]
+            USER_CACHE_REQUESTS.inc("miss")
+            return None
+        self._data.move_to_end(telegram_id)
+        USER_CACHE_REQUESTS.inc("hit")
+        return item[0]
+
+    def set(self, telegram_id: int, user_id: int):
+        self._data[telegram_id] = (user_id, time.monotonic() + self.ttl)
+        self._data.move_to_end(telegram_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+USER_CACHE_REQUESTS = metrics.Counter(
+    "planbot_user_id_cache_requests_total", "Обращения к кэшу telegram_id -> users.id: hit, miss", ("result",),
+)
+
+user_id_cache = UserIdCache()
+
+metrics.Gauge(
+    "planbot_user_id_cache_size", "Записей в кэше telegram_id -> users.id",
+    function=lambda: len(user_id_cache),
+)
+
+async def get_user_id(telegram_id: int, pool=None) -> int:
+    """
+    Возвращает users.id для telegram_id. При промахе кэша регистрирует
+    пользователя одним UPSERT ... RETURNING id.
+    """
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+    if pool is None:
+        pool = await get_pool()
+    async with pool.acquire() as conn:
+        # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул id и для существующей строки
+        user_id = await conn.fetchval(
             """
             INSERT INTO users (telegram_id) VALUES ($1)
-            ON CONFLICT (telegram_id) DO NOTHING
+            ON CONFLICT (telegram_id) DO UPDATE SET telegram_id = EXCLUDED.telegram_id
+            RETURNING id
             """,
             telegram_id
         )
+    user_id_cache.set(telegram_id, user_id)
+    return user_id
+
+async def register_user_if_not_exists(telegram_id: int, pool=None) -> int:
+    return await get_user_id(telegram_id, pool)
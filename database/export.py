@@ -0,0 +1,50 @@
+import os
+from database import fx
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Имена таблиц подставляются только из этого списка
+TRANSACTION_TABLES = ("incomes", "expenses")
+
+DETAIL_SQL = """
+    SELECT amount, currency, category, created_at
+    FROM {table} WHERE user_id = $1
+    ORDER BY created_at, id
+"""
+
+# Суммы пересчитываются в базовую валюту в том же проходе: $2, $3 — валюты и курсы
+# снимка, $4 — курс базовой валюты. Операции в валютах без курса не попадают в итоги
+DAILY_TOTALS_SQL = """
+    WITH rates AS (SELECT * FROM unnest($2::varchar[], $3::numeric[]) AS r(currency, rate))
+    SELECT to_char(t.created_at, 'YYYY-MM-DD') AS day, t.category, ROUND(SUM(t.amount * r.rate) / $4::numeric, 2) AS total
+    FROM {table} t JOIN rates r ON r.currency = t.currency
+    WHERE t.user_id = $1
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+def check_table(table: str):
+    if table not in TRANSACTION_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+
+async def iter_transaction_chunks(conn, table: str, user_id: int, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Построчная выгрузка операций пользователя через серверный курсор, пачками по chunk_size.
+    В памяти одновременно находится не больше одной пачки. Вызывать внутри conn.transaction().
+    """
+    check_table(table)
+    cursor = await conn.cursor(DETAIL_SQL.format(table=table), user_id)
+    while True:
+        rows = await cursor.fetch(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+async def fetch_daily_totals(conn, table: str, user_id: int, summary: dict) -> list:
+    """
+    Суммы по дням и категориям (листы «Доходы/Расходы по дням») в валюте и по курсам summary.
+    :param summary: итоги из database.stats.fetch_summary (base_currency и rates)
+    """
+    check_table(table)
+    return await conn.fetch(DAILY_TOTALS_SQL.format(table=table), user_id,
+                            *fx.conversion_args(summary["rates"], summary["base_currency"]))
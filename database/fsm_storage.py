@@ -0,0 +1,188 @@
+import os
+import json
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.types import TelegramObject
+from database import db
+
+# Незавершённые диалоги, которые не менялись дольше этого срока, удаляются, дней (0 — не удалять)
+FSM_STATE_TTL_DAYS = float(os.getenv("FSM_STATE_TTL_DAYS", 30))
+
+# Изменения FSM в рамках одного апдейта: ключ -> запись (см. PostgresStorage._load)
+_unit_of_work: ContextVar[Optional[dict]] = ContextVar("fsm_unit_of_work", default=None)
+
+UPSERT_SQL = """
+    INSERT INTO fsm_storage (key, state, data, updated_at)
+    VALUES ($1, $2, $3::jsonb, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET
+        state = CASE WHEN $4 THEN EXCLUDED.state ELSE fsm_storage.state END,
+        data = CASE WHEN $5 THEN EXCLUDED.data ELSE fsm_storage.data END,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# updated_at пишется как CURRENT_TIMESTAMP в колонку без пояса — сравниваем с LOCALTIMESTAMP
+DELETE_STALE_SQL = "DELETE FROM fsm_storage WHERE updated_at < LOCALTIMESTAMP - make_interval(secs => $1)"
+
+async def delete_stale(pool, ttl_days: float = None) -> int:
+    """
+    Удаляет брошенные диалоги: строки fsm_storage, которые не менялись дольше ttl_days.
+    Без этого строки без state.clear() копились бы вечно.
+    :param ttl_days: срок в днях, по умолчанию FSM_STATE_TTL_DAYS; 0 — ничего не удалять
+    :return: число удалённых строк
+    """
+    ttl_days = FSM_STATE_TTL_DAYS if ttl_days is None else ttl_days
+    if ttl_days <= 0:
+        return 0
+    async with pool.acquire() as conn:
+        status = await conn.execute(DELETE_STALE_SQL, ttl_days * 86400)
+    return int(status.split()[-1])
+
+def _json_default(value):
+    # В данных FSM лежат, например, дата из календаря напоминаний
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Тип {type(value).__name__} нельзя сохранить в FSM")
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return date.fromisoformat(obj["__date__"])
+        if "__decimal__" in obj:
+            return Decimal(obj["__decimal__"])
+    return obj
+
+def dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+def loads(raw: str) -> dict:
+    return json.loads(raw, object_hook=_json_object_hook)
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблице fsm_storage (state + data в JSONB).
+
+    Внутри апдейта (см. FSMWriteCoalescingMiddleware) запись читается из базы
+    не больше одного раза, а все изменения копятся и сбрасываются одним UPSERT
+    в конце обработки. Вне апдейта изменения пишутся сразу.
+    """
+    def __init__(self, key_builder=None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _load(self, key: StorageKey) -> dict:
+        unit = _unit_of_work.get()
+        if unit is not None and key in unit:
+            return unit[key]
+        pool = await db.get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT state, data FROM fsm_storage WHERE key = $1", self.key_builder.build(key)
+            )
+        record = {
+            "state": row["state"] if row else None,
+            "data": loads(row["data"]) if row else {},
+            "state_dirty": False,
+            "data_dirty": False,
+        }
+        if unit is not None:
+            unit[key] = record
+        return record
+
+    async def _change(self, key: StorageKey, **changes):
+        unit = _unit_of_work.get()
+        if unit is None:
+            record = {"state": None, "data": {}, "state_dirty": False, "data_dirty": False}
+        elif key in unit:
+            record = unit[key]
+        else:
+            # Запись ещё не читалась — чтение не нужно, пишем только изменённые поля
+            record = unit[key] = {"state": None, "data": {}, "state_dirty": False, "data_dirty": False, "partial": True}
+        for field, value in changes.items():
+            record[field] = value
+            record[f"{field}_dirty"] = True
+        if unit is None:
+            await self._write(key, record)
+
+    async def _write(self, key: StorageKey, record: dict):
+        pool = await db.get_pool()
+        storage_key = self.key_builder.build(key)
+        async with pool.acquire() as conn:
+            # Пустое состояние без данных — строку просто удаляем (state.clear())
+            if record["state_dirty"] and record["data_dirty"] and record["state"] is None and not record["data"]:
+                await conn.execute("DELETE FROM fsm_storage WHERE key = $1", storage_key)
+                return
+            await conn.execute(
+                UPSERT_SQL, storage_key, record["state"], dumps(record["data"]),
+                record["state_dirty"], record["data_dirty"],
+            )
+        record["state_dirty"] = record["data_dirty"] = False
+
+    async def flush(self, unit: dict):
+        for key, record in unit.items():
+            if record["state_dirty"] or record["data_dirty"]:
+                await self._write(key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._change(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._loaded(key)
+        return record["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._change(key, data=data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._loaded(key)
+        return record["data"].copy()
+
+    async def _loaded(self, key: StorageKey) -> dict:
+        unit = _unit_of_work.get()
+        record = unit.get(key) if unit is not None else None
+        if record is not None and record.get("partial"):
+            # Были только записи — дочитываем из базы то, что не меняли
+            del unit[key]
+            stored = await self._load(key)
+            for field in ("state", "data"):
+                if record[f"{field}_dirty"]:
+                    stored[field] = record[field]
+                    stored[f"{field}_dirty"] = True
+            return stored
+        return await self._load(key)
+
+    async def close(self) -> None:
+        pass
+
+class FSMWriteCoalescingMiddleware(BaseMiddleware):
+    """
+    Открывает «единицу работы» на время обработки апдейта: все set_state/update_data
+    хендлеров сводятся к одной записи в fsm_storage на ключ. Если хендлер упал,
+    изменения состояния отбрасываются, а исключение уходит дальше.
+    """
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        unit = {}
+        token = _unit_of_work.set(unit)
+        try:
+            result = await handler(event, data)
+        finally:
+            _unit_of_work.reset(token)
+        await self.storage.flush(unit)
+        return result
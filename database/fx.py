@@ -0,0 +1,143 @@
+import os
+import csv
+import asyncio
+import hashlib
+import logging
+from decimal import Decimal, InvalidOperation
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Курсы хранятся в fx_rates относительно опорной валюты: rate — сколько TJS стоит
+# 1 единица валюты. Загружаются из локального CSV (currency,rate), сеть не нужна
+FX_RATES_FILE = os.getenv("FX_RATES_FILE")
+# Как часто процесс перечитывает fx_rates в снимок, сек
+FX_REFRESH_INTERVAL = float(os.getenv("FX_REFRESH_INTERVAL", 600))
+
+PIVOT_CURRENCY = "TJS"
+SUPPORTED_CURRENCIES = ("TJS", "USD", "EUR", "RUB")
+
+class RateSnapshot:
+    """
+    Неизменяемый снимок курсов. version меняется при любом изменении курсов
+    и входит в водяной знак кэша отчётов.
+    """
+    def __init__(self, rates: dict):
+        self.rates = dict(rates)
+        self.rates.setdefault(PIVOT_CURRENCY, Decimal(1))
+        digest = "\n".join(f"{currency}={rate.normalize()}" for currency, rate in sorted(self.rates.items()))
+        self.version = hashlib.sha1(digest.encode()).hexdigest()[:12]
+
+    def has(self, currency: str) -> bool:
+        return currency in self.rates
+
+_snapshot = None
+_refresh_task = None
+
+def get_snapshot():
+    """
+    :return: текущий снимок или None, если в этом процессе курсы ещё не загружались
+    """
+    return _snapshot
+
+def conversion_args(rates: dict, base_currency: str) -> tuple:
+    """
+    Параметры для пересчёта в SQL: массивы валют и курсов для unnest() и курс базовой валюты.
+    """
+    currencies = sorted(rates)
+    return currencies, [rates[c] for c in currencies], rates[base_currency]
+
+async def load_snapshot(conn) -> RateSnapshot:
+    rows = await conn.fetch("SELECT currency, rate FROM fx_rates")
+    return RateSnapshot({row["currency"]: row["rate"] for row in rows})
+
+async def refresh(pool) -> RateSnapshot:
+    global _snapshot
+    async with pool.acquire() as conn:
+        snapshot = await load_snapshot(conn)
+    if _snapshot is None or snapshot.version != _snapshot.version:
+        logger.info("Курсы валют обновлены, версия %s: %s", snapshot.version,
+                    ", ".join(f"{c}={r}" for c, r in sorted(snapshot.rates.items())))
+    _snapshot = snapshot
+    return snapshot
+
+async def _refresh_loop(pool):
+    while True:
+        await asyncio.sleep(FX_REFRESH_INTERVAL)
+        try:
+            await refresh(pool)
+        except Exception:
+            # Остаёмся на прежнем снимке до следующей попытки
+            logger.exception("Не удалось обновить курсы валют")
+
+def start_refresh(pool):
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop(pool))
+
+async def stop_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        task, _refresh_task = _refresh_task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def read_rates_file(path: str) -> dict:
+    """
+    Читает CSV с колонками currency,rate; строки с # в начале пропускаются.
+    :raises ValueError: если курс не положительное число
+    """
+    rates = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        lines = (line for line in f if line.strip() and not line.lstrip().startswith("#"))
+        for row in csv.DictReader(lines):
+            currency = row["currency"].strip().upper()
+            try:
+                rate = Decimal(row["rate"].strip())
+            except InvalidOperation:
+                raise ValueError(f"Некорректный курс {currency}: {row['rate']!r}")
+            if rate <= 0:
+                raise ValueError(f"Курс {currency} должен быть положительным")
+            rates[currency] = rate
+    return rates
+
+async def load_file(pool, path: str) -> int:
+    """
+    Записывает курсы из файла в fx_rates (UPSERT одним запросом).
+    :return: число загруженных курсов
+    """
+    rates = read_rates_file(path)
+    currencies = list(rates)
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO fx_rates (currency, rate)
+            SELECT * FROM unnest($1::varchar[], $2::numeric[])
+            ON CONFLICT (currency) DO UPDATE SET rate = EXCLUDED.rate, updated_at = CURRENT_TIMESTAMP
+            """,
+            currencies, [rates[c] for c in currencies]
+        )
+    return len(rates)
+
+metrics.Gauge(
+    "planbot_fx_rate", "Курс валюты в опорной валюте (TJS) из текущего снимка", ("currency",),
+    function=lambda: None if _snapshot is None else {(c,): float(r) for c, r in _snapshot.rates.items()},
+)
+
+async def _main(path: str):
+    from database import db
+    pool = await db.get_pool()
+    try:
+        print(f"Загружено курсов: {await load_file(pool, path)}")
+    finally:
+        await db.close_pool()
+
+if __name__ == "__main__":
+    # python -m database.fx load database/fx_rates.csv
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] != "load":
+        sys.exit("Использование: python -m database.fx load <файл.csv>")
+    asyncio.run(_main(sys.argv[2]))
@@ -0,0 +1,71 @@
+import os
+from datetime import datetime, timedelta
+from database.export import TRANSACTION_TABLES
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 10))
+
+# Keyset-пагинация по (created_at, id): курсор — последняя показанная строка, OFFSET не
+# используется, поэтому любая страница — спуск по индексу (user_id, created_at, id) и
+# чтение page_size + 1 строк, сколько бы операций ни было у пользователя
+FIRST_PAGE_SQL = """
+    SELECT id, amount, currency, category, created_at
+    FROM {table} WHERE user_id = $1
+    ORDER BY created_at DESC, id DESC
+    LIMIT $2
+"""
+
+OLDER_PAGE_SQL = """
+    SELECT id, amount, currency, category, created_at
+    FROM {table} WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+    ORDER BY created_at DESC, id DESC
+    LIMIT $4
+"""
+
+NEWER_PAGE_SQL = """
+    SELECT id, amount, currency, category, created_at
+    FROM {table} WHERE user_id = $1 AND (created_at, id) > ($2, $3)
+    ORDER BY created_at, id
+    LIMIT $4
+"""
+
+_EPOCH = datetime(1970, 1, 1)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Курсор для callback_data (до 64 байт): микросекунды от эпохи и id строки.
+    """
+    return f"{(created_at - _EPOCH) // timedelta(microseconds=1)}:{row_id}"
+
+def decode_cursor(cursor: str) -> tuple:
+    micros, row_id = cursor.split(":")
+    return _EPOCH + timedelta(microseconds=int(micros)), int(row_id)
+
+async def fetch_page(conn, table: str, user_id: int, cursor: str = None, direction: str = "older",
+                     page_size: int = HISTORY_PAGE_SIZE) -> dict:
+    """
+    Страница операций пользователя, новые сверху.
+    :param cursor: encode_cursor() крайней строки предыдущей страницы; None — самая новая страница
+    :param direction: "older" — строки старше курсора, "newer" — новее
+    :return: dict с rows (новые сверху), older и newer — курсоры соседних страниц или None
+    """
+    if table not in TRANSACTION_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if cursor is None:
+        rows = await conn.fetch(FIRST_PAGE_SQL.format(table=table), user_id, page_size + 1)
+        has_older, has_newer = len(rows) > page_size, False
+        rows = rows[:page_size]
+    elif direction == "older":
+        rows = await conn.fetch(OLDER_PAGE_SQL.format(table=table), user_id, *decode_cursor(cursor), page_size + 1)
+        has_older, has_newer = len(rows) > page_size, True
+        rows = rows[:page_size]
+    else:
+        rows = await conn.fetch(NEWER_PAGE_SQL.format(table=table), user_id, *decode_cursor(cursor), page_size + 1)
+        has_older, has_newer = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+    if not rows:
+        return {"rows": [], "older": None, "newer": None}
+    return {
+        "rows": rows,
+        "older": encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_older else None,
+        "newer": encode_cursor(rows[0]["created_at"], rows[0]["id"]) if has_newer else None,
+    }
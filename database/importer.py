@@ -0,0 +1,108 @@
+from database import partitions
+
+# Ключ pg_advisory_xact_lock(ключ, users.id): импорты одного пользователя идут по очереди,
+# иначе два одинаковых файла, загруженные одновременно, не увидели бы строк друг друга
+IMPORT_LOCK_KEY = 7_345_003
+
+STAGING_COLUMNS = ["line", "kind", "amount", "currency", "category", "created_at"]
+
+# Временная таблица живёт до конца транзакции импорта; в WAL не пишется
+STAGING_SQL = """
+    CREATE TEMP TABLE import_staging (
+        line INTEGER NOT NULL,
+        kind VARCHAR(10) NOT NULL,
+        amount NUMERIC(12,2) NOT NULL,
+        currency VARCHAR(10) NOT NULL,
+        category VARCHAR(50) NOT NULL,
+        created_at TIMESTAMP NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# Слияние с дедупликацией как мультимножеств: строка файла вставляется, только если
+# одинаковых (время, сумма, валюта, категория) в файле больше, чем уже есть в таблице.
+# Повторная загрузка того же файла ничего не добавляет, а две одинаковые покупки
+# в одном файле не схлопываются. Существующие строки читаются диапазоном дат файла
+MERGE_SQL = """
+    WITH staged AS (
+        SELECT amount, currency, category, created_at,
+               row_number() OVER (PARTITION BY created_at, amount, currency, category ORDER BY line) AS n
+        FROM import_staging WHERE kind = $2
+    ),
+    existing AS (
+        SELECT created_at, amount, currency, category, COUNT(*) AS c
+        FROM {table}
+        WHERE user_id = $1
+          AND created_at >= (SELECT MIN(created_at) FROM staged)
+          AND created_at <= (SELECT MAX(created_at) FROM staged)
+        GROUP BY 1, 2, 3, 4
+    )
+    INSERT INTO {table} (user_id, amount, currency, category, created_at)
+    SELECT $1, s.amount, s.currency, s.category, s.created_at
+    FROM staged s LEFT JOIN existing e
+      ON e.created_at = s.created_at AND e.amount = s.amount
+     AND e.currency = s.currency AND e.category = s.category
+    WHERE s.n > COALESCE(e.c, 0)
+    ORDER BY s.created_at
+"""
+
+async def begin_import(conn, user_id: int):
+    """
+    Готовит staging-таблицу. Вызывать внутри conn.transaction().
+    """
+    await conn.execute("SELECT pg_advisory_xact_lock($1, $2)", IMPORT_LOCK_KEY, user_id)
+    await conn.execute(STAGING_SQL)
+
+async def load_chunk(conn, records: list):
+    """
+    Пачка строк (line, kind, amount, currency, category, created_at) в staging по протоколу COPY.
+    """
+    await conn.copy_records_to_table("import_staging", records=records, columns=STAGING_COLUMNS)
+
+# Месяцы, за которые в файле есть операции, по таблицам
+STAGED_MONTHS_SQL = """
+    SELECT DISTINCT kind, date_trunc('month', created_at)::date AS month
+    FROM import_staging
+    ORDER BY 1, 2
+"""
+
+async def staged_months(conn) -> list:
+    """
+    :return: [(таблица, месяц)] операций из staging
+    """
+    kinds = {kind: table for table, kind in partitions.PARTITIONED_TABLES.items()}
+    return [(kinds[row["kind"]], row["month"]) for row in await conn.fetch(STAGED_MONTHS_SQL)]
+
+async def create_month_partitions(conn, months: list) -> int:
+    """
+    Создаёт секции incomes/expenses за месяцы файла, иначе история легла бы
+    в {table}_default и секцию за эти месяцы потом уже нельзя было бы создать.
+    Открывает свою короткую транзакцию, как partitions.ensure_partitions, — вызывать
+    на отдельном соединении, не в транзакции импорта.
+    :param months: [(таблица, месяц)] из staged_months
+    :return: число созданных секций
+    """
+    if not months:
+        return 0
+    created = 0
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", partitions.PARTITIONS_LOCK_KEY)
+        partitioned = {}
+        for table, month in months:
+            if table not in partitioned:
+                partitioned[table] = await partitions.is_partitioned(conn, table)
+            if partitioned[table]:
+                created += await partitions.create_partition(conn, table, month)
+    return created
+
+async def merge(conn, user_id: int) -> dict:
+    """
+    Переносит строки из staging в incomes/expenses без дубликатов. Секции за месяцы
+    файла должны быть созданы заранее (create_month_partitions).
+    :return: {"income": вставлено, "expense": вставлено}
+    """
+    await conn.execute("ANALYZE import_staging")
+    inserted = {}
+    for kind, table in (("income", "incomes"), ("expense", "expenses")):
+        status = await conn.execute(MERGE_SQL.format(table=table), user_id, kind)
+        inserted[kind] = int(status.split()[-1])
+    return inserted
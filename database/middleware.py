@@ -0,0 +1,17 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from database import db
+
+class DbPoolMiddleware(BaseMiddleware):
+    """
+    Передаёт общий пул соединений в хендлеры как аргумент `pool`.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["pool"] = await db.get_pool()
+        return await handler(event, data)
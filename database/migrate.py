@@ -0,0 +1,82 @@
+import os
+import re
+import logging
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+# Ключ pg_advisory_lock, чтобы несколько экземпляров бота не применяли миграции одновременно
+MIGRATIONS_LOCK_KEY = 7_345_001
+
+logger = logging.getLogger(__name__)
+
+def load_migrations():
+    """
+    Читает файлы вида 0001_name.sql из database/migrations.
+    :return: список (version, name, sql), отсортированный по версии
+    """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_(.+)\.sql$", filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), "r", encoding="utf-8") as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    migrations.sort(key=lambda m: m[0])
+    return migrations
+
+async def current_version(conn) -> int:
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return 0
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+async def run_migrations(pool) -> int:
+    """
+    Применяет недостающие миграции. Если база уже актуальна — никакого DDL не выполняется.
+    :return: количество применённых миграций
+    """
+    migrations = load_migrations()
+    latest = migrations[-1][0] if migrations else 0
+    async with pool.acquire() as conn:
+        # Быстрая проверка без блокировки: обычный рестарт не должен трогать схему
+        if await current_version(conn) >= latest:
+            return 0
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_KEY)
+        try:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            # Другой экземпляр мог успеть применить миграции, пока мы ждали блокировку
+            version = await current_version(conn)
+            applied = 0
+            for number, name, sql in migrations:
+                if number <= version:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                        number, name
+                    )
+                logger.info("Применена миграция %04d_%s", number, name)
+                applied += 1
+            return applied
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+
+if __name__ == "__main__":
+    # Ручной запуск: python -m database.migrate
+    import asyncio
+    from database import db
+
+    async def main():
+        applied = await db.init_db_schema()
+        print(f"Применено миграций: {applied}")
+        await db.close_pool()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
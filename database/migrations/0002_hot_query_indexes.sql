@@ -0,0 +1,7 @@
+-- Индексы под выборки по пользователю за период (Статистика, отчёты)
+CREATE INDEX IF NOT EXISTS incomes_user_created_idx ON incomes (user_id, created_at);
+CREATE INDEX IF NOT EXISTS expenses_user_created_idx ON expenses (user_id, created_at);
+
+-- Отметка об отправке напоминания и частичный индекс по ещё не отправленным
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS sent_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS reminders_pending_remind_at_idx ON reminders (remind_at) WHERE sent_at IS NULL;
@@ -0,0 +1,59 @@
+-- Помесячные итоги по пользователю: Статистика и «Сводка по месяцам» читают их
+-- вместо полного прохода по incomes/expenses
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    sum NUMERIC(14,2) NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, kind, currency, category)
+);
+
+-- Триггер поддерживает итоги в той же транзакции, что и вставка/изменение/удаление строки.
+-- TG_ARGV[0] — вид операции: 'income' или 'expense'
+CREATE OR REPLACE FUNCTION monthly_totals_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.user_id IS NOT NULL THEN
+        UPDATE monthly_totals
+        SET sum = sum - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id
+          AND month = date_trunc('month', OLD.created_at)::date
+          AND kind = TG_ARGV[0]
+          AND currency = OLD.currency
+          AND category = COALESCE(OLD.category, '');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        INSERT INTO monthly_totals (user_id, month, kind, currency, category, sum, count)
+        VALUES (NEW.user_id, date_trunc('month', NEW.created_at)::date, TG_ARGV[0],
+                NEW.currency, COALESCE(NEW.category, ''), NEW.amount, 1)
+        ON CONFLICT (user_id, month, kind, currency, category)
+        DO UPDATE SET sum = monthly_totals.sum + EXCLUDED.sum,
+                      count = monthly_totals.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS incomes_monthly_totals ON incomes;
+CREATE TRIGGER incomes_monthly_totals
+    AFTER INSERT OR UPDATE OR DELETE ON incomes
+    FOR EACH ROW EXECUTE FUNCTION monthly_totals_apply('income');
+
+DROP TRIGGER IF EXISTS expenses_monthly_totals ON expenses;
+CREATE TRIGGER expenses_monthly_totals
+    AFTER INSERT OR UPDATE OR DELETE ON expenses
+    FOR EACH ROW EXECUTE FUNCTION monthly_totals_apply('expense');
+
+-- Первичное заполнение. CREATE TRIGGER держит блокировку, не пускающую вставки
+-- до конца транзакции, поэтому строки не будут посчитаны дважды или пропущены
+DELETE FROM monthly_totals;
+INSERT INTO monthly_totals (user_id, month, kind, currency, category, sum, count)
+SELECT user_id, date_trunc('month', created_at)::date, 'income', currency, COALESCE(category, ''), SUM(amount), COUNT(*)
+FROM incomes WHERE user_id IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5
+UNION ALL
+SELECT user_id, date_trunc('month', created_at)::date, 'expense', currency, COALESCE(category, ''), SUM(amount), COUNT(*)
+FROM expenses WHERE user_id IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5;
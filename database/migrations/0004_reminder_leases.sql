@@ -0,0 +1,6 @@
+-- Аренда напоминания экземпляром бота на время отправки (FOR UPDATE SKIP LOCKED + leased_until)
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS leased_until TIMESTAMP;
+
+-- Напоминания, созданные до появления рассылки, давно просрочены — не отправляем их задним числом
+UPDATE reminders SET sent_at = remind_at
+WHERE sent_at IS NULL AND remind_at < LOCALTIMESTAMP - INTERVAL '1 day';
@@ -0,0 +1,7 @@
+-- Состояния и данные FSM aiogram: переживают рестарт и общие для всех реплик бота
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
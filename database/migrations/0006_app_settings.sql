@@ -0,0 +1,6 @@
+-- Служебные настройки бота (например, отпечаток зарегистрированного вебхука)
+CREATE TABLE IF NOT EXISTS app_settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
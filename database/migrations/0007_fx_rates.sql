@@ -0,0 +1,12 @@
+-- Курсы валют: rate — сколько TJS (опорная валюта) стоит 1 единица валюты.
+-- Заполняются из файла (FX_RATES_FILE, python -m database.fx load <файл>)
+CREATE TABLE IF NOT EXISTS fx_rates (
+    currency VARCHAR(10) PRIMARY KEY,
+    rate NUMERIC(18,8) NOT NULL CHECK (rate > 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO fx_rates (currency, rate) VALUES ('TJS', 1) ON CONFLICT (currency) DO NOTHING;
+
+-- Валюта, в которую пользователю пересчитываются итоги
+ALTER TABLE users ADD COLUMN IF NOT EXISTS base_currency VARCHAR(10) NOT NULL DEFAULT 'TJS';
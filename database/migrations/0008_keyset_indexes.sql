@@ -0,0 +1,7 @@
+-- Индексы под постраничную историю операций: курсор (created_at, id) целиком в индексе,
+-- поэтому страница — один короткий спуск по индексу при любом объёме истории.
+-- Заменяют (user_id, created_at): запросы за период используют их так же
+CREATE INDEX IF NOT EXISTS incomes_user_created_id_idx ON incomes (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS expenses_user_created_id_idx ON expenses (user_id, created_at, id);
+DROP INDEX IF EXISTS incomes_user_created_idx;
+DROP INDEX IF EXISTS expenses_user_created_idx;
@@ -0,0 +1,35 @@
+-- Повторяющиеся напоминания: хранится только ближайшее срабатывание. После отправки
+-- remind_at переносится на следующее тем же UPDATE, что отмечает отправку.
+-- repeat_anchor — первое срабатывание: от него считаются ежемесячные повторы, чтобы
+-- напоминание на 31-е после февраля (28-е) вернулось на 31-е, а не осталось на 28-м
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS repeat_anchor TIMESTAMP;
+
+-- Ближайшее срабатывание строго позже fired_at (пропущенные повторы не догоняются).
+-- remind_at — местное время без часового пояса, поэтому «каждый день в 09:00» остаётся
+-- в 09:00 при переходе на летнее/зимнее время. NULL — повторов нет
+CREATE OR REPLACE FUNCTION reminder_next_occurrence(
+    remind_at TIMESTAMP, anchor TIMESTAMP, repeat_type VARCHAR, fired_at TIMESTAMP
+) RETURNS TIMESTAMP AS $$
+DECLARE
+    since TIMESTAMP := GREATEST(fired_at, remind_at);
+    step_days INTEGER;
+    months INTEGER;
+BEGIN
+    IF repeat_type IN ('daily', 'weekly') THEN
+        step_days := CASE repeat_type WHEN 'daily' THEN 1 ELSE 7 END;
+        RETURN remind_at + make_interval(days => step_days * (
+            floor(extract(epoch FROM since - remind_at) / (step_days * 86400))::int + 1
+        ));
+    ELSIF repeat_type = 'monthly' THEN
+        anchor := COALESCE(anchor, remind_at);
+        months := (extract(year FROM since)::int - extract(year FROM anchor)::int) * 12
+                + extract(month FROM since)::int - extract(month FROM anchor)::int;
+        -- timestamp + interval 'N months' прижимает день к концу короткого месяца
+        IF anchor + make_interval(months => months) <= since THEN
+            months := months + 1;
+        END IF;
+        RETURN anchor + make_interval(months => months);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
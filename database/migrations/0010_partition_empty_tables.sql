@@ -0,0 +1,47 @@
+-- Новая база: пустые incomes и expenses пересоздаются секционированными по месяцам created_at
+-- (database/partitions.py). Миграции применяются под pg_advisory_lock, поэтому несколько
+-- экземпляров бота не переводят таблицы одновременно. Помесячные секции создаёт
+-- partitions.ensure_partitions при старте, до этого строки попадают в {table}_default.
+-- Таблицы с данными не трогаются: их переводит онлайн python -m database.partitions convert
+DO $$
+DECLARE
+    t TEXT;
+    has_rows BOOLEAN;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incomes', 'expenses'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(t)) THEN
+            CONTINUE;
+        END IF;
+        -- Блокировка до проверки: между проверкой и DROP никто не успеет вставить строку
+        EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', t);
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I)', t) INTO has_rows;
+        IF has_rows THEN
+            RAISE NOTICE '% содержит строки: переведите её командой python -m database.partitions convert', t;
+            CONTINUE;
+        END IF;
+
+        -- Последовательность id (SERIAL) переживает пересоздание таблицы
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY NONE', t || '_id_seq');
+        EXECUTE format('DROP TABLE %I', t);
+        EXECUTE format(
+            'CREATE TABLE %1$I (
+                id INTEGER NOT NULL DEFAULT nextval(%2$L),
+                user_id INTEGER REFERENCES users(id),
+                amount NUMERIC(12,2) NOT NULL,
+                currency VARCHAR(10) NOT NULL,
+                category VARCHAR(50),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)',
+            t, t || '_id_seq'
+        );
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY %I.id', t || '_id_seq', t);
+        EXECUTE format('CREATE INDEX %I ON %I (user_id, created_at, id)', t || '_user_created_id_idx', t);
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', t || '_default', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I
+                FOR EACH ROW EXECUTE FUNCTION monthly_totals_apply(%L)',
+            t || '_monthly_totals', t, CASE t WHEN 'incomes' THEN 'income' ELSE 'expense' END
+        );
+    END LOOP;
+END $$;
@@ -0,0 +1,429 @@
+"""
+Помесячное секционирование incomes и expenses по created_at (PARTITION BY RANGE).
+
+    python -m database.partitions status
+    python -m database.partitions convert [--batch 10000]   # разовый онлайн-перевод
+    python -m database.partitions ensure [--ahead 3]        # создать будущие секции
+    python -m database.partitions detach --before 2023-01 [--drop]
+    python -m database.partitions explain [--month 2026-10] # проверка отсечения секций
+    python -m database.partitions cleanup                   # удалить *_unpartitioned после convert
+
+Будущие секции создаются при старте бота и затем по таймеру (PARTITION_CHECK_INTERVAL);
+тем же таймером удаляются брошенные диалоги FSM (fsm_storage.delete_stale).
+Новая база с пустыми таблицами переводится на секции миграцией 0010_partition_empty_tables;
+существующую переводит `convert`: строки копируются пачками, пока бот работает, изменения
+на время копирования зеркалируются триггером, а переименование делается в одной короткой транзакции.
+"""
+import os
+import re
+import json
+import asyncio
+import logging
+from datetime import date, datetime, time
+
+logger = logging.getLogger(__name__)
+
+# На сколько месяцев вперёд держать готовые секции
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+# Как часто проверять наличие будущих секций, сек
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", 86400))
+# Отсоединённые секции по умолчанию переносятся в эту схему
+PARTITION_ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "archive")
+
+PARTITIONED_TABLES = {"incomes": "income", "expenses": "expense"}
+COLUMNS = "id, user_id, amount, currency, category, created_at"
+# Ключ pg_advisory_xact_lock: секции создаёт один процесс за раз
+PARTITIONS_LOCK_KEY = 7_345_002
+# Ключ pg_advisory_lock на всё время convert: второй запуск не начнёт перевод параллельно
+CONVERT_LOCK_KEY = 7_345_004
+
+_maintenance_task = None
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+def partition_bounds(month: date) -> tuple:
+    """
+    :return: (начало, конец) секции месяца: created_at >= начало AND created_at < конец
+    """
+    return datetime.combine(month, time.min), datetime.combine(add_months(month, 1), time.min)
+
+def create_partition_sql(parent: str, table: str, month: date) -> str:
+    return (
+        f"CREATE TABLE {partition_name(table, month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+async def is_partitioned(conn, table: str) -> bool:
+    return await conn.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass($1))", table
+    )
+
+async def list_partitions(conn, table: str) -> list:
+    """
+    :return: [(имя секции, граница вида «FOR VALUES FROM (...) TO (...)» или «DEFAULT»)] по порядку
+    """
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        ORDER BY c.relname
+        """,
+        table
+    )
+    return [(row["relname"], row["bound"]) for row in rows]
+
+async def create_partition(conn, table: str, month: date) -> bool:
+    """
+    Создаёт секцию месяца, если её нет.
+    :return: True, если секция создана
+    """
+    name = partition_name(table, month)
+    if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+        return False
+    # Строки месяца уже попали в секцию DEFAULT (например, дата из будущего): PostgreSQL
+    # не даст создать пересекающуюся секцию, их нужно перенести вручную
+    if await conn.fetchval(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE created_at >= $1 AND created_at < $2)",
+        *partition_bounds(month)
+    ):
+        logger.error("Секция %s не создана: в %s_default есть строки этого месяца", name, table)
+        return False
+    await conn.execute(create_partition_sql(table, table, month))
+    logger.info("Создана секция %s", name)
+    return True
+
+async def ensure_partitions(pool, months_ahead: int = PARTITION_MONTHS_AHEAD, today: date = None) -> int:
+    """
+    Создаёт секции с текущего месяца на months_ahead месяцев вперёд. Таблицы, ещё не
+    переведённые на секции (база с данными до convert), пропускаются.
+    :return: число созданных секций
+    """
+    this_month = (today or date.today()).replace(day=1)
+    months = [add_months(this_month, i) for i in range(months_ahead + 1)]
+    created = 0
+    for table in PARTITIONED_TABLES:
+        async with pool.acquire() as conn:
+            if not await is_partitioned(conn, table):
+                logger.warning("%s не секционирована: python -m database.partitions convert", table)
+                continue
+            existing = {name for name, _ in await list_partitions(conn, table)}
+            missing = [month for month in months if partition_name(table, month) not in existing]
+            if not missing:
+                continue
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", PARTITIONS_LOCK_KEY)
+                for month in missing:
+                    created += await create_partition(conn, table, month)
+    return created
+
+async def _maintenance_loop(pool):
+    while True:
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+        try:
+            await ensure_partitions(pool)
+        except Exception:
+            logger.exception("Не удалось создать будущие секции")
+        # Тем же таймером чистятся брошенные диалоги FSM
+        try:
+            from database import fsm_storage
+            deleted = await fsm_storage.delete_stale(pool)
+            if deleted:
+                logger.info("Удалено устаревших состояний FSM: %d", deleted)
+        except Exception:
+            logger.exception("Не удалось удалить устаревшие состояния FSM")
+
+def start_maintenance(pool):
+    global _maintenance_task
+    if _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_maintenance_loop(pool))
+
+async def stop_maintenance():
+    global _maintenance_task
+    if _maintenance_task is not None:
+        task, _maintenance_task = _maintenance_task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+# === Разовый перевод существующей таблицы ===
+
+CREATE_PARTITIONED_SQL = """
+    CREATE TABLE {new} (
+        id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+        user_id INTEGER REFERENCES users(id),
+        amount NUMERIC(12,2) NOT NULL,
+        currency VARCHAR(10) NOT NULL,
+        category VARCHAR(50),
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT {new}_pkey PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    CREATE INDEX {new}_user_created_id_idx ON {new} (user_id, created_at, id);
+    CREATE TABLE {table}_default PARTITION OF {new} DEFAULT;
+"""
+
+# Пока идёт копирование, изменения старой таблицы повторяются в новой
+SYNC_TRIGGER_SQL = """
+    CREATE OR REPLACE FUNCTION {table}_partition_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {new} WHERE id = OLD.id AND created_at = OLD.created_at;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {new} ({columns}) VALUES (NEW.id, NEW.user_id, NEW.amount, NEW.currency, NEW.category, NEW.created_at)
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS {table}_partition_sync ON {table};
+    CREATE TRIGGER {table}_partition_sync
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_partition_sync();
+"""
+
+COPY_BATCH_SQL = """
+    INSERT INTO {new} ({columns})
+    SELECT {columns} FROM {table} WHERE id > $1 AND id <= $2
+    ON CONFLICT DO NOTHING
+"""
+
+# Переименование: monthly_totals продолжает вести тот же триггер, уже на новой таблице.
+# Старая таблица остаётся как {table}_unpartitioned для отката, удаляется командой cleanup
+SWAP_SQL = """
+    DROP TRIGGER {table}_partition_sync ON {table};
+    DROP FUNCTION {table}_partition_sync();
+    DROP TRIGGER IF EXISTS {table}_monthly_totals ON {table};
+    ALTER SEQUENCE {table}_id_seq OWNED BY {new}.id;
+    ALTER TABLE {table} RENAME TO {old};
+    ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey;
+    ALTER INDEX IF EXISTS {table}_user_created_id_idx RENAME TO {old}_user_created_id_idx;
+    ALTER TABLE {new} RENAME TO {table};
+    ALTER TABLE {table} RENAME CONSTRAINT {new}_pkey TO {table}_pkey;
+    ALTER INDEX {new}_user_created_id_idx RENAME TO {table}_user_created_id_idx;
+    CREATE TRIGGER {table}_monthly_totals
+        AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION monthly_totals_apply('{kind}');
+"""
+
+COMPARE_SQL = """
+    SELECT (SELECT COUNT(*) FROM {table} WHERE id > $1) AS old_rows,
+           (SELECT COUNT(*) FROM {new} WHERE id > $1) AS new_rows,
+           (SELECT COALESCE(SUM(amount), 0) FROM {table} WHERE id > $1) AS old_sum,
+           (SELECT COALESCE(SUM(amount), 0) FROM {new} WHERE id > $1) AS new_sum
+"""
+
+async def convert_table(pool, table: str, batch_size: int = 10000, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Переводит таблицу на помесячные секции, не останавливая запись:
+    1) создаёт секционированную {table}_partitioned и триггер, зеркалирующий изменения;
+    2) копирует строки пачками по id, каждая пачка — своя короткая транзакция;
+    3) сверяет число строк и сумму, затем под ACCESS EXCLUSIVE перепроверяет хвост,
+       записанный после сверки, и меняет таблицы местами.
+    Весь перевод идёт под CONVERT_LOCK_KEY: параллельный запуск сразу завершается ошибкой.
+    :raises RuntimeError: если перевод уже идёт или данные в старой и новой таблице не совпали
+    """
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    async with pool.acquire() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", CONVERT_LOCK_KEY):
+            raise RuntimeError("Перевод на секции уже выполняется другим процессом")
+        try:
+            await _convert_table(conn, table, batch_size, months_ahead)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", CONVERT_LOCK_KEY)
+
+async def _convert_table(conn, table: str, batch_size: int, months_ahead: int):
+    names = {"table": table, "new": f"{table}_partitioned", "old": f"{table}_unpartitioned",
+             "kind": PARTITIONED_TABLES[table], "columns": COLUMNS}
+    if await is_partitioned(conn, table):
+        logger.info("%s уже секционирована", table)
+        return
+    if await conn.fetchval("SELECT to_regclass($1) IS NULL", names["new"]):
+        first = await conn.fetchval(f"SELECT date_trunc('month', MIN(created_at))::date FROM {table}")
+        this_month = date.today().replace(day=1)
+        async with conn.transaction():
+            await conn.execute(CREATE_PARTITIONED_SQL.format(**names))
+            month = min(first or this_month, this_month)
+            while month <= add_months(this_month, months_ahead):
+                await conn.execute(create_partition_sql(names["new"], table, month))
+                month = add_months(month, 1)
+    # Триггер до копирования: всё, что запишется после снимка max(id), попадёт через него
+    async with conn.transaction():
+        await conn.execute(SYNC_TRIGGER_SQL.format(**names))
+        max_id = await conn.fetchval(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+
+    copy_sql = COPY_BATCH_SQL.format(**names)
+    last_id = 0
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        await conn.execute(copy_sql, last_id, upper)
+        last_id = upper
+        logger.info("%s: скопировано до id %d из %d", table, last_id, max_id)
+
+    compare_sql = COMPARE_SQL.format(**names)
+    check = await conn.fetchrow(compare_sql, 0)
+    if check["old_rows"] != check["new_rows"] or check["old_sum"] != check["new_sum"]:
+        raise RuntimeError(f"{table}: данные не совпали после копирования: {dict(check)}")
+    verified_id = await conn.fetchval(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        tail = await conn.fetchrow(compare_sql, verified_id)
+        if tail["old_rows"] != tail["new_rows"] or tail["old_sum"] != tail["new_sum"]:
+            raise RuntimeError(f"{table}: расхождение в строках после сверки: {dict(tail)}")
+        await conn.execute(SWAP_SQL.format(**names))
+    logger.info("%s переведена на помесячные секции, прежняя таблица — %s", table, names["old"])
+
+async def drop_unpartitioned(pool) -> list:
+    """
+    Удаляет прежние таблицы {table}_unpartitioned, оставленные convert для отката.
+    Таблица удаляется, только если основная уже секционирована.
+    :return: имена удалённых таблиц
+    """
+    dropped = []
+    async with pool.acquire() as conn:
+        for table in PARTITIONED_TABLES:
+            old = f"{table}_unpartitioned"
+            if not await is_partitioned(conn, table) or await conn.fetchval("SELECT to_regclass($1) IS NULL", old):
+                continue
+            await conn.execute(f"DROP TABLE {old}")
+            logger.info("Удалена прежняя таблица %s", old)
+            dropped.append(old)
+    return dropped
+
+# === Отсоединение старых секций ===
+
+async def detach_before(pool, before: date, drop: bool = False, schema: str = PARTITION_ARCHIVE_SCHEMA) -> list:
+    """
+    Отсоединяет помесячные секции целиком раньше before и переносит их в схему schema
+    (или удаляет при drop). monthly_totals не меняется: итоги за эти месяцы остаются
+    в «Статистике», из отчётов по дням и истории операции пропадают.
+    :return: имена отсоединённых секций
+    """
+    detached = []
+    async with pool.acquire() as conn:
+        if not drop:
+            await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for table in PARTITIONED_TABLES:
+            if not await is_partitioned(conn, table):
+                continue
+            for name, _ in await list_partitions(conn, table):
+                match = re.fullmatch(rf"{table}_y(\d{{4}})m(\d{{2}})", name)
+                if match is None:
+                    continue
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if add_months(month, 1) > before:
+                    continue
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                if drop:
+                    await conn.execute(f"DROP TABLE {name}")
+                else:
+                    await conn.execute(f"ALTER TABLE {name} SET SCHEMA {schema}")
+                logger.info("Секция %s %s", name, "удалена" if drop else f"перенесена в схему {schema}")
+                detached.append(name)
+    return detached
+
+# === Проверка отсечения секций ===
+
+def _scanned_relations(plan: dict) -> set:
+    relations = set()
+    if "Relation Name" in plan:
+        relations.add(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        relations |= _scanned_relations(child)
+    return relations
+
+async def explain_relations(conn, sql: str, *args) -> set:
+    """
+    Таблицы и секции, которые остаются в плане после отсечения (EXPLAIN выполняет и
+    отсечение при старте исполнителя, отброшенные секции в план не попадают).
+    """
+    plan = await conn.fetchval("EXPLAIN (FORMAT JSON) " + sql, *args)
+    return _scanned_relations(json.loads(plan)[0]["Plan"])
+
+async def check_pruning(pool, month: date) -> bool:
+    """
+    Запросы за период (database.stats.PERIOD_TOTALS_SQL) должны читать только секции
+    этого месяца. Печатает план по каждой таблице.
+    :return: True, если лишние секции не читаются
+    """
+    from database import fx
+    from database import stats
+    start, end = month, add_months(month, 1)
+    ok = True
+    async with pool.acquire() as conn:
+        partitions = {table: {name for name, _ in await list_partitions(conn, table)} for table in PARTITIONED_TABLES}
+        if not all(partitions.values()):
+            print("Таблицы не секционированы: python -m database.partitions convert")
+            return False
+        snapshot = await fx.load_snapshot(conn)
+        scanned = await explain_relations(
+            conn, stats.PERIOD_TOTALS_SQL, 0, datetime.combine(start, time.min), datetime.combine(end, time.min),
+            *fx.conversion_args(snapshot.rates, fx.PIVOT_CURRENCY),
+        )
+    for table, names in partitions.items():
+        read = sorted(scanned & names)
+        expected = {partition_name(table, month)}
+        status = "OK" if set(read) <= expected else "ЛИШНИЕ СЕКЦИИ"
+        ok = ok and set(read) <= expected
+        print(f"{table}: {month:%Y-%m} читает {', '.join(read) or '—'} из {len(names)} секций — {status}")
+    return ok
+
+async def _main(args):
+    from database import db
+    pool = await db.get_pool()
+    try:
+        if args.command == "status":
+            async with pool.acquire() as conn:
+                for table in PARTITIONED_TABLES:
+                    if await is_partitioned(conn, table):
+                        names = [name for name, _ in await list_partitions(conn, table)]
+                        print(f"{table}: {len(names)} секций, {names[0]} … {names[-1]}")
+                    else:
+                        print(f"{table}: не секционирована")
+        elif args.command == "convert":
+            for table in PARTITIONED_TABLES:
+                await convert_table(pool, table, batch_size=args.batch, months_ahead=args.ahead)
+        elif args.command == "cleanup":
+            dropped = await drop_unpartitioned(pool)
+            print(f"Удалено таблиц: {', '.join(dropped) or '—'}")
+        elif args.command == "ensure":
+            print(f"Создано секций: {await ensure_partitions(pool, args.ahead)}")
+        elif args.command == "detach":
+            year, month = map(int, args.before.split("-"))
+            detached = await detach_before(pool, date(year, month, 1), drop=args.drop)
+            print(f"Отсоединено секций: {len(detached)}")
+        elif args.command == "explain":
+            if args.month:
+                year, month = map(int, args.month.split("-"))
+                month = date(year, month, 1)
+            else:
+                month = date.today().replace(day=1)
+            return 0 if await check_pruning(pool, month) else 1
+        return 0
+    finally:
+        await db.close_pool()
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("status", "convert", "ensure", "detach", "explain", "cleanup"))
+    parser.add_argument("--batch", type=int, default=10000, help="строк в пачке при convert")
+    parser.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="месяцев вперёд")
+    parser.add_argument("--before", help="detach: секции целиком раньше месяца ГГГГ-ММ")
+    parser.add_argument("--drop", action="store_true", help="detach: удалить, а не переносить в архивную схему")
+    parser.add_argument("--month", help="explain: месяц ГГГГ-ММ (по умолчанию текущий)")
+    args = parser.parse_args()
+    if args.command == "detach" and not args.before:
+        parser.error("detach требует --before ГГГГ-ММ")
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args)))
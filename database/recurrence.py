@@ -0,0 +1,81 @@
+"""
+Повторы напоминаний. Следующее срабатывание считает функция базы reminder_next_occurrence
+(migrations/0009_reminder_recurrence.sql) — сразу для всей отправленной пачки в
+ReminderDispatcher.mark_sent. remind_at — время без часового пояса, поэтому переходы
+на летнее время его не сдвигают. Граничные случаи (конец месяца, 29 февраля,
+пропущенные повторы) проверяются на живой базе:
+
+    python -m database.recurrence check
+"""
+import asyncio
+from datetime import datetime
+
+# repeat_type -> подпись для пользователя
+REPEAT_TYPES = {"daily": "каждый день", "weekly": "каждую неделю", "monthly": "каждый месяц"}
+
+NEXT_OCCURRENCE_SQL = "SELECT reminder_next_occurrence($1::timestamp, $2::timestamp, $3::varchar, $4::timestamp)"
+
+def _ts(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+# (описание, remind_at, repeat_anchor, repeat_type, момент отправки, ожидаемое следующее срабатывание)
+EDGE_CASES = [
+    ("ежедневно: следующий день в то же время",
+     "2026-03-28 09:00", None, "daily", "2026-03-28 09:00:02", "2026-03-29 09:00"),
+    ("ежедневно: через границу месяца",
+     "2026-03-31 02:30", None, "daily", "2026-03-31 02:30:01", "2026-04-01 02:30"),
+    ("еженедельно: через границу года",
+     "2026-12-28 02:30", None, "weekly", "2026-12-28 02:30:01", "2027-01-04 02:30"),
+    ("ежедневно после простоя: пропущенные дни не догоняются",
+     "2026-10-20 09:00", None, "daily", "2026-10-23 12:00", "2026-10-24 09:00"),
+    ("еженедельно после простоя",
+     "2026-10-01 18:00", None, "weekly", "2026-10-20 10:00", "2026-10-22 18:00"),
+    ("ежемесячно 31-го: февраль короче",
+     "2026-01-31 09:00", "2026-01-31 09:00", "monthly", "2026-01-31 09:00:01", "2026-02-28 09:00"),
+    ("ежемесячно 31-го: после февраля снова 31-е",
+     "2026-02-28 09:00", "2026-01-31 09:00", "monthly", "2026-02-28 09:00:01", "2026-03-31 09:00"),
+    ("ежемесячно 31-го: апрель — 30-е",
+     "2026-03-31 09:00", "2026-01-31 09:00", "monthly", "2026-03-31 09:00:01", "2026-04-30 09:00"),
+    ("ежемесячно 30-го: февраль високосного года",
+     "2028-01-30 09:00", "2028-01-30 09:00", "monthly", "2028-01-30 09:00:01", "2028-02-29 09:00"),
+    ("ежемесячно с 29 февраля",
+     "2024-02-29 09:00", "2024-02-29 09:00", "monthly", "2024-02-29 09:00:01", "2024-03-29 09:00"),
+    ("ежемесячно после простоя в несколько месяцев",
+     "2026-01-31 09:00", "2026-01-31 09:00", "monthly", "2026-05-10 12:00", "2026-05-31 09:00"),
+    ("ежемесячно без repeat_anchor (созданные до миграции)",
+     "2026-01-15 09:00", None, "monthly", "2026-01-15 09:00:01", "2026-02-15 09:00"),
+    ("неизвестный тип повтора — повторов нет",
+     "2026-01-15 09:00", None, "yearly", "2026-01-15 09:00:01", None),
+]
+
+async def check(conn) -> bool:
+    """
+    Сверяет reminder_next_occurrence с EDGE_CASES и печатает результат.
+    :return: True, если все случаи совпали
+    """
+    ok = True
+    for title, remind_at, anchor, repeat_type, fired_at, expected in EDGE_CASES:
+        result = await conn.fetchval(
+            NEXT_OCCURRENCE_SQL, _ts(remind_at), anchor and _ts(anchor), repeat_type, _ts(fired_at)
+        )
+        expected = expected and _ts(expected)
+        passed = result == expected
+        ok = ok and passed
+        print(f"{'OK  ' if passed else 'FAIL'} {title}: {result}" + ("" if passed else f", ожидалось {expected}"))
+    return ok
+
+async def _main() -> int:
+    from database import db
+    pool = await db.get_pool()
+    try:
+        await db.init_db_schema()
+        async with pool.acquire() as conn:
+            return 0 if await check(conn) else 1
+    finally:
+        await db.close_pool()
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["check"]:
+        sys.exit("Использование: python -m database.recurrence check")
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,49 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Пересчёт monthly_totals из исходных таблиц; $1 = NULL — для всех пользователей
+REBUILD_SQL = """
+    INSERT INTO monthly_totals (user_id, month, kind, currency, category, sum, count)
+    SELECT user_id, date_trunc('month', created_at)::date, 'income', currency, COALESCE(category, ''), SUM(amount), COUNT(*)
+    FROM incomes WHERE user_id IS NOT NULL AND ($1::int IS NULL OR user_id = $1)
+    GROUP BY 1, 2, 3, 4, 5
+    UNION ALL
+    SELECT user_id, date_trunc('month', created_at)::date, 'expense', currency, COALESCE(category, ''), SUM(amount), COUNT(*)
+    FROM expenses WHERE user_id IS NOT NULL AND ($1::int IS NULL OR user_id = $1)
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+async def rebuild_monthly_totals(pool, user_id: int = None) -> int:
+    """
+    Полностью пересчитывает помесячные итоги (всех пользователей или одного).
+    На время пересчёта запись в incomes/expenses блокируется, чтобы триггер
+    и пересчёт не посчитали одну строку дважды.
+    :return: количество строк в пересчитанных итогах
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("LOCK TABLE incomes, expenses IN SHARE MODE")
+            await conn.execute(
+                "DELETE FROM monthly_totals WHERE $1::int IS NULL OR user_id = $1", user_id
+            )
+            status = await conn.execute(REBUILD_SQL, user_id)
+    rows = int(status.split()[-1])
+    logger.info("monthly_totals пересчитаны: %d строк", rows)
+    return rows
+
+if __name__ == "__main__":
+    # Ручной запуск: python -m database.rollup [users.id]
+    import sys
+    import asyncio
+    from database import db
+
+    async def main():
+        user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        await db.init_db_schema()
+        rows = await rebuild_monthly_totals(await db.get_pool(), user_id)
+        print(f"Пересчитано строк: {rows}")
+        await db.close_pool()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
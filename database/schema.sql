@@ -1,26 +1,37 @@
+-- Справочный снимок актуальной схемы. Изменения вносятся новыми файлами
+-- в database/migrations (применяются при старте бота), затем отражаются здесь.
+
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     telegram_id BIGINT UNIQUE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    base_currency VARCHAR(10) NOT NULL DEFAULT 'TJS'
 );
 
+-- incomes и expenses секционированы по месяцам created_at (database/partitions.py):
+-- секции {table}_yГГГГmММ создаются заранее, {table}_default ловит остальное.
+-- Новая база переводится миграцией 0010_partition_empty_tables, существующая — python -m database.partitions convert
+CREATE SEQUENCE IF NOT EXISTS incomes_id_seq;
 CREATE TABLE IF NOT EXISTS incomes (
-    id SERIAL PRIMARY KEY,
+    id INTEGER NOT NULL DEFAULT nextval('incomes_id_seq'),
     user_id INTEGER REFERENCES users(id),
     amount NUMERIC(12,2) NOT NULL,
     currency VARCHAR(10) NOT NULL,
     category VARCHAR(50),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
+CREATE SEQUENCE IF NOT EXISTS expenses_id_seq;
 CREATE TABLE IF NOT EXISTS expenses (
-    id SERIAL PRIMARY KEY,
+    id INTEGER NOT NULL DEFAULT nextval('expenses_id_seq'),
     user_id INTEGER REFERENCES users(id),
     amount NUMERIC(12,2) NOT NULL,
     currency VARCHAR(10) NOT NULL,
     category VARCHAR(50),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
 CREATE TABLE IF NOT EXISTS reminders (
     id SERIAL PRIMARY KEY,
@@ -29,5 +40,53 @@ CREATE TABLE IF NOT EXISTS reminders (
     remind_at TIMESTAMP NOT NULL,
     is_repeated BOOLEAN DEFAULT FALSE,
     repeat_type VARCHAR(20),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP,
+    leased_until TIMESTAMP,
+    repeat_anchor TIMESTAMP
+);
+-- Повторы (repeat_type: daily, weekly, monthly) — функция reminder_next_occurrence,
+-- см. migrations/0009_reminder_recurrence.sql
+
+CREATE INDEX IF NOT EXISTS incomes_user_created_id_idx ON incomes (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS expenses_user_created_id_idx ON expenses (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS reminders_pending_remind_at_idx ON reminders (remind_at) WHERE sent_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    sum NUMERIC(14,2) NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, kind, currency, category)
+);
+-- Поддерживается триггерами incomes_monthly_totals / expenses_monthly_totals
+-- (функция monthly_totals_apply, см. migrations/0003_monthly_totals.sql)
+
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- rate — сколько TJS стоит 1 единица валюты
+CREATE TABLE IF NOT EXISTS fx_rates (
+    currency VARCHAR(10) PRIMARY KEY,
+    rate NUMERIC(18,8) NOT NULL CHECK (rate > 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS app_settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
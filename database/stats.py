@@ -0,0 +1,214 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from database import fx
+
+CENT = Decimal("0.01")
+
+# Помесячные суммы читаются из monthly_totals (поддерживается триггером), поэтому
+# стоимость запроса зависит от числа месяцев, а не транзакций. В том же проходе суммы
+# пересчитываются в базовую валюту по курсам снимка ($2, $3 — валюты и курсы, $4 — курс
+# базовой валюты); converted = NULL, если курса валюты нет. NUMERIC без потери точности
+MONTHLY_TOTALS_SQL = """
+    WITH rates AS (SELECT * FROM unnest($2::varchar[], $3::numeric[]) AS r(currency, rate))
+    SELECT t.kind, t.month, t.currency, SUM(t.sum) AS total, SUM(t.sum) * r.rate / $4::numeric AS converted
+    FROM monthly_totals t LEFT JOIN rates r ON r.currency = t.currency
+    WHERE t.user_id = $1
+    GROUP BY t.kind, t.month, t.currency, r.rate
+    ORDER BY t.month
+"""
+
+async def fetch_base_currency(conn, user_id: int) -> str:
+    return await conn.fetchval("SELECT base_currency FROM users WHERE id = $1", user_id) or fx.PIVOT_CURRENCY
+
+async def fetch_summary(conn, user_id: int, snapshot: fx.RateSnapshot = None, base_currency: str = None) -> dict:
+    """
+    Баланс и помесячные итоги пользователя в его базовой валюте, без загрузки отдельных транзакций.
+    :param conn: соединение asyncpg
+    :param user_id: внутренний users.id
+    :param snapshot: снимок курсов; по умолчанию текущий снимок процесса или fx_rates из базы
+    :param base_currency: валюта итогов; по умолчанию users.base_currency
+    :return: dict с balance (Decimal), income_by_month и expense_by_month ({"YYYY-MM": Decimal})
+        в base_currency, by_currency ({валюта: {"income", "expense"}} без пересчёта),
+        missing_rates (валюты без курса, в итоги не вошли), rates и rates_version снимка
+    """
+    if snapshot is None:
+        snapshot = fx.get_snapshot() or await fx.load_snapshot(conn)
+    if base_currency is None:
+        base_currency = await fetch_base_currency(conn, user_id)
+    if not snapshot.has(base_currency):
+        base_currency = fx.PIVOT_CURRENCY
+    rows = await conn.fetch(MONTHLY_TOTALS_SQL, user_id, *fx.conversion_args(snapshot.rates, base_currency))
+    income_by_month = {}
+    expense_by_month = {}
+    by_currency = {}
+    missing_rates = set()
+    for row in rows:
+        totals = by_currency.setdefault(row["currency"], {"income": Decimal(0), "expense": Decimal(0)})
+        totals[row["kind"]] += row["total"]
+        if row["converted"] is None:
+            missing_rates.add(row["currency"])
+            continue
+        target = income_by_month if row["kind"] == "income" else expense_by_month
+        month = row["month"].strftime("%Y-%m")
+        target[month] = target.get(month, Decimal(0)) + row["converted"]
+    for target in (income_by_month, expense_by_month):
+        for month, total in target.items():
+            target[month] = total.quantize(CENT)
+    balance = sum(income_by_month.values(), Decimal(0)) - sum(expense_by_month.values(), Decimal(0))
+    return {
+        "balance": balance,
+        "income_by_month": income_by_month,
+        "expense_by_month": expense_by_month,
+        "base_currency": base_currency,
+        "by_currency": by_currency,
+        "missing_rates": sorted(missing_rates),
+        "rates": snapshot.rates,
+        "rates_version": snapshot.version,
+    }
+
+def format_summary(summary: dict) -> str:
+    """
+    Текст отчёта для кнопки «Статистика».
+    """
+    currency = summary["base_currency"]
+    report_lines = [f"Ваш текущий баланс: <b>{summary['balance']:.2f} {currency}</b>", "\n<b>Доходы по месяцам:</b>"]
+    for m, v in summary["income_by_month"].items():
+        report_lines.append(f"{m}: {v:.2f}")
+    report_lines.append("\n<b>Расходы по месяцам:</b>")
+    for m, v in summary["expense_by_month"].items():
+        report_lines.append(f"{m}: {v:.2f}")
+    # Суммы в исходных валютах показываем, только если валют несколько
+    if len(summary["by_currency"]) > 1 or summary["missing_rates"]:
+        report_lines.append("\n<b>По валютам:</b>")
+        for cur, totals in sorted(summary["by_currency"].items()):
+            report_lines.append(f"{cur}: доходы {totals['income']:.2f}, расходы {totals['expense']:.2f}")
+    if summary["missing_rates"]:
+        report_lines.append(f"\nНет курса для {', '.join(summary['missing_rates'])} — эти суммы не вошли в баланс.")
+    report_lines.append(f"\nВалюта отчёта: {currency}. Сменить: /currency")
+    return "\n".join(report_lines)
+
+# Итоги за период: диапазон по (user_id, created_at) в incomes и expenses, то есть читаются
+# только строки периода. Пересчёт в базовую валюту — как в MONTHLY_TOTALS_SQL ($4..$6)
+PERIOD_TOTALS_SQL = """
+    WITH rates AS (SELECT * FROM unnest($4::varchar[], $5::numeric[]) AS r(currency, rate))
+    SELECT t.kind, t.currency, t.category, SUM(t.amount) AS total, SUM(t.amount) * r.rate / $6::numeric AS converted
+    FROM (
+        SELECT 'income' AS kind, amount, currency, COALESCE(category, '') AS category
+        FROM incomes WHERE user_id = $1 AND created_at >= $2 AND created_at < $3
+        UNION ALL
+        SELECT 'expense', amount, currency, COALESCE(category, '')
+        FROM expenses WHERE user_id = $1 AND created_at >= $2 AND created_at < $3
+    ) t LEFT JOIN rates r ON r.currency = t.currency
+    GROUP BY t.kind, t.currency, t.category, r.rate
+"""
+
+PERIOD_TITLES = {"month": "Этот месяц", "prev": "Прошлый месяц", "year": "Этот год"}
+
+def period_bounds(period: str, today: date) -> tuple:
+    """
+    :param period: "month", "prev" или "year"
+    :return: (начало, конец) — полуинтервал дат [начало, конец)
+    """
+    month_start = today.replace(day=1)
+    if period == "month":
+        return month_start, (month_start + timedelta(days=32)).replace(day=1)
+    if period == "prev":
+        return (month_start - timedelta(days=1)).replace(day=1), month_start
+    if period == "year":
+        return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+    raise ValueError(f"Неизвестный период: {period}")
+
+def parse_period(text: str) -> tuple:
+    """
+    Свой период из текста «ДД.ММ.ГГГГ-ДД.ММ.ГГГГ» (обе даты включительно).
+    :return: (начало, конец) — полуинтервал [начало, конец)
+    :raises ValueError: если формат неверный или начало позже конца
+    """
+    first, last = (datetime.strptime(part.strip(), "%d.%m.%Y").date() for part in text.split("-"))
+    if first > last:
+        raise ValueError("Начало периода позже конца")
+    return first, last + timedelta(days=1)
+
+async def fetch_period_summary(conn, user_id: int, start: date, end: date,
+                               snapshot: fx.RateSnapshot = None, base_currency: str = None) -> dict:
+    """
+    Итоги за [start, end) в базовой валюте: суммы и разбивка по категориям.
+    :return: dict с income и expense (Decimal), by_category ({"income"/"expense": {категория: Decimal}},
+        по убыванию суммы), by_currency, missing_rates, base_currency, start и end
+    """
+    if snapshot is None:
+        snapshot = fx.get_snapshot() or await fx.load_snapshot(conn)
+    if base_currency is None:
+        base_currency = await fetch_base_currency(conn, user_id)
+    if not snapshot.has(base_currency):
+        base_currency = fx.PIVOT_CURRENCY
+    # created_at — TIMESTAMP, границы передаются как полночь
+    rows = await conn.fetch(PERIOD_TOTALS_SQL, user_id, datetime.combine(start, time.min), datetime.combine(end, time.min),
+                            *fx.conversion_args(snapshot.rates, base_currency))
+    by_category = {"income": {}, "expense": {}}
+    by_currency = {}
+    missing_rates = set()
+    for row in rows:
+        totals = by_currency.setdefault(row["currency"], {"income": Decimal(0), "expense": Decimal(0)})
+        totals[row["kind"]] += row["total"]
+        if row["converted"] is None:
+            missing_rates.add(row["currency"])
+            continue
+        categories = by_category[row["kind"]]
+        category = row["category"] or "Без категории"
+        categories[category] = categories.get(category, Decimal(0)) + row["converted"]
+    for kind, categories in by_category.items():
+        by_category[kind] = {
+            category: total.quantize(CENT)
+            for category, total in sorted(categories.items(), key=lambda item: item[1], reverse=True)
+        }
+    return {
+        "income": sum(by_category["income"].values(), Decimal(0)),
+        "expense": sum(by_category["expense"].values(), Decimal(0)),
+        "by_category": by_category,
+        "by_currency": by_currency,
+        "missing_rates": sorted(missing_rates),
+        "base_currency": base_currency,
+        "start": start,
+        "end": end,
+    }
+
+def format_period_summary(summary: dict, title: str) -> str:
+    currency = summary["base_currency"]
+    last_day = summary["end"] - timedelta(days=1)
+    report_lines = [
+        f"<b>{title}</b> ({summary['start']:%d.%m.%Y} — {last_day:%d.%m.%Y})",
+        f"Доходы: {summary['income']:.2f} {currency}",
+        f"Расходы: {summary['expense']:.2f} {currency}",
+        f"Баланс: <b>{summary['income'] - summary['expense']:.2f} {currency}</b>",
+    ]
+    for kind, heading in (("income", "Доходы по категориям"), ("expense", "Расходы по категориям")):
+        if summary["by_category"][kind]:
+            report_lines.append(f"\n<b>{heading}:</b>")
+            for category, total in summary["by_category"][kind].items():
+                report_lines.append(f"{category}: {total:.2f}")
+    if not summary["by_currency"]:
+        report_lines.append("\nЗа этот период операций нет.")
+    if summary["missing_rates"]:
+        report_lines.append(f"\nНет курса для {', '.join(summary['missing_rates'])} — эти суммы не вошли в итоги.")
+    return "\n".join(report_lines)
+
+# Водяной знак данных пользователя для кэша отчётов: последние created_at берутся
+# одним шагом по индексам (user_id, created_at), число строк — из monthly_totals
+# (ловит удаления)
+WATERMARK_SQL = """
+    SELECT
+        (SELECT MAX(created_at) FROM incomes WHERE user_id = $1) AS last_income,
+        (SELECT MAX(created_at) FROM expenses WHERE user_id = $1) AS last_expense,
+        (SELECT COALESCE(SUM(count), 0) FROM monthly_totals WHERE user_id = $1) AS rows
+"""
+
+async def fetch_watermark(conn, user_id: int, summary: dict = None) -> tuple:
+    """
+    :param summary: итоги, по которым строится отчёт; их валюта и версия курсов входят
+        в водяной знак, чтобы смена валюты или обновление курсов сбрасывали кэш
+    """
+    row = await conn.fetchrow(WATERMARK_SQL, user_id)
+    if summary is None:
+        return tuple(row)
+    return (*row, summary["base_currency"], summary["rates_version"])
@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import logging
+from database import db
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пакетная запись доходов/расходов/напоминаний (включается явно)
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "0") == "1"
+WRITE_BATCH_MAX_ROWS = int(os.getenv("WRITE_BATCH_MAX_ROWS", 500))
+WRITE_BATCH_INTERVAL_MS = float(os.getenv("WRITE_BATCH_INTERVAL_MS", 20))
+
+# Таблицы, в которые разрешено писать через конвейер
+PIPELINE_TABLES = ("incomes", "expenses", "reminders")
+
+WRITE_BATCHES = metrics.Counter(
+    "planbot_write_pipeline_batches_total", "Пакеты, записанные конвейером (WRITE_BATCHING=1)",
+)
+WRITE_ROWS = metrics.Counter(
+    "planbot_write_pipeline_rows_total", "Строки, прошедшие через конвейер записи",
+)
+WRITE_FALLBACKS = metrics.Counter(
+    "planbot_write_pipeline_fallbacks_total", "Пакеты, откатившиеся целиком и записанные построчно",
+)
+WRITE_FLUSH_SECONDS = metrics.Histogram(
+    "planbot_write_pipeline_flush_seconds", "Время записи одного пакета",
+)
+WRITE_BATCH_SIZE = metrics.Histogram(
+    "planbot_write_pipeline_batch_rows", "Строк в одном пакете",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+class WritePipeline:
+    """
+    Write-behind очередь вставок. Строки копятся и раз в interval_ms (или по
+    достижении max_rows) записываются одной транзакцией через COPY. Вызывающий
+    получает результат только после коммита своей строки, поэтому ответ
+    «добавлен!» остаётся честным.
+    """
+    def __init__(self, pool, max_rows: int = WRITE_BATCH_MAX_ROWS, interval_ms: float = WRITE_BATCH_INTERVAL_MS):
+        self.pool = pool
+        self.max_rows = max_rows
+        self.interval = interval_ms / 1000
+        self._queue = []
+        self._has_rows = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._stopped = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Таймер не отменяется посреди записи: пакет уже снят с очереди, и отмена откатила бы
+        # строки, которых ждут обработчики. Будим цикл, ждём текущий пакет и дописываем остальное
+        self._stopping = True
+        if self._task is not None:
+            self._has_rows.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        while self._queue:
+            # flush всегда снимает пакет с очереди, поэтому ошибка одного пакета не мешает дописать остальные
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка пакетной записи при остановке")
+        self._stopped = True
+
+    async def insert(self, table: str, columns: tuple, values: tuple):
+        """
+        Ставит строку в очередь и ждёт её коммита.
+        :raises: исключение базы, если именно эта строка не записалась
+        """
+        if table not in PIPELINE_TABLES:
+            raise ValueError(f"Неизвестная таблица: {table}")
+        if self._stopped:
+            raise RuntimeError("Конвейер записи остановлен")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((table, columns, values, future))
+        self._has_rows.set()
+        if len(self._queue) >= self.max_rows:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while not self._stopping:
+            await self._has_rows.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                # Остаток дописывает stop()
+                break
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка пакетной записи")
+
+    async def flush(self):
+        batch, self._queue = self._queue[:self.max_rows], self._queue[self.max_rows:]
+        if not self._queue:
+            self._has_rows.clear()
+        if len(self._queue) < self.max_rows:
+            self._full.clear()
+        if not batch:
+            return
+        started = time.perf_counter()
+        groups = {}
+        for item in batch:
+            groups.setdefault((item[0], item[1]), []).append(item)
+        try:
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        for (table, columns), items in groups.items():
+                            await conn.copy_records_to_table(
+                                table, records=[item[2] for item in items], columns=list(columns)
+                            )
+            except Exception:
+                # Пакет откатился целиком — пишем строки по одной, чтобы ошибка досталась только виновнику
+                WRITE_FALLBACKS.inc()
+                await self._insert_one_by_one(batch)
+            else:
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_result(None)
+        except BaseException as e:
+            # Не удалось и по одной (пул закрыт, таймаут) или flush отменён: строки уже сняты
+            # с очереди, поэтому ошибку получают все, кто ещё ждёт, иначе обработчики зависнут
+            fail_batch(batch, e)
+            raise
+        finally:
+            WRITE_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            WRITE_BATCH_SIZE.observe(len(batch))
+            WRITE_BATCHES.inc()
+            WRITE_ROWS.inc(amount=len(batch))
+
+    async def _insert_one_by_one(self, batch: list):
+        async with self.pool.acquire() as conn:
+            for table, columns, values, future in batch:
+                try:
+                    await conn.execute(insert_sql(table, columns), *values)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+def fail_batch(batch: list, error: BaseException):
+    for *_, future in batch:
+        if future.done():
+            continue
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+def insert_sql(table: str, columns: tuple) -> str:
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+_pipeline = None
+
+async def start_pipeline():
+    global _pipeline
+    if WRITE_BATCHING and _pipeline is None:
+        _pipeline = WritePipeline(await db.get_pool())
+        _pipeline.start()
+    return _pipeline
+
+async def stop_pipeline():
+    global _pipeline
+    if _pipeline is not None:
+        pipeline, _pipeline = _pipeline, None
+        await pipeline.stop()
+
+def get_pipeline():
+    return _pipeline
+
+metrics.Gauge(
+    "planbot_write_pipeline_pending", "Строки в очереди конвейера записи, ещё не отправленные в базу",
+    function=lambda: None if _pipeline is None else _pipeline.pending,
+)
+
+async def insert_row(pool, table: str, columns: tuple, values: tuple):
+    """
+    Вставка строки: через конвейер, если он включён (WRITE_BATCHING=1), иначе сразу.
+    """
+    if table not in PIPELINE_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if _pipeline is not None:
+        return await _pipeline.insert(table, columns, values)
+    async with pool.acquire() as conn:
+        await conn.execute(insert_sql(table, columns), *values)
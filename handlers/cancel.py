@@ -8,4 +8,4 @@ router = Router()
 @router.message(Command("cancel"))
 async def cancel_handler(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Действие отменено. Главное меню:", reply_markup=main_menu_kb())
+    return message.answer("Действие отменено. Главное меню:", reply_markup=main_menu_kb())
@@ -0,0 +1,33 @@
+from aiogram import Router, types, F
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery
+from utils.keyboards import BASE_CURRENCY_KB
+from database import db
+from database import fx
+import asyncpg
+
+router = Router()
+
+@router.message(Command("currency"))
+async def choose_currency(message: types.Message, pool: asyncpg.Pool):
+    user_id = await db.get_user_id(message.from_user.id, pool)
+    async with pool.acquire() as conn:
+        current = await conn.fetchval("SELECT base_currency FROM users WHERE id = $1", user_id)
+    return message.answer(f"Валюта статистики и отчётов: <b>{current}</b>. Выберите новую:",
+                          reply_markup=BASE_CURRENCY_KB)
+
+@router.callback_query(F.data.startswith("base_currency:"))
+async def set_currency(callback: CallbackQuery, pool: asyncpg.Pool):
+    currency = callback.data.split(":", 1)[1]
+    snapshot = fx.get_snapshot()
+    # Без курса пересчитать итоги нельзя — такую валюту не сохраняем
+    if currency not in fx.SUPPORTED_CURRENCIES or snapshot is None or not snapshot.has(currency):
+        return callback.answer(f"Курс {currency} пока не загружен", show_alert=True)
+    user_id = await db.get_user_id(callback.from_user.id, pool)
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE users SET base_currency = $2 WHERE id = $1", user_id, currency)
+    # Отчёты в прежней валюте больше не понадобятся (их водяной знак и так не совпадёт)
+    from utils.report_cache import report_cache
+    report_cache.invalidate(user_id)
+    await callback.answer()
+    return callback.message.answer(f"Теперь итоги считаются в {currency}.")
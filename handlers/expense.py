@@ -2,8 +2,12 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from utils.keyboards import main_menu_kb
+from utils.keyboards import main_menu_kb, EXPENSE_CATEGORIES_KB
+from utils.report_cache import report_cache
 from database import db
+from database import write_pipeline
+import asyncpg
+from decimal import Decimal
 
 router = Router()
 
@@ -14,61 +18,53 @@ class ExpenseStates(StatesGroup):
 
 @router.message(Command("expense"))
 @router.message(F.text == "Добавить расход")
-async def start_expense(message: types.Message, state: FSMContext):
-    from database import db
-    await db.register_user_if_not_exists(message.from_user.id)
-    await message.answer("Введите сумму расхода:")
+async def start_expense(message: types.Message, state: FSMContext, pool: asyncpg.Pool):
+    await db.get_user_id(message.from_user.id, pool)
     await state.set_state(ExpenseStates.amount)
+    return message.answer("Введите сумму расхода:")
 
 @router.message(ExpenseStates.amount, F.text.regexp(r"^\d+(\.\d{1,2})?$"))
 async def expense_amount(message: types.Message, state: FSMContext):
     await state.update_data(amount=message.text)
     await state.update_data(currency="TJS")  # Валюта по умолчанию
-    from utils.keyboards import scenario_kb
-    categories = ["Еда", "Транспорт", "Коммуналка", "Связь", "Одежда", "Здоровье", "Образование", "Развлечения", "Подарки", "Путешествия", "Дом", "Дети", "Другое"]
-    await message.answer("Выберите категорию:", reply_markup=scenario_kb(categories))
     await state.set_state(ExpenseStates.category)
+    return message.answer("Выберите категорию:", reply_markup=EXPENSE_CATEGORIES_KB)
 
 @router.message(ExpenseStates.amount, Command("cancel"))
 @router.message(ExpenseStates.amount, F.text.lower() == "главное меню")
 async def expense_cancel_amount(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Главное меню:", reply_markup=main_menu_kb())
+    return message.answer("Главное меню:", reply_markup=main_menu_kb())
 
 @router.message(ExpenseStates.amount)
 async def expense_amount_invalid(message: types.Message):
-    await message.answer("Пожалуйста, введите корректную сумму (например, 200 или 150.50)")
+    return message.answer("Пожалуйста, введите корректную сумму (например, 200 или 150.50)")
 
 
 
 
 @router.message(ExpenseStates.category)
-async def expense_category(message: types.Message, state: FSMContext):
+async def expense_category(message: types.Message, state: FSMContext, pool: asyncpg.Pool):
     data = await state.get_data()
-    amount = float(data["amount"])
+    amount = Decimal(data["amount"])
     category = message.text
-    user_id = message.from_user.id
+    user_id = await db.get_user_id(message.from_user.id, pool)
     currency = data.get("currency", "TJS")
-    # Сохраняем в базу данных
-    pool = await db.get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO expenses (user_id, amount, currency, category)
-            VALUES ((SELECT id FROM users WHERE telegram_id=$1), $2, $3, $4)
-            ON CONFLICT DO NOTHING
-            """,
-            user_id, amount, currency, category
-        )
-    await message.answer(f"Расход {amount} ({category}) добавлен!", reply_markup=main_menu_kb())
+    # Сохраняем в базу данных (при WRITE_BATCHING=1 — пакетом вместе с другими пользователями)
+    await write_pipeline.insert_row(
+        pool, "expenses", ("user_id", "amount", "currency", "category"),
+        (user_id, amount, currency, category)
+    )
+    report_cache.invalidate(user_id)
     await state.clear()
+    return message.answer(f"Расход {amount} ({category}) добавлен!", reply_markup=main_menu_kb())
 
 @router.message(ExpenseStates.category, Command("cancel"))
 @router.message(ExpenseStates.category, F.text.lower() == "главное меню")
 async def expense_cancel_category(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Главное меню:", reply_markup=main_menu_kb())
+    return message.answer("Главное меню:", reply_markup=main_menu_kb())
 
 @router.message(ExpenseStates.category)
 async def expense_category_invalid(message: types.Message):
-    await message.answer("Пожалуйста, выберите категорию из списка: Еда, Транспорт, Коммуналка")
+    return message.answer("Пожалуйста, выберите категорию из списка: Еда, Транспорт, Коммуналка")
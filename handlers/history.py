@@ -0,0 +1,50 @@
+from aiogram import Router, types, F
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery
+from utils.keyboards import history_kb
+from database import db
+from database import history
+import asyncpg
+
+router = Router()
+
+KINDS = {"i": ("incomes", "Доходы"), "e": ("expenses", "Расходы")}
+
+async def history_page(pool: asyncpg.Pool, telegram_id: int, kind: str, cursor: str = None, direction: str = "older"):
+    """
+    :return: (текст, клавиатура) страницы истории
+    """
+    table, title = KINDS[kind]
+    user_id = await db.get_user_id(telegram_id, pool)
+    async with pool.acquire() as conn:
+        page = await history.fetch_page(conn, table, user_id, cursor, direction)
+    if not page["rows"]:
+        return f"<b>{title}</b>\nОпераций пока нет.", history_kb(kind)
+    lines = [f"<b>{title}</b> (новые сверху)"]
+    for row in page["rows"]:
+        lines.append(f"{row['created_at']:%d.%m.%Y %H:%M} — {row['amount']:.2f} {row['currency']}, {row['category'] or 'без категории'}")
+    return "\n".join(lines), history_kb(kind, page["older"], page["newer"])
+
+@router.message(Command("history"))
+@router.message(F.text == "История")
+async def history_handler(message: types.Message, pool: asyncpg.Pool):
+    text, markup = await history_page(pool, message.from_user.id, "i")
+    return message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data == "hist:new")
+async def history_from_stats(callback: CallbackQuery, pool: asyncpg.Pool):
+    # Кнопка под сводкой: история приходит отдельным сообщением, сводка остаётся
+    text, markup = await history_page(pool, callback.from_user.id, "i")
+    await callback.answer()
+    return callback.message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data.regexp(r"^hist:[ie](:[on]:\d+:\d+)?$"))
+async def history_navigate(callback: CallbackQuery, pool: asyncpg.Pool):
+    # hist:<вид> — первая страница, hist:<вид>:<o|n>:<курсор> — соседняя страница
+    parts = callback.data.split(":", 3)
+    kind = parts[1]
+    cursor = parts[3] if len(parts) == 4 else None
+    direction = "newer" if len(parts) == 4 and parts[2] == "n" else "older"
+    text, markup = await history_page(pool, callback.from_user.id, kind, cursor, direction)
+    await callback.answer()
+    return callback.message.edit_text(text, reply_markup=markup)
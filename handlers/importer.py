@@ -0,0 +1,49 @@
+from aiogram import Router, types, F
+from aiogram.filters import Command, StateFilter
+from utils.keyboards import main_menu_kb, INCOME_CATEGORIES, EXPENSE_CATEGORIES
+from database import db
+import asyncpg
+
+router = Router()
+
+IMPORT_HELP = (
+    "Пришлите файл .csv или .xlsx с операциями, первая строка — заголовки:\n"
+    "• <b>дата</b> (date) — 2025-01-31 14:05 или 31.01.2025\n"
+    "• <b>сумма</b> (amount) — расходы можно указать со знаком минус\n"
+    "• тип (kind) — доход/расход, если суммы без знака\n"
+    "• валюта (currency) — TJS, USD, EUR, RUB; по умолчанию TJS\n"
+    "• категория (category) — пустая станет «Другое»\n\n"
+    f"Категории доходов: {', '.join(INCOME_CATEGORIES)}\n"
+    f"Категории расходов: {', '.join(EXPENSE_CATEGORIES)}\n\n"
+    "Подойдёт и файл из /csv. Уже загруженные операции повторно не добавятся."
+)
+
+@router.message(Command("import"))
+async def import_help(message: types.Message):
+    return message.answer(IMPORT_HELP)
+
+# Только вне сценариев: файл, присланный посреди ввода дохода или напоминания, не начинает импорт
+@router.message(StateFilter(None), F.document)
+async def import_document(message: types.Message, pool: asyncpg.Pool):
+    # Разбор и загрузка — в пуле воркеров, с отдельным соединением и COPY в staging-таблицу
+    from utils.transaction_import import import_transactions, format_result, ImportFormatError, IMPORT_MAX_BYTES
+    from utils.report_pool import ReportQueueFull
+    from utils.report_cache import report_cache
+    document = message.document
+    filename = document.file_name or ""
+    if not filename.lower().endswith((".csv", ".xlsx")):
+        return message.answer("Импортировать можно файлы .csv и .xlsx. Подробнее: /import")
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        return message.answer(f"Файл больше {IMPORT_MAX_BYTES // 2**20} МБ. Разделите его на части.")
+    user_id = await db.get_user_id(message.from_user.id, pool)
+    data = (await message.bot.download(document)).getvalue()
+    await message.answer("Загружаю операции из файла…")
+    try:
+        result = await import_transactions(user_id, data, filename)
+    except ImportFormatError as e:
+        return message.answer(str(e))
+    except ReportQueueFull:
+        return message.answer("Сейчас обрабатывается много файлов. Попробуйте чуть позже.")
+    if any(result["inserted"].values()):
+        report_cache.invalidate(user_id)
+    return message.answer(format_result(result), reply_markup=main_menu_kb())
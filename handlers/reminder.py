@@ -2,8 +2,11 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from utils.keyboards import main_menu_kb
+from utils.keyboards import main_menu_kb, REMINDER_HOURS_KB, REMINDER_MINUTES_KB, REMINDER_REPEAT_KB
 from database import db
+from database import write_pipeline
+from database.recurrence import REPEAT_TYPES
+import asyncpg
 from datetime import datetime
 
 router = Router()
@@ -14,62 +17,78 @@ class ReminderStates(StatesGroup):
 
 @router.message(Command("reminder"))
 @router.message(F.text == "Создать напоминание")
-async def start_reminder(message: types.Message, state: FSMContext):
-    from database import db
-    await db.register_user_if_not_exists(message.from_user.id)
-    await message.answer("Введите текст напоминания:")
+async def start_reminder(message: types.Message, state: FSMContext, pool: asyncpg.Pool):
+    await db.get_user_id(message.from_user.id, pool)
     await state.set_state(ReminderStates.text)
+    return message.answer("Введите текст напоминания:")
 
 @router.message(ReminderStates.text, Command("cancel"))
 @router.message(ReminderStates.text, F.text.lower() == "главное меню")
 async def reminder_cancel_text(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Главное меню:", reply_markup=main_menu_kb())
-
-from aiogram_calendar import SimpleCalendar, get_user_locale
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    return message.answer("Главное меню:", reply_markup=main_menu_kb())
 
 @router.message(ReminderStates.text)
 async def reminder_text(message: types.Message, state: FSMContext):
+    # aiogram_calendar импортируется при первом показе календаря, а не при старте бота
+    from aiogram_calendar import SimpleCalendar
     await state.update_data(text=message.text)
+    await state.set_state(ReminderStates.remind_at)
     # Показываем календарь для выбора даты
-    await message.answer(
+    return message.answer(
         "Выберите дату:",
-        reply_markup=await SimpleCalendar(locale=await get_user_locale(message.from_user)).start_calendar()
+        reply_markup=await SimpleCalendar(locale=await calendar_locale(message.from_user)).start_calendar()
     )
-    await state.set_state(ReminderStates.remind_at)
 
 from aiogram.types import CallbackQuery
 
-@router.callback_query(ReminderStates.remind_at)
+_available_locales = {}
+
+async def calendar_locale(user: types.User):
+    """
+    Локаль календаря по языку пользователя или None (английские подписи),
+    если язык неизвестен или локаль не установлена в системе (как в python:*-slim).
+    """
+    import calendar
+    import locale
+    from aiogram_calendar import get_user_locale
+    try:
+        user_locale = await get_user_locale(user)
+    except (KeyError, AttributeError):
+        return None
+    if user_locale not in _available_locales:
+        try:
+            with calendar.different_locale(user_locale):
+                pass
+            _available_locales[user_locale] = True
+        except locale.Error:
+            _available_locales[user_locale] = False
+    return user_locale if _available_locales[user_locale] else None
+
+# Только кнопки календаря: set_hour_/set_minute_ обрабатываются хендлерами ниже
+@router.callback_query(ReminderStates.remind_at, F.data.startswith("simple_calendar:"))
 async def process_calendar(callback: CallbackQuery, state: FSMContext):
-    from aiogram_calendar import SimpleCalendar, get_user_locale
-    selected, date = await SimpleCalendar(locale=await get_user_locale(callback.from_user)).process_selection(callback, callback.data)
+    from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
+    selected, date = await SimpleCalendar(locale=await calendar_locale(callback.from_user)).process_selection(
+        callback, SimpleCalendarCallback.unpack(callback.data)
+    )
     if selected:
         await state.update_data(date=date)
-        # После выбора даты — показываем клавиатуру времени (часы)
-        hours_kb = InlineKeyboardMarkup(
-            inline_keyboard=[[
-                InlineKeyboardButton(text=f"{h:02d}:00", callback_data=f"set_hour_{h}") for h in range(8, 21)
-            ]]
-        )
-        await callback.message.answer("Выберите время:", reply_markup=hours_kb)
-        await callback.answer()
-    else:
         await callback.answer()
+        # После выбора даты — показываем клавиатуру времени (часы)
+        return callback.message.answer("Выберите время:", reply_markup=REMINDER_HOURS_KB)
+    return callback.answer()
 
 @router.callback_query(ReminderStates.remind_at, F.data.regexp(r"set_hour_\d{1,2}"))
 async def process_hour(callback: CallbackQuery, state: FSMContext):
     import re
     hour = int(re.search(r"set_hour_(\d{1,2})", callback.data).group(1))
-    # После выбора часа — показываем клавиатуру минут
-    minutes_kb = InlineKeyboardMarkup(
-        inline_keyboard=[[
-            InlineKeyboardButton(text=f"{minute:02d}", callback_data=f"set_minute_{hour}_{minute}") for minute in (0, 15, 30, 45)
-        ]]
-    )
-    await callback.message.answer("Выберите минуты:", reply_markup=minutes_kb)
+    minutes_kb = REMINDER_MINUTES_KB.get(hour)
     await callback.answer()
+    if minutes_kb is None:
+        return
+    # После выбора часа — показываем клавиатуру минут
+    return callback.message.answer("Выберите минуты:", reply_markup=minutes_kb)
 
 @router.callback_query(ReminderStates.remind_at, F.data.regexp(r"set_minute_\d{1,2}_\d{1,2}"))
 async def process_minute(callback: CallbackQuery, state: FSMContext):
@@ -79,25 +98,37 @@ async def process_minute(callback: CallbackQuery, state: FSMContext):
     minute = int(match.group(2))
     data = await state.get_data()
     date = data.get("date")
-    remind_at = date.replace(hour=hour, minute=minute, second=0)
-    user_id = callback.from_user.id
-    pool = await db.get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO reminders (user_id, text, remind_at)
-            VALUES ((SELECT id FROM users WHERE telegram_id=$1), $2, $3)
-            ON CONFLICT DO NOTHING
-            """,
-            user_id, data["text"], remind_at
-        )
-    await callback.message.answer(f"Напоминание добавлено: {data['text']} на {remind_at.strftime('%Y-%m-%d %H:%M')}", reply_markup=main_menu_kb())
+    await state.update_data(remind_at=date.replace(hour=hour, minute=minute, second=0))
+    await callback.answer()
+    # После выбора времени — повтор
+    return callback.message.answer("Повторять напоминание?", reply_markup=REMINDER_REPEAT_KB)
+
+@router.callback_query(ReminderStates.remind_at, F.data.regexp(r"set_repeat_(none|daily|weekly|monthly)$"))
+async def process_repeat(callback: CallbackQuery, state: FSMContext, pool: asyncpg.Pool):
+    repeat_type = callback.data.removeprefix("set_repeat_")
+    data = await state.get_data()
+    remind_at = data.get("remind_at")
+    if remind_at is None:
+        await callback.answer()
+        return
+    user_id = await db.get_user_id(callback.from_user.id, pool)
+    # Хранится только ближайшее срабатывание; следующие рассылка вычисляет сама
+    if repeat_type == "none":
+        columns, values = ("user_id", "text", "remind_at"), (user_id, data["text"], remind_at)
+    else:
+        columns = ("user_id", "text", "remind_at", "is_repeated", "repeat_type", "repeat_anchor")
+        values = (user_id, data["text"], remind_at, True, repeat_type, remind_at)
+    await write_pipeline.insert_row(pool, "reminders", columns, values)
     await state.clear()
     await callback.answer()
+    text = f"Напоминание добавлено: {data['text']} на {remind_at.strftime('%Y-%m-%d %H:%M')}"
+    if repeat_type != "none":
+        text += f", повтор {REPEAT_TYPES[repeat_type]}"
+    return callback.message.answer(text, reply_markup=main_menu_kb())
 
 @router.message(ReminderStates.remind_at, Command("cancel"))
 @router.message(ReminderStates.remind_at, F.text.lower() == "главное меню")
 async def reminder_cancel_remind_at(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Главное меню:", reply_markup=main_menu_kb())
+    return message.answer("Главное меню:", reply_markup=main_menu_kb())
 
@@ -1,78 +1,135 @@
 from aiogram import Router, types
 from aiogram.filters import CommandStart
+import asyncpg
 
 router = Router()
 
 from database import db
 
 @router.message(CommandStart())
-async def cmd_start(message: types.Message, state):
+async def cmd_start(message: types.Message, state, pool: asyncpg.Pool):
     await state.clear()
-    await db.register_user_if_not_exists(message.from_user.id)
+    await db.get_user_id(message.from_user.id, pool)
     from utils.keyboards import main_menu_kb
-    await message.answer("Добро пожаловать в MyPlan! Управляйте своими финансами удобно и безопасно.", reply_markup=main_menu_kb())
+    return message.answer("Добро пожаловать в MyPlan! Управляйте своими финансами удобно и безопасно.", reply_markup=main_menu_kb())
 
 @router.message(lambda m: m.text and m.text.lower() == "главное меню")
 async def main_menu_handler(message: types.Message, state):
     await state.clear()
     from utils.keyboards import main_menu_kb
-    await message.answer("Главное меню:", reply_markup=main_menu_kb())
+    return message.answer("Главное меню:", reply_markup=main_menu_kb())
 
-from aiogram.types import InputFile
+from aiogram import F
+from aiogram.types import InputFile, CallbackQuery
+from aiogram.filters import Command
+from aiogram.fsm.state import StatesGroup, State
+from datetime import date
 import io
 from database import db
-from utils.excel_export import generate_excel_report
-import pandas as pd
+from database import stats
+
+from utils.keyboards import STATS_PERIOD_KB, main_menu_kb
+
+REPORT_CAPTION = "Скачать подробный отчет по доходам и расходам в Excel"
 
 @router.message(lambda m: m.text == "Статистика")
-async def statistics_handler(message: types.Message, state):
-    user_id = message.from_user.id
-    pool = await db.get_pool()
+async def statistics_handler(message: types.Message, state, pool: asyncpg.Pool):
+    user_id = await db.get_user_id(message.from_user.id, pool)
     async with pool.acquire() as conn:
-        # Получаем доходы и расходы пользователя
-        incomes = await conn.fetch("""
-            SELECT amount, currency, category, created_at
-            FROM incomes WHERE user_id=(SELECT id FROM users WHERE telegram_id=$1)
-            ORDER BY created_at
-        """, user_id)
-        expenses = await conn.fetch("""
-            SELECT amount, currency, category, created_at
-            FROM expenses WHERE user_id=(SELECT id FROM users WHERE telegram_id=$1)
-            ORDER BY created_at
-        """, user_id)
-    # Преобразуем в list[dict]
-    incomes_list = [dict(rec) for rec in incomes]
-    expenses_list = [dict(rec) for rec in expenses]
-    # Считаем баланс
-    total_income = sum(float(i["amount"]) for i in incomes_list)
-    total_expense = sum(float(e["amount"]) for e in expenses_list)
-    balance = total_income - total_expense
-    # Группировка по месяцам
-    def group_by_month(data):
-        if not data:
-            return {}
-        df = pd.DataFrame(data)
-        df["Месяц"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m")
-        return df.groupby("Месяц")["amount"].sum().to_dict()
-    income_by_month = group_by_month(incomes_list)
-    expense_by_month = group_by_month(expenses_list)
-    # Формируем текст отчета
-    report_lines = [f"Ваш текущий баланс: <b>{balance:.2f}</b>", "\n<b>Доходы по месяцам:</b>"]
-    for m, v in income_by_month.items():
-        report_lines.append(f"{m}: {v:.2f}")
-    report_lines.append("\n<b>Расходы по месяцам:</b>")
-    for m, v in expense_by_month.items():
-        report_lines.append(f"{m}: {v:.2f}")
-    report_text = "\n".join(report_lines)
-    await message.answer(report_text, parse_mode="HTML")
-    
-    # Генерируем Excel-отчёт с подробными данными и отправляем
+        # Баланс и помесячные итоги считаются в SQL, в базовой валюте по текущему снимку курсов
+        summary = await stats.fetch_summary(conn, user_id)
+        watermark = await stats.fetch_watermark(conn, user_id, summary)
+    await message.answer(stats.format_summary(summary), parse_mode="HTML", reply_markup=STATS_PERIOD_KB)
+
     from utils.excel_export import generate_excel_report
+    await send_report(message, user_id, "xlsx", watermark, lambda: generate_excel_report(user_id, summary),
+                      "finance_report.xlsx", REPORT_CAPTION)
+
+class StatsStates(StatesGroup):
+    period = State()
+
+@router.callback_query(F.data.in_({f"stats:{period}" for period in stats.PERIOD_TITLES}))
+async def period_statistics_handler(callback: CallbackQuery, pool: asyncpg.Pool):
+    # Итоги за период — диапазон по индексу (user_id, created_at), без всей истории
+    period = callback.data.split(":", 1)[1]
+    start, end = stats.period_bounds(period, date.today())
+    user_id = await db.get_user_id(callback.from_user.id, pool)
+    async with pool.acquire() as conn:
+        summary = await stats.fetch_period_summary(conn, user_id, start, end)
+    await callback.answer()
+    return callback.message.answer(stats.format_period_summary(summary, stats.PERIOD_TITLES[period]), reply_markup=STATS_PERIOD_KB)
+
+@router.callback_query(F.data == "stats:custom")
+async def custom_period_start(callback: CallbackQuery, state):
+    await state.set_state(StatsStates.period)
+    await callback.answer()
+    return callback.message.answer("Введите период в формате ДД.ММ.ГГГГ-ДД.ММ.ГГГГ, например 01.01.2025-31.03.2025, "
+                                   "или нажмите 'Главное меню' (/cancel) для выхода:")
+
+# Только текст, похожий на даты: кнопки меню и команды обрабатываются как обычно
+@router.message(StatsStates.period, F.text.regexp(r"^\s*\d"))
+async def custom_period_handler(message: types.Message, state, pool: asyncpg.Pool):
+    try:
+        start, end = stats.parse_period(message.text or "")
+    except ValueError:
+        return message.answer("Не удалось разобрать период. Пример: 01.01.2025-31.03.2025. "
+                              "Нажмите 'Главное меню' или /cancel для выхода.", reply_markup=main_menu_kb())
+    await state.clear()
+    user_id = await db.get_user_id(message.from_user.id, pool)
+    async with pool.acquire() as conn:
+        summary = await stats.fetch_period_summary(conn, user_id, start, end)
+    return message.answer(stats.format_period_summary(summary, "Свой период"), reply_markup=STATS_PERIOD_KB)
+
+@router.message(Command("pdf"))
+async def pdf_report_handler(message: types.Message, pool: asyncpg.Pool):
+    # Тот же отчёт в PDF: сводка по месяцам и суммы по дням и категориям
+    from utils.pdf_export import generate_pdf_report
+    user_id = await db.get_user_id(message.from_user.id, pool)
+    async with pool.acquire() as conn:
+        summary = await stats.fetch_summary(conn, user_id)
+        watermark = await stats.fetch_watermark(conn, user_id, summary)
+    await send_report(message, user_id, "pdf", watermark, lambda: generate_pdf_report(user_id, summary),
+                      "finance_report.pdf", "Отчет по доходам и расходам в PDF")
+
+async def send_report(message: types.Message, user_id: int, kind: str, watermark, render, filename: str, caption: str):
+    """
+    Отправляет отчёт из кэша (по file_id или байтам), а если данные изменились —
+    вызывает render() (асинхронная генерация BytesIO) и кладёт результат в кэш.
+    """
+    from aiogram.types import BufferedInputFile
+    from utils.report_cache import report_cache
+    from utils.report_pool import ReportQueueFull
+    # Новых данных не было — отдаём отчёт из кэша, по возможности по file_id без повторной загрузки
+    cached = report_cache.get(user_id, kind, watermark)
+    if cached is not None:
+        if cached["file_id"] is not None:
+            await message.answer_document(cached["file_id"], caption=caption)
+            return
+        data = cached["data"]
+    else:
+        try:
+            data = (await render()).getvalue()
+        except ReportQueueFull:
+            await message.answer("Сейчас формируется много отчётов. Попробуйте скачать отчёт чуть позже.")
+            return
+        report_cache.put(user_id, kind, watermark, data)
+    sent = await message.answer_document(BufferedInputFile(data, filename=filename), caption=caption)
+    report_cache.set_file_id(user_id, kind, watermark, sent.document.file_id)
+
+@router.message(Command("csv"))
+async def csv_export_handler(message: types.Message, pool: asyncpg.Pool):
+    # Полная выгрузка операций в CSV; строки читаются из базы потоково
     from aiogram.types import BufferedInputFile
-    excel_file = await generate_excel_report(user_id, incomes_list, expenses_list)
-    excel_bytes = excel_file.getvalue()
-    await message.answer_document(BufferedInputFile(excel_bytes, filename="finance_report.xlsx"), 
-                               caption="Скачать подробный отчет по доходам и расходам в Excel")
+    from utils.csv_export import generate_csv_export
+    from utils.report_pool import ReportQueueFull
+    user_id = await db.get_user_id(message.from_user.id, pool)
+    try:
+        csv_file = await generate_csv_export(user_id)
+    except ReportQueueFull:
+        await message.answer("Сейчас формируется много отчётов. Попробуйте чуть позже.")
+        return
+    await message.answer_document(BufferedInputFile(csv_file.getvalue(), filename="transactions.csv"),
+                                  caption="Все доходы и расходы в CSV")
 
 import random
 
@@ -104,4 +161,4 @@ TIPS = [
 @router.message(lambda m: m.text == "Советы")
 async def tips_handler(message: types.Message, state):
     tip = random.choice(TIPS)
-    await message.answer(f"Совет: {tip}")
+    return message.answer(f"Совет: {tip}")
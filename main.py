@@ -1,4 +1,5 @@
 import os
+import hashlib
 import logging
 from aiohttp import web
 from aiogram import Bot, Dispatcher
@@ -15,37 +16,216 @@ WEBHOOK_PATH = "/webhook"
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "supersecret")
 BASE_WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # https://planbot-production.up.railway.app
 PORT = int(os.getenv("PORT", 8888))
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "1") == "1"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")  # postgres | memory
+# 1 — всегда вызывать set_webhook при старте, даже если настройки не менялись
+WEBHOOK_FORCE_SETUP = os.getenv("WEBHOOK_FORCE_SETUP", "0") == "1"
+# Число процессов-воркеров вебхука; при WEB_WORKERS > 1 они делят порт через SO_REUSEPORT
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
 
 logging.basicConfig(level=logging.INFO)
 
-def create_app():
-    dp = Dispatcher(storage=MemoryStorage())
+def create_app(setup_webhook: bool = True, session=None):
+    if FSM_STORAGE == "memory":
+        dp = Dispatcher(storage=MemoryStorage())
+    else:
+        from database.fsm_storage import PostgresStorage, FSMWriteCoalescingMiddleware
+        dp = Dispatcher(storage=PostgresStorage())
+        # Единица работы должна охватывать и чтение состояния в FSMContextMiddleware,
+        # поэтому ставим её перед ним
+        dp.update.outer_middleware.unregister(dp.fsm)
+        dp.update.outer_middleware(FSMWriteCoalescingMiddleware(dp.storage))
+        dp.update.outer_middleware(dp.fsm)
 
     # Автоматически создать схему БД при первом запуске
     from database import db
     import asyncio
     async def on_startup(bot: Bot):
-        await db.init_db_schema()
-        await bot.set_webhook(f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+        # В многопроцессном режиме схему и вебхук один раз настраивает супервизор
+        if setup_webhook:
+            await setup_once(bot)
+        # Снимок курсов валют — после миграций; дальше он обновляется по таймеру
+        pool = await db.get_pool()
+        await fx.refresh(pool)
+        fx.start_refresh(pool)
+        # Будущие секции incomes/expenses и устаревшие состояния FSM проверяются раз в PARTITION_CHECK_INTERVAL
+        partitions.start_maintenance(pool)
 
-    from handlers import start, income, expense, reminder, cancel
+    from handlers import start, income, expense, reminder, cancel, currency, history, importer
+    from database.middleware import DbPoolMiddleware
+    from database import write_pipeline
+    from database import fx
+    from database import partitions
+    from utils import report_pool
+    from utils.metrics import setup_metrics
+    from utils.handler_metrics import HandlerMetricsMiddleware
+    dp.update.outer_middleware(DbPoolMiddleware())
+    # Внутренние middleware диспетчера действуют и на хендлеры вложенных роутеров
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
     dp.include_router(start.router)
+    dp.include_router(importer.router)
     dp.include_router(income.router)
     dp.include_router(expense.router)
     dp.include_router(reminder.router)
+    dp.include_router(currency.router)
+    dp.include_router(history.router)
     dp.include_router(cancel.router)
     dp.startup.register(on_startup)
 
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # session — своя HTTP-сессия бота (бенчмарк подставляет заглушку вместо Bot API)
+    from utils.bot_session import ThrottledSession, ReplyInResponseHandler, WEBHOOK_REPLY_IN_RESPONSE
+    bot = Bot(token=BOT_TOKEN, session=session or ThrottledSession(),
+              default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     app = web.Application()
-    SimpleRequestHandler(
+
+    # Общий пул соединений: создаётся до старта диспетчера и закрывается после его остановки
+    async def on_app_startup(app: web.Application):
+        await db.create_pool()
+        await write_pipeline.start_pipeline()
+
+    async def on_app_cleanup(app: web.Application):
+        await fx.stop_refresh()
+        await partitions.stop_maintenance()
+        await write_pipeline.stop_pipeline()
+        await db.close_pool()
+        report_pool.shutdown()
+
+    app.on_startup.append(on_app_startup)
+    app.on_cleanup.append(on_app_cleanup)
+
+    # Фоновая рассылка напоминаний; запускается после миграций (startup диспетчера)
+    async def start_reminder_dispatcher(app: web.Application):
+        from utils.reminder_dispatcher import ReminderDispatcher
+        app["reminder_dispatcher"] = ReminderDispatcher(bot, await db.get_pool())
+        app["reminder_dispatcher"].start()
+
+    async def stop_reminder_dispatcher(app: web.Application):
+        if "reminder_dispatcher" in app:
+            await app["reminder_dispatcher"].stop()
+
+    from utils.ingest_queue import INGEST_QUEUE, QueuedRequestHandler
+    # INGEST_QUEUE=1: вебхук только кладёт апдейт в ограниченную очередь с порядком по пользователю;
+    # WEBHOOK_REPLY_IN_RESPONSE=1: ответ хендлера отдаётся в HTTP-ответе на вебхук
+    if INGEST_QUEUE:
+        request_handler_class = QueuedRequestHandler
+    elif WEBHOOK_REPLY_IN_RESPONSE:
+        request_handler_class = ReplyInResponseHandler
+    else:
+        request_handler_class = SimpleRequestHandler
+    request_handler_class(
         dispatcher=dp,
         bot=bot,
         secret_token=WEBHOOK_SECRET,
     ).register(app, path=WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
+    setup_metrics(app)
+    if REMINDERS_ENABLED:
+        app.on_startup.append(start_reminder_dispatcher)
+        app.on_shutdown.insert(0, stop_reminder_dispatcher)
     return app
 
+async def setup_once(bot: Bot):
+    """
+    Миграции (ничего не делают, если схема актуальна), секции incomes/expenses на
+    ближайшие месяцы, загрузка курсов из FX_RATES_FILE и регистрация вебхука.
+    set_webhook вызывается, только если URL, секрет или бот изменились с прошлого запуска.
+    """
+    from database import db
+    from database import fx
+    from database import partitions
+    await db.init_db_schema()
+    await partitions.ensure_partitions(await db.get_pool())
+    if fx.FX_RATES_FILE:
+        logging.getLogger(__name__).info("Загружено курсов валют из %s: %d", fx.FX_RATES_FILE,
+                                         await fx.load_file(await db.get_pool(), fx.FX_RATES_FILE))
+    webhook_url = f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}"
+    fingerprint = hashlib.sha256(f"{bot.id}\n{webhook_url}\n{WEBHOOK_SECRET}".encode()).hexdigest()
+    if not WEBHOOK_FORCE_SETUP and await db.get_setting("webhook_fingerprint") == fingerprint:
+        logging.getLogger(__name__).info("Вебхук не изменился, set_webhook пропущен")
+        return
+    await bot.set_webhook(webhook_url, secret_token=WEBHOOK_SECRET)
+    await db.set_setting("webhook_fingerprint", fingerprint)
+
+def run_worker(index: int):
+    # Каждый воркер — отдельный процесс со своим пулом соединений и диспетчером
+    logging.getLogger(__name__).info("Воркер %d запущен (pid %d)", index, os.getpid())
+    app = create_app(setup_webhook=False)
+    web.run_app(app, port=PORT, reuse_port=True, print=None)
+
+def run_supervisor(workers: int):
+    """
+    Настраивает схему и вебхук один раз, запускает воркеров на общем порту
+    и перезапускает упавших.
+    """
+    import time
+    import signal
+    import asyncio
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    logger = logging.getLogger(__name__)
+
+    from utils.ingest_queue import INGEST_QUEUE
+    # SO_REUSEPORT раздаёт соединения вебхука по процессам без учёта пользователя,
+    # поэтому порядок апдейтов одного пользователя держится только внутри процесса
+    if INGEST_QUEUE:
+        raise SystemExit("INGEST_QUEUE=1 не поддерживается при WEB_WORKERS > 1: порядок апдейтов пользователя соблюдается только в одном процессе")
+    logger.warning(
+        "WEB_WORKERS=%d: апдейты одного пользователя могут обрабатываться в разных воркерах одновременно, "
+        "запись состояния FSM — последняя побеждает", workers,
+    )
+
+    async def setup():
+        from database import db
+        bot = Bot(token=BOT_TOKEN)
+        try:
+            await setup_once(bot)
+        finally:
+            await bot.session.close()
+            await db.close_pool()
+
+    asyncio.run(setup())
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}
+    stopping = False
+
+    def spawn(index: int):
+        process = ctx.Process(target=run_worker, args=(index,), name=f"web-worker-{index}")
+        process.start()
+        processes[index] = (process, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process, _ in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+    while processes:
+        wait([process.sentinel for process, _ in processes.values()], timeout=1)
+        for index, (process, started_at) in list(processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del processes[index]
+            if stopping:
+                continue
+            logger.warning("Воркер %d завершился с кодом %s, перезапускаем", index, process.exitcode)
+            # Не перезапускаем в цикле, если воркер падает сразу после старта
+            if time.monotonic() - started_at < 5:
+                time.sleep(1)
+            spawn(index)
+
 if __name__ == "__main__":
-    app = create_app()
-    web.run_app(app, port=PORT)
+    if WEB_WORKERS > 1:
+        run_supervisor(WEB_WORKERS)
+    else:
+        app = create_app()
+        web.run_app(app, port=PORT)
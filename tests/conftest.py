@@ -0,0 +1,40 @@
+import os
+import sys
+import asyncio
+import pytest
+
+# Тесты запускаются из корня репозитория: python -m pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты с маркой db идут на отдельной, одноразовой базе: к ней применяются миграции
+# и в неё пишутся тестовые строки. Без TEST_DATABASE_URL они пропускаются
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "db: нужен PostgreSQL (TEST_DATABASE_URL)")
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="TEST_DATABASE_URL не задан")
+    for item in items:
+        if "db" in item.keywords:
+            item.add_marker(skip)
+
+@pytest.fixture
+def with_db():
+    """
+    Запускает test(pool) на тестовой базе с применёнными миграциями: with_db(test).
+    """
+    def run(test):
+        async def main():
+            import asyncpg
+            from database.migrate import run_migrations
+            pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=4)
+            try:
+                await run_migrations(pool)
+                return await test(pool)
+            finally:
+                await pool.close()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, AnswerCallbackQuery
+from utils import bot_session
+from utils.bot_session import RateLimiter, ThrottledSession, TokenBucket, bulk_lane
+
+class FakeClock:
+    """
+    Время, которое идёт только во время sleep: тесты не ждут по-настоящему.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        # Сначала даём отработать уже разбуженным задачам, потом переводим часы;
+        # одновременные sleep перекрываются, а не складываются
+        target = self.now + seconds
+        for _ in range(10):
+            await asyncio.sleep(0)
+        self.now = max(self.now, target)
+
+def limiter(clock: FakeClock, **kwargs) -> RateLimiter:
+    options = dict(global_rate=100, global_burst=100, chat_rate=1, chat_burst=2)
+    options.update(kwargs)
+    return RateLimiter(clock=clock, sleep=clock.sleep, **options)
+
+def test_interactive_lane_is_served_before_bulk():
+    async def scenario():
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+        await bucket.acquire()
+        order = []
+
+        async def wait(name, lane):
+            await bucket.acquire(lane)
+            order.append((name, clock.now))
+
+        # Рассылка встала в очередь первой, но ответы пользователям её обгоняют
+        bulk = [asyncio.create_task(wait(f"bulk{i}", "bulk")) for i in range(2)]
+        await asyncio.sleep(0)
+        interactive = [asyncio.create_task(wait(f"reply{i}", "interactive")) for i in range(2)]
+        await asyncio.gather(*bulk, *interactive)
+        return order
+
+    assert asyncio.run(scenario()) == [("reply0", 1.0), ("reply1", 2.0), ("bulk0", 3.0), ("bulk1", 4.0)]
+
+def test_chat_limit_does_not_delay_other_chats():
+    async def scenario():
+        clock = FakeClock()
+        rate_limiter = limiter(clock)
+        times = []
+
+        async def send(chat_id):
+            await rate_limiter.acquire(chat_id)
+            times.append((chat_id, clock.now))
+
+        await asyncio.gather(*(send(1) for _ in range(4)), send(2))
+        return times
+
+    times = asyncio.run(scenario())
+    # Всплеск 2, дальше 1 в секунду; второй чат получает токен сразу
+    assert [t for chat_id, t in times if chat_id == 1] == [0.0, 0.0, 1.0, 2.0]
+    assert [t for chat_id, t in times if chat_id == 2] == [0.0]
+
+def test_global_limit_is_shared_by_chats():
+    async def scenario():
+        clock = FakeClock()
+        rate_limiter = limiter(clock, global_rate=2, global_burst=1)
+        times = []
+
+        async def send(chat_id):
+            await rate_limiter.acquire(chat_id)
+            times.append(clock.now)
+
+        await asyncio.gather(*(send(chat_id) for chat_id in range(3)))
+        return times
+
+    assert asyncio.run(scenario()) == [0.0, 0.5, 1.0]
+
+def test_retry_after_with_spare_chat_tokens_pauses_every_chat():
+    clock = FakeClock()
+    rate_limiter = limiter(clock)
+    # У чата 1 ещё есть токены: 429 пришёл за общий лимит бота
+    rate_limiter.retry_after(1, 5)
+    assert rate_limiter.global_bucket.available() == 0
+    assert rate_limiter.chats[1].available() == 0
+    clock.now = 5
+    assert rate_limiter.global_bucket.available() > 0
+
+def test_retry_after_in_exhausted_chat_pauses_only_that_chat():
+    async def scenario():
+        clock = FakeClock()
+        rate_limiter = limiter(clock)
+        await rate_limiter.acquire(1)
+        await rate_limiter.acquire(1)
+        rate_limiter.retry_after(1, 5)
+        await rate_limiter.acquire(2)
+        return clock.now, rate_limiter.chats[1].available()
+
+    assert asyncio.run(scenario()) == (0.0, 0.0)
+
+def test_retry_after_without_chat_pauses_global_bucket():
+    clock = FakeClock()
+    rate_limiter = limiter(clock)
+    rate_limiter.retry_after(None, 3)
+    assert rate_limiter.global_bucket.available() == 0
+    assert rate_limiter.chats == {}
+
+class StubResponses:
+    """
+    Подменяет запрос к Bot API: отвечает по списку, исключения выбрасывает.
+    """
+    def __init__(self, clock: FakeClock, responses: list):
+        self.clock = clock
+        self.responses = list(responses)
+        self.calls = []
+
+    async def __call__(self, session, bot, method, timeout=None):
+        self.calls.append((method.__api_method__, self.clock.now))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def retry_after(method, seconds: int) -> TelegramRetryAfter:
+    return TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=seconds)
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def session(monkeypatch, clock):
+    def make(responses, max_retries=3, **limits):
+        stub = StubResponses(clock, responses)
+
+        async def make_request(self, bot, method, timeout=None):
+            return await stub(self, bot, method, timeout)
+
+        monkeypatch.setattr(bot_session.PreparedMarkupSession, "make_request", make_request)
+        return ThrottledSession(limiter=limiter(clock, **limits), max_retries=max_retries), stub
+    return make
+
+BOT = Bot("1:a")
+
+def test_request_is_retried_after_retry_after(session, clock):
+    method = SendMessage(chat_id=1, text="hi")
+    throttled, stub = session([retry_after(method, 5), "ok"])
+    assert asyncio.run(throttled.make_request(BOT, method)) == "ok"
+    assert stub.calls == [("sendMessage", 0.0), ("sendMessage", 5.0)]
+
+def test_retry_after_gives_up_after_max_retries(session, clock):
+    method = SendMessage(chat_id=1, text="hi")
+    throttled, stub = session([retry_after(method, 1)] * 3, max_retries=2)
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(throttled.make_request(BOT, method))
+    assert len(stub.calls) == 3
+
+def test_request_without_chat_waits_retry_after(session, clock):
+    method = AnswerCallbackQuery(callback_query_id="1")
+    throttled, stub = session([retry_after(method, 2), True])
+    assert asyncio.run(throttled.make_request(BOT, method)) is True
+    assert stub.calls == [("answerCallbackQuery", 0.0), ("answerCallbackQuery", 2.0)]
+    # Общий лимит тоже на паузе: сообщения в чаты не пошли раньше
+    assert throttled.limiter.global_bucket.paused_until == 2.0
+
+def test_bulk_lane_is_counted_separately(session, clock):
+    throttled, stub = session(["ok"])
+
+    async def scenario():
+        with bulk_lane():
+            return await throttled.make_request(BOT, SendMessage(chat_id=1, text="hi"))
+
+    before = bot_session.BOT_API_REQUESTS._values.get(("sendMessage", "bulk"), 0)
+    assert asyncio.run(scenario()) == "ok"
+    assert bot_session.BOT_API_REQUESTS._values[("sendMessage", "bulk")] - before == 1
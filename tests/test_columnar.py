@@ -0,0 +1,102 @@
+import asyncio
+from decimal import Decimal
+import pytest
+from benchmarks.columnar import make_columns, make_copy, daily_totals_rows, to_records, SUMMARY, CURRENCIES, CATEGORIES
+from database import columnar
+
+def stream(payload: bytes, fragment: int, batch_rows: int) -> list:
+    totals = columnar.DailyTotals(CURRENCIES, CATEGORIES)
+    reader = columnar.CopyReader(
+        lambda rows: totals.add(columnar.columns_from_rows(rows, CURRENCIES, CATEGORIES)), batch_rows,
+    )
+
+    async def feed():
+        for start in range(0, len(payload), fragment):
+            await reader(payload[start:start + fragment])
+        reader.finish()
+
+    asyncio.run(feed())
+    return totals.result(SUMMARY)
+
+def test_columns_from_copy_roundtrip():
+    data = make_columns(1000)
+    columns = columnar.columns_from_copy(make_copy(data), CURRENCIES, CATEGORIES)
+    assert (columns.amount == data["amount"]).all()
+    assert (columns.created_at == data["created_at"]).all()
+    assert (columns.category == data["category"]).all()
+    assert columns.nbytes == 24 * 1000
+
+def test_daily_totals_match_row_by_row():
+    data = make_columns(5000)
+    columns = columnar.columns_from_copy(make_copy(data), CURRENCIES, CATEGORIES)
+    assert sorted(columnar.daily_totals(columns, SUMMARY), key=str) == sorted(daily_totals_rows(to_records(data), SUMMARY), key=str)
+
+@pytest.mark.parametrize("fragment, batch_rows", [(1, 1), (41, 7), (43, 1000), (65536, 50_000)])
+def test_streamed_totals_do_not_depend_on_fragments(fragment, batch_rows):
+    payload = make_copy(make_columns(3000))
+    expected = columnar.daily_totals(columnar.columns_from_copy(payload, CURRENCIES, CATEGORIES), SUMMARY)
+    assert stream(payload, fragment, batch_rows) == expected
+
+def test_missing_rate_is_skipped_and_half_rounds_up():
+    columns = columnar.TransactionColumns(
+        amount=columnar.np.array([1, 500], dtype=columnar.np.int64),
+        created_at=columnar.np.array(["2024-01-01T10:00", "2024-01-01T11:00"], dtype="datetime64[us]"),
+        currency=columnar.np.array([0, 1], dtype=columnar.np.int32),
+        category=columnar.np.array([0, 0], dtype=columnar.np.int32),
+        currencies=["TJS", "XXX"],
+        categories=["Еда"],
+    )
+    summary = {"base_currency": "TJS", "rates": {"TJS": Decimal(1), "USD": Decimal(2)}}
+    # 0.01 TJS в USD = 0.005 -> 0.01, как ROUND в PostgreSQL; XXX без курса не учитывается
+    assert columnar.daily_totals(columns, dict(summary, base_currency="USD")) == [("2024-01-01", "Еда", Decimal("0.01"))]
+
+@pytest.mark.parametrize("cut", [2, 5])
+def test_truncated_stream_is_rejected(cut):
+    with pytest.raises(ValueError):
+        stream(make_copy(make_columns(100))[:-cut], 1000, 10)
+
+def test_empty_table():
+    assert stream(make_copy(make_columns(0)), 7, 10) == []
+
+def null_created_at_row(amount: int, currency: int, category: int) -> bytes:
+    # created_at = NULL: длина -1 и нет данных, строка короче остальных
+    return (
+        (4).to_bytes(2, "big") + (8).to_bytes(4, "big") + amount.to_bytes(8, "big")
+        + (-1).to_bytes(4, "big", signed=True)
+        + (4).to_bytes(4, "big") + currency.to_bytes(4, "big")
+        + (4).to_bytes(4, "big") + category.to_bytes(4, "big")
+    )
+
+def with_null_rows(payload: bytes, positions: list) -> bytes:
+    header = 19
+    size = columnar.ROW_DTYPE.itemsize
+    body = payload[header:-2]
+    parts = []
+    for index in range(len(body) // size + 1):
+        if index in positions:
+            parts.append(null_created_at_row(12345, 1, 2))
+        parts.append(body[index * size:(index + 1) * size])
+    return payload[:header] + b"".join(parts) + payload[-2:]
+
+@pytest.mark.parametrize("positions", [[0], [5], [99, 100], [0, 1, 2, 50]])
+def test_rows_with_null_are_skipped(positions):
+    payload = make_copy(make_columns(100))
+    expected = columnar.parse_copy(payload)
+    assert (columnar.parse_copy(with_null_rows(payload, positions)) == expected).all()
+
+@pytest.mark.parametrize("fragment, batch_rows", [(1, 1), (17, 3), (43, 1000)])
+def test_streamed_totals_skip_null_rows(fragment, batch_rows):
+    payload = make_copy(make_columns(300))
+    expected = stream(payload, 65536, 50_000)
+    assert stream(with_null_rows(payload, [0, 7, 8, 150, 300]), fragment, batch_rows) == expected
+
+def test_only_null_rows():
+    payload = make_copy(make_columns(0))
+    assert stream(with_null_rows(payload, [0]), 5, 1) == []
+
+def test_unexpected_field_width_is_rejected():
+    row = bytearray(make_copy(make_columns(1))[19:-2])
+    # Длина created_at 4 вместо 8
+    row[14:18] = (4).to_bytes(4, "big")
+    with pytest.raises(ValueError):
+        columnar.take_rows(bytes(row))
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from database import db
+from database import fsm_storage
+from database.fsm_storage import FSMWriteCoalescingMiddleware, PostgresStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+class FakeConn:
+    def __init__(self, executed):
+        self.executed = executed
+
+    async def fetchrow(self, sql, *args):
+        return None
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+class FakePool:
+    def __init__(self):
+        self.executed = []
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConn(pool.executed)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_pool():
+        return pool
+
+    monkeypatch.setattr(db, "get_pool", get_pool)
+    return pool
+
+def test_state_is_flushed_once_after_success(pool):
+    storage = PostgresStorage()
+
+    async def handler(event, data):
+        await storage.set_state(KEY, "Form:amount")
+        await storage.update_data(KEY, {"amount": 10})
+        await storage.update_data(KEY, {"currency": "TJS"})
+        return "ok"
+
+    assert asyncio.run(FSMWriteCoalescingMiddleware(storage)(handler, None, {})) == "ok"
+    assert pool.executed == [(
+        fsm_storage.UPSERT_SQL,
+        (storage.key_builder.build(KEY), "Form:amount", fsm_storage.dumps({"amount": 10, "currency": "TJS"}), True, True),
+    )]
+
+def test_failed_handler_discards_state_and_reraises(pool):
+    storage = PostgresStorage()
+
+    async def handler(event, data):
+        await storage.set_state(KEY, "Form:amount")
+        raise ValueError("ошибка хендлера")
+
+    with pytest.raises(ValueError, match="ошибка хендлера"):
+        asyncio.run(FSMWriteCoalescingMiddleware(storage)(handler, None, {}))
+    assert pool.executed == []
+
+class StatusPool(FakePool):
+    def acquire(self):
+        pool = self
+
+        class Conn(FakeConn):
+            async def execute(self, sql, *args):
+                await super().execute(sql, *args)
+                return "DELETE 3"
+
+        class Acquire:
+            async def __aenter__(self):
+                return Conn(pool.executed)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+def test_delete_stale_passes_ttl_in_seconds():
+    pool = StatusPool()
+    assert asyncio.run(fsm_storage.delete_stale(pool, ttl_days=2)) == 3
+    assert pool.executed == [(fsm_storage.DELETE_STALE_SQL, (2 * 86400,))]
+
+def test_delete_stale_disabled_with_zero_ttl():
+    pool = StatusPool()
+    assert asyncio.run(fsm_storage.delete_stale(pool, ttl_days=0)) == 0
+    assert pool.executed == []
+
+@pytest.mark.db
+def test_delete_stale_keeps_recent_dialogues(with_db):
+    async def test(pool):
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM fsm_storage WHERE key LIKE 'test-ttl:%'")
+            await conn.execute("""
+                INSERT INTO fsm_storage (key, state, updated_at) VALUES
+                    ('test-ttl:old', 'Form:amount', LOCALTIMESTAMP - interval '31 days'),
+                    ('test-ttl:new', 'Form:amount', LOCALTIMESTAMP - interval '29 days')
+            """)
+        await fsm_storage.delete_stale(pool, ttl_days=30)
+        async with pool.acquire() as conn:
+            keys = await conn.fetch("SELECT key FROM fsm_storage WHERE key LIKE 'test-ttl:%'")
+            await conn.execute("DELETE FROM fsm_storage WHERE key LIKE 'test-ttl:%'")
+        return [row["key"] for row in keys]
+
+    assert with_db(test) == ["test-ttl:new"]
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from database import importer
+from database import partitions
+
+class FakeConn:
+    def __init__(self, months=(), partitioned=("incomes", "expenses"), existing=()):
+        self.months = months
+        self.partitioned = partitioned
+        self.existing = existing
+        self.executed = []
+        self.transactions = 0
+
+    def transaction(self):
+        conn = self
+
+        class Transaction:
+            async def __aenter__(self):
+                conn.transactions += 1
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Transaction()
+
+    async def fetch(self, sql, *args):
+        return [{"kind": kind, "month": month} for kind, month in self.months]
+
+    async def fetchval(self, sql, *args):
+        if "pg_partitioned_table" in sql:
+            return args[0] in self.partitioned
+        if "to_regclass" in sql:
+            return args[0] in self.existing
+        # Строк этого месяца в {table}_default нет
+        return False
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+def test_staged_months_are_mapped_to_tables():
+    conn = FakeConn([("expense", date(2019, 3, 1)), ("income", date(2019, 3, 1))])
+    assert asyncio.run(importer.staged_months(conn)) == [("expenses", date(2019, 3, 1)), ("incomes", date(2019, 3, 1))]
+
+def test_partitions_are_created_in_own_transaction_under_lock():
+    conn = FakeConn(existing=("expenses_y2019m04",))
+    months = [("expenses", date(2019, 3, 1)), ("expenses", date(2019, 4, 1)), ("incomes", date(2019, 3, 1))]
+    assert asyncio.run(importer.create_month_partitions(conn, months)) == 2
+    assert conn.transactions == 1
+    assert conn.executed == [
+        ("SELECT pg_advisory_xact_lock($1)", (partitions.PARTITIONS_LOCK_KEY,)),
+        (partitions.create_partition_sql("expenses", "expenses", date(2019, 3, 1)), ()),
+        (partitions.create_partition_sql("incomes", "incomes", date(2019, 3, 1)), ()),
+    ]
+
+def test_unpartitioned_table_is_left_alone():
+    conn = FakeConn(partitioned=())
+    assert asyncio.run(importer.create_month_partitions(conn, [("incomes", date(2019, 3, 1))])) == 0
+    assert [sql for sql, _ in conn.executed] == ["SELECT pg_advisory_xact_lock($1)"]
+
+def test_empty_file_takes_no_lock():
+    conn = FakeConn()
+    assert asyncio.run(importer.create_month_partitions(conn, [])) == 0
+    assert conn.executed == [] and conn.transactions == 0
+
+# === На живой базе ===
+
+async def _import(pool, user_id: int, records: list) -> dict:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await importer.begin_import(conn, user_id)
+            await importer.load_chunk(conn, records)
+            months = await importer.staged_months(conn)
+            async with pool.acquire() as partitions_conn:
+                await importer.create_month_partitions(partitions_conn, months)
+            return await importer.merge(conn, user_id)
+
+@pytest.mark.db
+def test_merge_deduplicates_as_multiset(with_db):
+    moment = datetime.now().replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+    coffee = ("expense", Decimal("12.50"), "TJS", "Еда", moment)
+    salary = ("income", Decimal("1000.00"), "USD", "Зарплата", moment)
+
+    async def test(pool):
+        async with pool.acquire() as conn:
+            user_id = await conn.fetchval(
+                "INSERT INTO users (telegram_id) VALUES (-7346) ON CONFLICT (telegram_id) DO UPDATE SET telegram_id = EXCLUDED.telegram_id RETURNING id"
+            )
+        try:
+            # Две одинаковые покупки в одном файле не схлопываются
+            first = await _import(pool, user_id, [(2, *coffee), (3, *coffee), (4, *salary)])
+            # Повторная загрузка того же файла ничего не добавляет
+            again = await _import(pool, user_id, [(2, *coffee), (3, *coffee), (4, *salary)])
+            # Третья такая же покупка — добавляется только она
+            more = await _import(pool, user_id, [(2, *coffee), (3, *coffee), (4, *coffee)])
+            async with pool.acquire() as conn:
+                count = await conn.fetchval("SELECT COUNT(*) FROM expenses WHERE user_id = $1", user_id)
+            return first, again, more, count
+        finally:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM incomes WHERE user_id = $1", user_id)
+                await conn.execute("DELETE FROM expenses WHERE user_id = $1", user_id)
+
+    first, again, more, count = with_db(test)
+    assert first == {"income": 1, "expense": 2}
+    assert again == {"income": 0, "expense": 0}
+    assert more == {"income": 0, "expense": 1}
+    assert count == 3
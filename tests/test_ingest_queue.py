@@ -0,0 +1,51 @@
+import asyncio
+from utils import metrics
+from utils import ingest_queue
+
+class SlowDispatcher:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.seen = []
+
+    async def feed_raw_update(self, bot, update, **data):
+        await self.release.wait()
+        self.seen.append(update["update_id"])
+
+def update(update_id: int, user_id: int) -> dict:
+    return {"update_id": update_id, "message": {"from": {"id": user_id}}}
+
+def sample(name: str) -> float:
+    line = next(l for l in metrics.render().splitlines() if l.startswith(f"{name} "))
+    return float(line.split()[-1])
+
+def updates(result: str) -> float:
+    return ingest_queue.INGEST_UPDATES._values.get((result,), 0.0)
+
+def test_backpressure_is_exported_to_metrics():
+    async def scenario():
+        dispatcher = SlowDispatcher()
+        queue = ingest_queue.IngestQueue(dispatcher, bot=None, workers=1, maxsize=3)
+        queue.start()
+        for update_id in (1, 2, 3):
+            assert await queue.put(update(update_id, user_id=7))
+        await asyncio.sleep(0)
+        # Очередь заполнена: четвёртый апдейт получает 503
+        assert not await queue.put(update(4, user_id=8), timeout=0)
+        values = {
+            name: sample(f"planbot_ingest_queue_{name}") for name in ("depth", "max_user_backlog", "users")
+        }
+        dispatcher.release.set()
+        await queue.drain(timeout=1)
+        exported = any(line.startswith("planbot_ingest_queue_depth ") for line in metrics.render().splitlines())
+        return values, dispatcher.seen, exported
+
+    before = {result: updates(result) for result in ("accepted", "rejected", "processed")}
+    waits = ingest_queue.INGEST_WAIT_SECONDS._values.get((), [None, 0, 0])[2]
+    values, seen, exported_after_drain = asyncio.run(scenario())
+    # Первый апдейт уже у воркера, за ним в очереди пользователя ещё два
+    assert values == {"depth": 3, "max_user_backlog": 2, "users": 1}
+    assert {result: updates(result) - count for result, count in before.items()} == {"accepted": 3, "rejected": 1, "processed": 3}
+    assert ingest_queue.INGEST_WAIT_SECONDS._values[()][2] - waits == 3
+    assert "# TYPE planbot_ingest_updates_total counter" in metrics.render()
+    assert seen == [1, 2, 3]
+    assert not exported_after_drain
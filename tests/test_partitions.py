@@ -0,0 +1,117 @@
+import asyncio
+from datetime import date, datetime
+import pytest
+from database import partitions
+
+class FakeConn:
+    """
+    Отвечает на to_regclass и проверку строк в {table}_default, запоминает DDL.
+    """
+    def __init__(self, exists=False, default_rows=False):
+        self.exists = exists
+        self.default_rows = default_rows
+        self.executed = []
+        self.checked = []
+
+    async def fetchval(self, sql, *args):
+        if "to_regclass" in sql:
+            return self.exists
+        self.checked.append((sql, args))
+        return self.default_rows
+
+    async def execute(self, sql, *args):
+        self.executed.append(sql)
+
+@pytest.mark.parametrize("month, count, expected", [
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), 25, date(2028, 4, 1)),
+    (date(2026, 3, 1), 0, date(2026, 3, 1)),
+])
+def test_add_months(month, count, expected):
+    assert partitions.add_months(month, count) == expected
+
+def test_partition_name_is_zero_padded():
+    assert partitions.partition_name("incomes", date(2026, 3, 1)) == "incomes_y2026m03"
+    assert partitions.partition_name("expenses", date(987, 11, 1)) == "expenses_y0987m11"
+
+@pytest.mark.parametrize("month, start, end", [
+    (date(2024, 2, 1), datetime(2024, 2, 1), datetime(2024, 3, 1)),
+    (date(2026, 12, 1), datetime(2026, 12, 1), datetime(2027, 1, 1)),
+])
+def test_partition_bounds(month, start, end):
+    assert partitions.partition_bounds(month) == (start, end)
+
+def test_create_partition_sql():
+    assert partitions.create_partition_sql("incomes_partitioned", "incomes", date(2026, 12, 1)) == (
+        "CREATE TABLE incomes_y2026m12 PARTITION OF incomes_partitioned "
+        "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')"
+    )
+
+def test_create_partition_refuses_when_default_holds_rows():
+    conn = FakeConn(default_rows=True)
+    assert asyncio.run(partitions.create_partition(conn, "incomes", date(2026, 5, 1))) is False
+    assert conn.executed == []
+    sql, args = conn.checked[0]
+    assert "incomes_default" in sql
+    assert args == (datetime(2026, 5, 1), datetime(2026, 6, 1))
+
+def test_create_partition_skips_existing():
+    conn = FakeConn(exists=True)
+    assert asyncio.run(partitions.create_partition(conn, "incomes", date(2026, 5, 1))) is False
+    assert conn.executed == [] and conn.checked == []
+
+def test_create_partition_creates_month():
+    conn = FakeConn()
+    assert asyncio.run(partitions.create_partition(conn, "expenses", date(2026, 5, 1))) is True
+    assert conn.executed == [partitions.create_partition_sql("expenses", "expenses", date(2026, 5, 1))]
+
+# === На живой базе ===
+
+class _Rollback(Exception):
+    pass
+
+async def _test_user(conn) -> int:
+    return await conn.fetchval(
+        "INSERT INTO users (telegram_id) VALUES (-7345) ON CONFLICT (telegram_id) DO UPDATE SET telegram_id = EXCLUDED.telegram_id RETURNING id"
+    )
+
+@pytest.mark.db
+def test_migration_partitions_fresh_tables(with_db):
+    async def test(pool):
+        async with pool.acquire() as conn:
+            for table in partitions.PARTITIONED_TABLES:
+                assert await partitions.is_partitioned(conn, table)
+                assert f"{table}_default" in {name for name, _ in await partitions.list_partitions(conn, table)}
+        assert await partitions.drop_unpartitioned(pool) == []
+
+    with_db(test)
+
+@pytest.mark.db
+def test_create_partition_refuses_when_default_holds_rows_db(with_db):
+    month = date(2999, 1, 1)
+
+    async def test(pool):
+        async with pool.acquire() as conn:
+            user_id = await _test_user(conn)
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO incomes (user_id, amount, currency, category, created_at) VALUES ($1, 1, 'TJS', 'Бонус', $2)",
+                    user_id, datetime(2999, 1, 15),
+                )
+                created = await partitions.create_partition(conn, "incomes", month)
+                # Откатываем тестовую строку
+                raise _Rollback(created)
+
+    with pytest.raises(_Rollback) as raised:
+        with_db(test)
+    assert raised.value.args[0] is False
+
+@pytest.mark.db
+def test_current_month_query_reads_one_partition(with_db):
+    async def test(pool):
+        await partitions.ensure_partitions(pool)
+        return await partitions.check_pruning(pool, date.today().replace(day=1))
+
+    assert with_db(test) is True
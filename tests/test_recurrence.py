@@ -0,0 +1,88 @@
+"""
+reminder_next_occurrence (migrations/0009) проверяется только на живой базе: копии этой
+логики на Python нет, тесты сверяют саму функцию, которую вызывает диспетчер.
+"""
+import random
+import calendar
+from datetime import datetime, timedelta
+import pytest
+from database import recurrence
+from database.recurrence import EDGE_CASES, NEXT_OCCURRENCE_SQL
+
+pytestmark = pytest.mark.db
+
+def _ts(value):
+    return value and datetime.fromisoformat(value)
+
+def _shift_months(value: datetime, months: int) -> datetime:
+    """Сдвиг на месяцы с прижатием к концу месяца, как interval '1 month' в PostgreSQL."""
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    day = min(value.day, calendar.monthrange(year, month + 1)[1])
+    return value.replace(year=year, month=month + 1, day=day)
+
+CASES = [pytest.param(*case[1:], id=case[0]) for case in EDGE_CASES]
+
+def random_cases(count: int, seed: int = 23) -> list:
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        remind_at = datetime(2024, 1, 1, 0, 0) + timedelta(minutes=rng.randrange(0, 3 * 365 * 24 * 60))
+        repeat_type = rng.choice(("daily", "weekly", "monthly"))
+        anchor = None
+        if repeat_type == "monthly" and rng.random() < 0.8:
+            # Якорь на 28–31-е, а remind_at — уже прижатое к концу месяца срабатывание
+            anchor = remind_at.replace(day=min(rng.choice((28, 29, 30, 31)), calendar.monthrange(remind_at.year, remind_at.month)[1]))
+            remind_at = anchor
+        fired_at = remind_at + timedelta(seconds=rng.choice((0, 1, 59, 3600, 86400 * rng.randrange(1, 120))))
+        cases.append((remind_at, anchor, repeat_type, fired_at))
+    return cases
+
+@pytest.mark.parametrize("value, months, expected", [
+    ("2026-01-31 09:00", 1, "2026-02-28 09:00"),
+    ("2028-01-31 09:00", 1, "2028-02-29 09:00"),
+    ("2026-03-31 09:00", -1, "2026-02-28 09:00"),
+    ("2026-12-15 09:00", 1, "2027-01-15 09:00"),
+])
+def test_shift_months_clamps_like_postgres(with_db, value, months, expected):
+    async def test(pool):
+        return await pool.fetchval("SELECT $1::timestamp + make_interval(months => $2)", _ts(value), months)
+
+    result = with_db(test)
+    assert result == _ts(expected) == _shift_months(_ts(value), months)
+
+@pytest.mark.parametrize("remind_at, anchor, repeat_type, fired_at, expected", CASES)
+def test_edge_cases(with_db, remind_at, anchor, repeat_type, fired_at, expected):
+    async def test(pool):
+        return await pool.fetchval(NEXT_OCCURRENCE_SQL, _ts(remind_at), _ts(anchor), repeat_type, _ts(fired_at))
+
+    assert with_db(test) == _ts(expected)
+
+def test_invariants(with_db):
+    cases = random_cases(500)
+
+    async def test(pool):
+        async with pool.acquire() as conn:
+            return [await conn.fetchval(NEXT_OCCURRENCE_SQL, *case) for case in cases]
+
+    for (remind_at, anchor, repeat_type, fired_at), result in zip(cases, with_db(test)):
+        assert result > fired_at
+        # Время суток не «плывёт»
+        assert result.time() == remind_at.time()
+        if repeat_type == "monthly":
+            base = anchor or remind_at
+            assert result.day == min(base.day, calendar.monthrange(result.year, result.month)[1])
+            # Не догоняем пропущенные: предыдущее срабатывание было не позже fired_at
+            months = (result.year - base.year) * 12 + result.month - base.month
+            assert _shift_months(base, months - 1) <= fired_at
+        else:
+            step = timedelta(days=1 if repeat_type == "daily" else 7)
+            assert (result - remind_at) % step == timedelta(0)
+            assert result - step <= fired_at
+
+def test_check_command(with_db):
+    async def test(pool):
+        async with pool.acquire() as conn:
+            return await recurrence.check(conn)
+
+    assert with_db(test) is True
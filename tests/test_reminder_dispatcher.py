@@ -0,0 +1,182 @@
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+import pytest
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+from utils import reminder_dispatcher
+from utils.reminder_dispatcher import ReminderDispatcher
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+class StubBot:
+    def __init__(self, blocked=()):
+        self.blocked = blocked
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=SendMessage(chat_id=chat_id, text=text), message="bot was blocked")
+        self.sent.append((chat_id, text))
+
+class FakeConn:
+    """
+    Напоминания в памяти: скан отдаёт rows, аренда — все запрошенные id по порядку.
+    """
+    def __init__(self, reminders: dict, db_now: datetime):
+        self.reminders = reminders
+        self.db_now = db_now
+        self.leased = []
+        self.marked = []
+        self.stopped = []
+
+    async def fetchrow(self, sql, *args):
+        assert sql == reminder_dispatcher.CLOCK_SQL
+        return max(self.reminders, default=0), self.db_now
+
+    async def fetch(self, sql, *args):
+        if sql == reminder_dispatcher.SCAN_SQL:
+            _, horizon, *_ = args
+            return sorted(
+                ({"id": id, "remind_at": remind_at} for id, remind_at in self.reminders.items() if remind_at <= horizon),
+                key=lambda row: row["remind_at"],
+            )
+        assert sql == reminder_dispatcher.LEASE_SQL
+        ids, _ = args
+        self.leased.append(list(ids))
+        return [{"id": id, "text": f"r{id}", "remind_at": self.reminders[id], "telegram_id": id} for id in ids]
+
+    async def execute(self, sql, ids):
+        (self.marked if sql == reminder_dispatcher.MARK_SENT_SQL else self.stopped).append(list(ids))
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+def test_heap_dispatches_due_reminders_in_remind_at_order():
+    conn = FakeConn({
+        1: NOW + timedelta(seconds=30),
+        2: NOW - timedelta(minutes=5),
+        3: NOW - timedelta(minutes=1),
+        4: NOW - timedelta(minutes=3),
+        5: NOW + timedelta(hours=1),
+    }, db_now=NOW)
+    bot = StubBot()
+    dispatcher = ReminderDispatcher(bot, FakePool(conn), lookahead=120, batch_size=2)
+
+    async def scenario():
+        assert await dispatcher.scan() == 4
+        return await dispatcher.dispatch_due()
+
+    assert asyncio.run(scenario()) == 3
+    assert conn.leased == [[2, 4], [3]]
+    assert conn.marked == [[2, 4], [3]]
+    # Напоминание через 30 секунд ждёт в куче, через час — вне окна просмотра
+    assert [id for _, id in dispatcher._heap] == [1]
+
+def test_clock_comes_from_database_not_process_timezone():
+    # База живёт на 5 часов впереди локального времени процесса
+    db_now = datetime.now() + timedelta(hours=5)
+    conn = FakeConn({1: db_now - timedelta(minutes=1), 2: db_now + timedelta(hours=1)}, db_now=db_now)
+    dispatcher = ReminderDispatcher(StubBot(), FakePool(conn), lookahead=7200)
+
+    async def scenario():
+        await dispatcher.scan()
+        return await dispatcher.dispatch_due()
+
+    assert asyncio.run(scenario()) == 1
+    assert conn.leased == [[1]]
+    assert db_now <= dispatcher.now() < db_now + timedelta(seconds=5)
+
+def test_nothing_is_due_before_first_scan():
+    dispatcher = ReminderDispatcher(StubBot(), FakePool(FakeConn({}, NOW)))
+    assert dispatcher.now() == datetime.min
+
+def test_blocked_user_is_stopped_not_marked_sent():
+    conn = FakeConn({1: NOW, 2: NOW}, db_now=NOW)
+    dispatcher = ReminderDispatcher(StubBot(blocked=(2,)), FakePool(conn))
+
+    async def scenario():
+        await dispatcher.scan()
+        return await dispatcher.dispatch_due()
+
+    assert asyncio.run(scenario()) == 1
+    assert conn.marked == [[1]]
+    assert conn.stopped == [[2]]
+
+# === На живой базе ===
+
+async def _test_user(conn) -> int:
+    return await conn.fetchval(
+        "INSERT INTO users (telegram_id) VALUES (-7347) ON CONFLICT (telegram_id) DO UPDATE SET telegram_id = EXCLUDED.telegram_id RETURNING id"
+    )
+
+@pytest.mark.db
+def test_two_dispatchers_send_each_reminder_once(with_db):
+    async def test(pool):
+        async with pool.acquire() as conn:
+            user_id = await _test_user(conn)
+            ids = [row["id"] for row in await conn.fetch(
+                """
+                INSERT INTO reminders (user_id, text, remind_at)
+                SELECT $1, 'r' || i, LOCALTIMESTAMP - make_interval(secs => i) FROM generate_series(1, 50) i
+                RETURNING id
+                """,
+                user_id,
+            )]
+        try:
+            bots = [StubBot(), StubBot()]
+            dispatchers = [ReminderDispatcher(bot, pool, batch_size=7) for bot in bots]
+            for dispatcher in dispatchers:
+                await dispatcher.scan()
+            await asyncio.gather(*(dispatcher.dispatch_due() for dispatcher in dispatchers))
+            async with pool.acquire() as conn:
+                unsent = await conn.fetchval(
+                    "SELECT COUNT(*) FROM reminders WHERE id = ANY($1::int[]) AND sent_at IS NULL", ids,
+                )
+            texts = [text for bot in bots for chat_id, text in bot.sent if chat_id == -7347]
+            return texts, unsent
+        finally:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM reminders WHERE user_id = $1", user_id)
+
+    texts, unsent = with_db(test)
+    assert sorted(texts) == sorted(f"Напоминание: r{i}" for i in range(1, 51))
+    assert unsent == 0
+
+@pytest.mark.db
+def test_mark_sent_advances_repeated_and_closes_one_off(with_db):
+    async def test(pool):
+        async with pool.acquire() as conn:
+            user_id = await _test_user(conn)
+            db_now = await conn.fetchval("SELECT LOCALTIMESTAMP")
+            remind_at = db_now.replace(second=0, microsecond=0) - timedelta(minutes=1)
+            once, daily = [
+                await conn.fetchval(
+                    """
+                    INSERT INTO reminders (user_id, text, remind_at, is_repeated, repeat_type, repeat_anchor)
+                    VALUES ($1, 'x', $2, $3, $4, $2) RETURNING id
+                    """,
+                    user_id, remind_at, repeat_type is not None, repeat_type,
+                )
+                for repeat_type in (None, "daily")
+            ]
+        try:
+            await ReminderDispatcher(StubBot(), pool).mark_sent([once, daily])
+            async with pool.acquire() as conn:
+                rows = {row["id"]: row for row in await conn.fetch(
+                    "SELECT id, remind_at, sent_at, leased_until FROM reminders WHERE id = ANY($1::int[])", [once, daily],
+                )}
+            return remind_at, rows[once], rows[daily]
+        finally:
+            async with pool.acquire() as conn:
+                await conn.execute("DELETE FROM reminders WHERE user_id = $1", user_id)
+
+    remind_at, once, daily = with_db(test)
+    assert once["sent_at"] is not None and once["remind_at"] == remind_at
+    assert daily["sent_at"] is None and daily["leased_until"] is None
+    assert daily["remind_at"] == remind_at + timedelta(days=1)
@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+import pytest
+from utils import transaction_import as ti
+
+COLUMNS = {"created_at": 0, "amount": 1, "currency": 2, "category": 3}
+WINDOW = (datetime(2016, 1, 1), datetime(2026, 10, 20))
+
+@pytest.mark.parametrize("value, expected", [
+    (12.099999999999, Decimal("12.1")),
+    (12.1, Decimal("12.1")),
+    (5, Decimal("5")),
+    ("1 234,50", Decimal("1234.50")),
+    ("1 234,5", Decimal("1234.5")),
+    ("-99.90", Decimal("-99.90")),
+    ("0.01", Decimal("0.01")),
+])
+def test_parse_amount(value, expected):
+    assert ti.parse_amount(value) == expected
+
+@pytest.mark.parametrize("value", ["0", 0, "0.001", 12.345, "1,234.5.6", "abc", "", None, "NaN", "10000000000"])
+def test_parse_amount_rejects(value):
+    with pytest.raises((ValueError, ArithmeticError)):
+        ti.parse_amount(value)
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-01-31 14:05", datetime(2025, 1, 31, 14, 5)),
+    ("2025-01-31 14:05:07", datetime(2025, 1, 31, 14, 5, 7)),
+    ("2025-01-31", datetime(2025, 1, 31)),
+    ("31.01.2025", datetime(2025, 1, 31)),
+    ("31.01.2025 09:30", datetime(2025, 1, 31, 9, 30)),
+    # Выгрузка /csv
+    ("2025-01-31T14:05:07.123456", datetime(2025, 1, 31, 14, 5, 7, 123456)),
+    (date(2025, 1, 31), datetime(2025, 1, 31)),
+    (datetime(2025, 1, 31, 14, 5), datetime(2025, 1, 31, 14, 5)),
+])
+def test_parse_date(value, expected):
+    assert ti.parse_date(value) == expected
+
+def test_parse_date_converts_aware_to_local():
+    value = datetime(2025, 1, 31, 12, 0, tzinfo=timezone.utc)
+    assert ti.parse_date(value) == value.astimezone().replace(tzinfo=None)
+
+@pytest.mark.parametrize("value", ["31/01/2025", "2025-13-01", "", None, "вчера"])
+def test_parse_date_rejects(value):
+    with pytest.raises(ValueError):
+        ti.parse_date(value)
+
+def test_map_header_aliases_and_first_match():
+    assert ti.map_header(["Дата", " Сумма ", "ВАЛЮТА", "category", "Тип", "amount"]) == {
+        "created_at": 0, "amount": 1, "currency": 2, "category": 3, "kind": 4,
+    }
+
+def test_map_header_requires_date_and_amount():
+    with pytest.raises(ti.ImportFormatError, match="дата, сумма"):
+        ti.map_header(["валюта", None])
+
+def test_sign_selects_kind():
+    assert ti.parse_row(["2025-01-31", "-12,50", "usd", "еда"], COLUMNS, WINDOW) == (
+        "expense", Decimal("12.50"), "USD", "Еда", datetime(2025, 1, 31),
+    )
+    assert ti.parse_row(["2025-01-31", "100", "", ""], COLUMNS, WINDOW) == (
+        "income", Decimal("100"), "TJS", "Другое", datetime(2025, 1, 31),
+    )
+
+def test_explicit_kind_rejects_negative_amount():
+    columns = dict(COLUMNS, kind=4)
+    assert ti.parse_row(["2025-01-31", "7", "", "Еда", "Расход"], columns, WINDOW)[0] == "expense"
+    with pytest.raises(ValueError, match="отрицательная"):
+        ti.parse_row(["2025-01-31", "-7", "", "Еда", "расход"], columns, WINDOW)
+
+@pytest.mark.parametrize("values, error", [
+    (["2025-01-31", "5", "XXX", ""], "валюта"),
+    (["2025-01-31", "-5", "", "Зарплата"], "категории"),
+    (["2205-01-31", "5", "", ""], "диапазона"),
+    (["2015-12-31", "5", "", ""], "диапазона"),
+])
+def test_parse_row_rejects(values, error):
+    with pytest.raises(ValueError, match=error):
+        ti.parse_row(values, COLUMNS, WINDOW)
+
+def test_import_window():
+    earliest, latest = ti.import_window(datetime(2026, 10, 18, 23, 59))
+    assert earliest == datetime(2026 - ti.IMPORT_MAX_AGE_YEARS, 1, 1)
+    # Завтрашний день ещё допустим: часовые пояса файла и сервера могут не совпадать
+    assert latest == datetime(2026, 10, 20)
+
+def test_read_csv_cp1251_semicolon():
+    data = "Дата;Сумма;Категория\n31.01.2025;-12,50;Еда\n".encode("cp1251")
+    assert list(ti.read_csv(data)) == [["Дата", "Сумма", "Категория"], ["31.01.2025", "-12,50", "Еда"]]
+
+def test_read_csv_utf8_bom_comma():
+    data = "﻿amount,currency,category,created_at\n12.5,TJS,Еда,2025-01-31T10:00:00\n".encode("utf-8")
+    assert list(ti.read_csv(data)) == [["amount", "currency", "category", "created_at"], ["12.5", "TJS", "Еда", "2025-01-31T10:00:00"]]
+
+def test_read_rows_rejects_unknown_extension():
+    with pytest.raises(ti.ImportFormatError):
+        ti.read_rows(b"", "report.pdf")
+
+def test_iter_chunks_collects_errors():
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = [["дата", "сумма"], [today, "1"], ["", ""], [today, "0"]] + [["??", "1"]] * 6 + [[today, "-2"]]
+    problems = {"invalid": 0, "errors": []}
+    chunks = list(ti.iter_chunks(rows, problems, chunk_size=1))
+    assert [[(line, kind, amount) for line, kind, amount, *_ in chunk] for chunk in chunks] == [
+        [(2, "income", Decimal("1"))], [(11, "expense", Decimal("2"))],
+    ]
+    assert problems["invalid"] == 7
+    assert problems["errors"][0] == "строка 4: некорректная сумма '0'"
+    assert len(problems["errors"]) == ti.IMPORT_MAX_ERRORS
+
+def test_iter_chunks_empty_file():
+    with pytest.raises(ti.ImportFormatError, match="пустой"):
+        list(ti.iter_chunks([], {"invalid": 0, "errors": []}))
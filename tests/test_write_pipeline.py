@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+import pytest
+from database import write_pipeline
+from database.write_pipeline import WritePipeline
+
+class FakeConn:
+    def __init__(self, fail_copy=False, bad_values=(), copy_delay=0):
+        self.fail_copy = fail_copy
+        self.bad_values = bad_values
+        self.copy_delay = copy_delay
+        self.copying = asyncio.Event()
+        self.rows = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copying.set()
+        await asyncio.sleep(self.copy_delay)
+        if self.fail_copy:
+            raise RuntimeError("copy failed")
+        self.rows.extend(records)
+
+    async def execute(self, sql, *values):
+        if values in self.bad_values:
+            raise ValueError(f"bad row {values}")
+        self.rows.append(values)
+
+class FakePool:
+    def __init__(self, conn, acquire_errors=0):
+        self.conn = conn
+        self.acquire_errors = acquire_errors
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        if self.acquire_errors:
+            self.acquire_errors -= 1
+            raise ConnectionError("pool closed")
+        yield self.conn
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+def counter(metric) -> float:
+    return metric._values.get((), 0.0)
+
+def test_batch_is_committed_with_copy():
+    async def scenario():
+        conn = FakeConn()
+        pipeline = WritePipeline(FakePool(conn), interval_ms=1)
+        pipeline.start()
+        await asyncio.gather(*(pipeline.insert("incomes", ("amount",), (i,)) for i in range(10)))
+        await pipeline.stop()
+        return conn.rows
+
+    assert sorted(run(scenario())) == [(i,) for i in range(10)]
+
+def test_failed_copy_falls_back_to_rows_and_fails_only_bad_row():
+    async def scenario():
+        conn = FakeConn(fail_copy=True, bad_values=((3,),))
+        pipeline = WritePipeline(FakePool(conn), interval_ms=1)
+        pipeline.start()
+        results = await asyncio.gather(
+            *(pipeline.insert("incomes", ("amount",), (i,)) for i in range(5)), return_exceptions=True,
+        )
+        await pipeline.stop()
+        return results
+
+    fallbacks = counter(write_pipeline.WRITE_FALLBACKS)
+    results = run(scenario())
+    assert [type(r) for r in results] == [type(None)] * 3 + [ValueError] + [type(None)]
+    assert counter(write_pipeline.WRITE_FALLBACKS) - fallbacks == 1
+
+def test_unavailable_pool_in_fallback_fails_every_waiter():
+    async def scenario():
+        # Первый acquire — COPY, второй — построчная запись: оба падают
+        pipeline = WritePipeline(FakePool(FakeConn(), acquire_errors=2), interval_ms=1)
+        pipeline.start()
+        results = await asyncio.gather(
+            *(pipeline.insert("incomes", ("amount",), (i,)) for i in range(4)), return_exceptions=True,
+        )
+        await pipeline.stop()
+        return results
+
+    assert all(isinstance(r, ConnectionError) for r in run(scenario()))
+
+def test_stop_keeps_draining_after_error():
+    async def scenario():
+        conn = FakeConn()
+        pipeline = WritePipeline(FakePool(conn, acquire_errors=2), max_rows=2, interval_ms=10_000)
+        # Таймер не запущен: всё дописывает stop(), первый пакет падает, остальные записываются
+        waiters = [asyncio.ensure_future(pipeline.insert("incomes", ("amount",), (i,))) for i in range(6)]
+        await asyncio.sleep(0)
+        await pipeline.stop()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return results, conn.rows
+
+    results, rows = run(scenario())
+    assert [isinstance(r, ConnectionError) for r in results] == [True, True, False, False, False, False]
+    assert rows == [(2,), (3,), (4,), (5,)]
+
+def test_stop_waits_for_flush_in_progress():
+    async def scenario():
+        conn = FakeConn(copy_delay=0.05)
+        pipeline = WritePipeline(FakePool(conn), interval_ms=1)
+        pipeline.start()
+        first = [asyncio.ensure_future(pipeline.insert("incomes", ("amount",), (i,))) for i in range(3)]
+        await conn.copying.wait()
+        # Пакет уже пишется; эти строки попадут в очередь после него
+        second = [asyncio.ensure_future(pipeline.insert("incomes", ("amount",), (i,))) for i in range(3, 5)]
+        await asyncio.sleep(0)
+        await pipeline.stop()
+        results = await asyncio.gather(*first, *second, return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await pipeline.insert("incomes", ("amount",), (9,))
+        return results, conn.rows
+
+    results, rows = run(scenario())
+    assert results == [None] * 5
+    assert sorted(rows) == [(i,) for i in range(5)]
+
+def test_metrics_are_counters_and_histograms():
+    from utils import metrics
+
+    async def scenario():
+        conn = FakeConn(fail_copy=True)
+        pipeline = WritePipeline(FakePool(conn), interval_ms=1)
+        write_pipeline._pipeline = pipeline
+        try:
+            pipeline.start()
+            await asyncio.gather(*(pipeline.insert("incomes", ("amount",), (i,)) for i in range(3)))
+            rendered = metrics.render()
+            await pipeline.stop()
+            return rendered
+        finally:
+            write_pipeline._pipeline = None
+
+    rows = counter(write_pipeline.WRITE_ROWS)
+    batches = counter(write_pipeline.WRITE_BATCHES)
+    fallbacks = counter(write_pipeline.WRITE_FALLBACKS)
+    flushes = write_pipeline.WRITE_FLUSH_SECONDS._values.get((), [None, 0, 0])[2]
+    rendered = run(scenario())
+    assert counter(write_pipeline.WRITE_ROWS) - rows == 3
+    assert counter(write_pipeline.WRITE_BATCHES) - batches == 1
+    assert counter(write_pipeline.WRITE_FALLBACKS) - fallbacks == 1
+    assert write_pipeline.WRITE_FLUSH_SECONDS._values[()][2] - flushes == 1
+    assert "# TYPE planbot_write_pipeline_rows_total counter" in rendered
+    assert "# TYPE planbot_write_pipeline_batch_rows histogram" in rendered
+    assert "planbot_write_pipeline_pending 0.0" in rendered
+    # Без конвейера очередь не экспортируется
+    assert not any(line.startswith("planbot_write_pipeline_pending ") for line in metrics.render().splitlines())
@@ -0,0 +1,284 @@
+import os
+import time
+import asyncio
+import logging
+import secrets
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict
+from aiohttp import FormData, MultipartWriter
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import InputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from utils import keyboards
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 1 — ответ хендлера (возвращённый, а не отправленный метод) уходит прямо в HTTP-ответе
+# на вебхук, без отдельного запроса к Bot API. Telegram ждёт окончания обработки апдейта
+WEBHOOK_REPLY_IN_RESPONSE = os.getenv("WEBHOOK_REPLY_IN_RESPONSE", "0") == "1"
+
+# Свой сервер Bot API (например, локальная заглушка), по умолчанию api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL")
+# Пул keep-alive соединений к Bot API
+BOT_API_POOL_SIZE = int(os.getenv("BOT_API_POOL_SIZE", 100))
+BOT_API_KEEPALIVE = float(os.getenv("BOT_API_KEEPALIVE", 60))
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат.
+# Общий лимит с запасом: скорость плюс всплеск не должны превышать 30 за секунду
+BOT_API_GLOBAL_RATE = float(os.getenv("BOT_API_GLOBAL_RATE", 25))
+BOT_API_GLOBAL_BURST = float(os.getenv("BOT_API_GLOBAL_BURST", 5))
+BOT_API_CHAT_RATE = float(os.getenv("BOT_API_CHAT_RATE", 1))
+BOT_API_CHAT_BURST = float(os.getenv("BOT_API_CHAT_BURST", 3))
+# Сколько раз повторять запрос после 429 Too Many Requests
+BOT_API_MAX_RETRIES = int(os.getenv("BOT_API_MAX_RETRIES", 3))
+
+# Полоса отправки: interactive (ответы пользователю) всегда обслуживается раньше bulk (рассылки)
+LANES = ("interactive", "bulk")
+_lane: ContextVar[str] = ContextVar("bot_api_lane", default="interactive")
+
+@contextmanager
+def bulk_lane():
+    """
+    Запросы к Bot API внутри блока идут низкоприоритетной полосой (рассылки напоминаний).
+    """
+    token = _lane.set("bulk")
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def method_fields(bot: Bot, method: TelegramMethod, files: Dict[str, InputFile]):
+    """
+    Поля запроса к Bot API, как у aiogram, но клавиатура из реестра utils.keyboards
+    не сериализуется заново, а берётся готовым JSON.
+    """
+    markup_json = keyboards.serialized(getattr(method, "reply_markup", None))
+    if markup_json is not None:
+        method = method.model_copy(update={"reply_markup": None})
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files)
+        if value:
+            yield key, value
+    if markup_json is not None:
+        yield "reply_markup", markup_json
+
+class PreparedMarkupSession(AiohttpSession):
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        form = FormData(quote_fields=False)
+        files: Dict[str, InputFile] = {}
+        for key, value in method_fields(bot, method, files):
+            form.add_field(key, value)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
+
+class ReplyInResponseHandler(SimpleRequestHandler):
+    """
+    Вебхук, который обрабатывает апдейт до ответа Telegram и возвращает метод,
+    который вернул хендлер (например, `return message.answer(...)`), прямо в ответе.
+    """
+    def __init__(self, dispatcher, bot, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, **kwargs)
+
+    def _build_response_writer(self, bot: Bot, result) -> MultipartWriter:
+        writer = MultipartWriter("form-data", boundary=f"webhookBoundary{secrets.token_urlsafe(16)}")
+        if not result:
+            return writer
+        payload = writer.append(result.__api_method__)
+        payload.set_content_disposition("form-data", name="method")
+        files: Dict[str, InputFile] = {}
+        for key, value in method_fields(bot, result, files):
+            payload = writer.append(value)
+            payload.set_content_disposition("form-data", name=key)
+        for key, value in files.items():
+            payload = writer.append(value.read(bot))
+            payload.set_content_disposition("form-data", name=key, filename=value.filename or key)
+        return writer
+
+class TokenBucket:
+    """
+    Token bucket с очередями ожидания по полосам: пока есть ждущие interactive,
+    bulk токенов не получает. Токены выдаёт одна задача, по очереди и без гонок.
+    clock и sleep подменяются в тестах.
+    """
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.waiters = {lane: deque() for lane in LANES}
+        self._pump_task = None
+
+    def _take(self) -> float:
+        """
+        Забирает токен, если он есть.
+        :return: 0, если токен выдан, иначе сколько секунд ждать следующего
+        """
+        now = self.clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def _next_waiter(self):
+        for lane in LANES:
+            waiters = self.waiters[lane]
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                return waiters
+        return None
+
+    async def acquire(self, lane: str = "interactive"):
+        if self._next_waiter() is None and self._take() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[lane].append(future)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        while True:
+            waiters = self._next_waiter()
+            if waiters is None:
+                return
+            delay = self._take()
+            if delay > 0:
+                await self.sleep(delay)
+                continue
+            waiters.popleft().set_result(None)
+
+    def pause(self, seconds: float):
+        # После 429: до paused_until токены не выдаются, накопленный запас сгорает
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+    def available(self) -> float:
+        """
+        Сколько токенов можно забрать сейчас, не забирая их.
+        """
+        now = self.clock()
+        if now < self.paused_until:
+            return 0.0
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def idle(self) -> bool:
+        return self._next_waiter() is None and self.available() >= self.capacity
+
+class RateLimiter:
+    """
+    Общий лимит бота и лимит на каждый чат. Сначала ждём токен чата, потом общий,
+    чтобы запросы в «занятый» чат не держали общие токены.
+    """
+    def __init__(self, global_rate: float = BOT_API_GLOBAL_RATE, global_burst: float = BOT_API_GLOBAL_BURST,
+                 chat_rate: float = BOT_API_CHAT_RATE, chat_burst: float = BOT_API_CHAT_BURST,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock, sleep)
+        self.chats: Dict[Any, TokenBucket] = {}
+        self._acquired = 0
+
+    def _chat(self, chat_id) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            bucket = self.chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock, self.sleep)
+        return bucket
+
+    async def acquire(self, chat_id, lane: str = "interactive"):
+        self._acquired += 1
+        if self._acquired % 1000 == 0:
+            # Забываем чаты, которым сейчас ничего не отправляется
+            for key in [key for key, bucket in self.chats.items() if bucket.idle()]:
+                del self.chats[key]
+        await self._chat(chat_id).acquire(lane)
+        await self.global_bucket.acquire(lane)
+
+    def pause(self, chat_id, seconds: float):
+        self._chat(chat_id).pause(seconds)
+
+    def retry_after(self, chat_id, seconds: float):
+        """
+        Пауза после 429. Telegram не сообщает, какой лимит превышен: если у чата ещё оставался
+        запас токенов, свой лимит он не исчерпал — превышен общий лимит бота, и пауза
+        ставится на все чаты. Запрос без чата тоже упёрся в общий лимит.
+        """
+        if chat_id is None or self._chat(chat_id).available() >= 1:
+            self.global_bucket.pause(seconds)
+        if chat_id is not None:
+            self.pause(chat_id, seconds)
+
+    def waiting(self) -> dict:
+        return {lane: len(self.global_bucket.waiters[lane]) for lane in LANES}
+
+# Один бот на процесс — и один общий ограничитель
+default_limiter = RateLimiter()
+
+BOT_API_WAITING = metrics.Gauge(
+    "planbot_bot_api_waiting", "Запросы, ждущие общего лимита Bot API, по полосам", ("lane",),
+    function=lambda: {(lane,): count for lane, count in default_limiter.waiting().items()},
+)
+BOT_API_REQUESTS = metrics.Counter(
+    "planbot_bot_api_requests_total", "Запросы к Bot API по методу и полосе", ("method", "lane"),
+)
+BOT_API_RETRY_AFTER = metrics.Counter(
+    "planbot_bot_api_retry_after_total", "Ответы 429 Too Many Requests от Bot API", ("lane",),
+)
+BOT_API_THROTTLE_SECONDS = metrics.Histogram(
+    "planbot_bot_api_throttle_seconds", "Ожидание в ограничителе скорости перед запросом", ("lane",),
+)
+
+class ThrottledSession(PreparedMarkupSession):
+    """
+    Сессия Bot API для main.create_app(): пул keep-alive соединений, общий и
+    по-чатовый token bucket, полосы приоритета (см. bulk_lane) и повтор после 429
+    через retry_after. Ограничиваются только запросы с chat_id (отправка и
+    редактирование сообщений), answerCallbackQuery и служебные методы идут сразу.
+    """
+    def __init__(self, limiter: RateLimiter = None, max_retries: int = BOT_API_MAX_RETRIES, **kwargs: Any):
+        if BOT_API_URL and "api" not in kwargs:
+            kwargs["api"] = TelegramAPIServer.from_base(BOT_API_URL)
+        kwargs.setdefault("limit", BOT_API_POOL_SIZE)
+        super().__init__(**kwargs)
+        self._connector_init["keepalive_timeout"] = BOT_API_KEEPALIVE
+        self.limiter = limiter or default_limiter
+        self.max_retries = max_retries
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int = None):
+        chat_id = getattr(method, "chat_id", None)
+        lane = _lane.get()
+        BOT_API_REQUESTS.inc(method.__api_method__, lane)
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                started = time.perf_counter()
+                await self.limiter.acquire(chat_id, lane)
+                BOT_API_THROTTLE_SECONDS.observe(time.perf_counter() - started, lane)
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramRetryAfter as e:
+                BOT_API_RETRY_AFTER.inc(lane)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning("Bot API 429 (%s, чат %s): повтор через %s с", method.__api_method__, chat_id, e.retry_after)
+                self.limiter.retry_after(chat_id, e.retry_after)
+                if chat_id is None:
+                    # Запросы без чата не проходят через ограничитель — ждём сами
+                    await self.limiter.sleep(e.retry_after)
@@ -0,0 +1,40 @@
+import io
+import csv
+import asyncio
+from database import db
+from database import export
+from utils import metrics
+from utils import report_pool
+
+async def generate_csv_export(user_id: int) -> io.BytesIO:
+    """
+    Выгружает все доходы и расходы пользователя в CSV (UTF-8 с BOM, чтобы Excel
+    правильно открыл кириллицу). Строки читаются потоково, пачками.
+    :param user_id: внутренний users.id
+    :return: BytesIO с CSV-файлом
+    :raises report_pool.ReportQueueFull: если очередь на генерацию отчётов заполнена
+    """
+    data = await metrics.timed_report("csv", report_pool.run(render_csv_export, user_id))
+    return io.BytesIO(data)
+
+def render_csv_export(user_id: int) -> bytes:
+    return asyncio.run(_render_csv_export(user_id))
+
+async def _render_csv_export(user_id: int) -> bytes:
+    output = io.BytesIO()
+    text = io.TextIOWrapper(output, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(["kind", "amount", "currency", "category", "created_at"])
+    conn = await db.connect()
+    try:
+        for kind, table in (("income", "incomes"), ("expense", "expenses")):
+            async with conn.transaction():
+                async for chunk in export.iter_transaction_chunks(conn, table, user_id):
+                    writer.writerows(
+                        (kind, amount, currency, category, created_at.isoformat(sep=" "))
+                        for amount, currency, category, created_at in chunk
+                    )
+    finally:
+        await conn.close()
+    text.flush()
+    return output.getvalue()
@@ -1,136 +1,143 @@
 import io
-import pandas as pd
-from datetime import datetime
-from xlsxwriter.utility import xl_rowcol_to_cell
+import asyncio
+import xlsxwriter
+from database import db
+from database import export
+from database import stats
+from utils import metrics
+from utils import report_pool
 
-async def generate_excel_report(user_id: int, incomes: list, expenses: list) -> io.BytesIO:
+async def generate_excel_report(user_id: int, summary: dict = None) -> io.BytesIO:
     """
     Создает Excel-файл с доходами и расходами пользователя по дням и категориям.
-    :param user_id: Telegram user id
-    :param incomes: список доходов (dict с amount, category, created_at)
-    :param expenses: список расходов (dict с amount, category, created_at)
+    Рендеринг выполняется в пуле воркеров (utils.report_pool), event loop не блокируется.
+    :param user_id: внутренний users.id
+    :param summary: помесячные итоги из database.stats.fetch_summary; если не переданы — читаются воркером
     :return: BytesIO с Excel-файлом
+    :raises report_pool.ReportQueueFull: если очередь на генерацию отчётов заполнена
     """
-    # Преобразуем данные в DataFrame
-    df_incomes = pd.DataFrame(incomes) if incomes else pd.DataFrame()
-    df_expenses = pd.DataFrame(expenses) if expenses else pd.DataFrame()
-    
-    # Функция для группировки по дате и категории
-    def group_by_day_and_category(df, value_col="amount"):
-        if df.empty:
-            return pd.DataFrame(columns=["Дата", "Категория", value_col])
-        df["Дата"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d")
-        grouped = df.groupby(["Дата", "category"])[value_col].sum().reset_index()
-        return grouped
-    
-    # Группировка по дням и категориям
-    income_table = group_by_day_and_category(df_incomes)
-    expense_table = group_by_day_and_category(df_expenses)
-    
-    # Добавим также группировку по месяцам для сводной информации
-    if not df_incomes.empty:
-        df_incomes['Месяц'] = pd.to_datetime(df_incomes['created_at']).dt.to_period('M')
-    if not df_expenses.empty:
-        df_expenses['Месяц'] = pd.to_datetime(df_expenses['created_at']).dt.to_period('M')
-    
-    # Группировка по месяцам
-    incomes_by_month = df_incomes.groupby('Месяц').agg({'amount': 'sum'}).rename(columns={'amount': 'Доход'}) if not df_incomes.empty else pd.DataFrame()
-    expenses_by_month = df_expenses.groupby('Месяц').agg({'amount': 'sum'}).rename(columns={'amount': 'Расход'}) if not df_expenses.empty else pd.DataFrame()
-    
-    # Итоговый DataFrame для месячной сводки
-    monthly_report = pd.concat([incomes_by_month, expenses_by_month], axis=1).fillna(0)
-    monthly_report['Баланс'] = monthly_report['Доход'] - monthly_report['Расход']
-    
-    # Запись в Excel с улучшенным форматированием
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        # Лист 1: Сводка по месяцам
-        monthly_report.to_excel(writer, sheet_name='Сводка по месяцам')
-        
-        # Получаем рабочий лист для форматирования
-        workbook = writer.book
-        worksheet = writer.sheets['Сводка по месяцам']
-        
-        # Определяем форматы
-        header_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'valign': 'vcenter',
-            'fg_color': '#4B88CB',
-            'font_color': 'white',
-            'border': 1
-        })
-        
-        income_format = workbook.add_format({
-            'num_format': '#,##0.00',
-            'align': 'right',
-            'fg_color': '#E6F2FF'
-        })
-        
-        expense_format = workbook.add_format({
-            'num_format': '#,##0.00',
-            'align': 'right',
-            'fg_color': '#FFECEC'
-        })
-        
-        balance_format = workbook.add_format({
-            'num_format': '#,##0.00',
-            'align': 'right',
-            'bold': True
-        })
-        
-        # Применяем форматирование к заголовкам
-        for col_num, value in enumerate(['', 'Месяц', 'Доход', 'Расход', 'Баланс']):
-            worksheet.write(0, col_num, value, header_format)
-        
-        # Устанавливаем ширину столбцов
-        worksheet.set_column('A:A', 5)  # Столбец с индексом
-        worksheet.set_column('B:B', 15) # Столбец с месяцем
-        worksheet.set_column('C:E', 12) # Столбцы с суммами
-        
-        # Лист 2: Доходы по дням и категориям
-        if not income_table.empty:
-            income_table.to_excel(writer, sheet_name='Доходы по дням', index=False)
-            worksheet_income = writer.sheets['Доходы по дням']
-            
-            # Форматируем заголовки
-            for col_num, value in enumerate(['Дата', 'Категория', 'amount']):
-                worksheet_income.write(0, col_num, value, header_format)
-                
-            # Форматируем данные
-            for row_num in range(1, len(income_table) + 1):
-                worksheet_income.write_string(row_num, 0, str(income_table.iloc[row_num-1]['Дата']))
-                worksheet_income.write_string(row_num, 1, str(income_table.iloc[row_num-1]['category']))
-                worksheet_income.write_number(row_num, 2, float(income_table.iloc[row_num-1]['amount']), income_format)
-                
-            worksheet_income.set_column('A:A', 15)  # Дата
-            worksheet_income.set_column('B:B', 20)  # Категория
-            worksheet_income.set_column('C:C', 12)  # Сумма
-        
-        # Лист 3: Расходы по дням и категориям
-        if not expense_table.empty:
-            expense_table.to_excel(writer, sheet_name='Расходы по дням', index=False)
-            worksheet_expense = writer.sheets['Расходы по дням']
-            
-            # Форматируем заголовки
-            for col_num, value in enumerate(['Дата', 'Категория', 'amount']):
-                worksheet_expense.write(0, col_num, value, header_format)
-                
-            # Форматируем данные
-            for row_num in range(1, len(expense_table) + 1):
-                worksheet_expense.write_string(row_num, 0, str(expense_table.iloc[row_num-1]['Дата']))
-                worksheet_expense.write_string(row_num, 1, str(expense_table.iloc[row_num-1]['category']))
-                worksheet_expense.write_number(row_num, 2, float(expense_table.iloc[row_num-1]['amount']), expense_format)
-                
-            worksheet_expense.set_column('A:A', 15)  # Дата
-            worksheet_expense.set_column('B:B', 20)  # Категория
-            worksheet_expense.set_column('C:C', 12)  # Сумма
-            
-        # Лист 4: Детальные данные (если нужны)
-        if not df_incomes.empty:
-            df_incomes.to_excel(writer, sheet_name='Детальные доходы', index=False)
-        if not df_expenses.empty:
-            df_expenses.to_excel(writer, sheet_name='Детальные расходы', index=False)
-    
-    output.seek(0)
-    return output
+    data = await metrics.timed_report("xlsx", report_pool.run(render_excel_report, user_id, summary))
+    return io.BytesIO(data)
+
+def render_excel_report(user_id: int, summary: dict = None) -> bytes:
+    """
+    Синхронная точка входа для воркера: открывает своё соединение с базой
+    и потоково пишет книгу.
+    """
+    return asyncio.run(_render_excel_report(user_id, summary))
+
+async def _render_excel_report(user_id: int, summary: dict = None) -> bytes:
+    conn = await db.connect()
+    try:
+        if summary is None:
+            summary = await stats.fetch_summary(conn, user_id)
+        output = io.BytesIO()
+        # constant_memory: строки сбрасываются на диск по мере записи, поэтому каждый
+        # лист заполняется строго сверху вниз, один раз
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+        await write_workbook(workbook, conn, user_id, summary)
+        workbook.close()
+        return output.getvalue()
+    finally:
+        await conn.close()
+
+async def write_workbook(workbook, conn, user_id: int, summary: dict):
+    income_by_month = summary["income_by_month"]
+    expense_by_month = summary["expense_by_month"]
+    months = sorted(set(income_by_month) | set(expense_by_month))
+
+    # Определяем форматы
+    header_format = workbook.add_format({
+        'bold': True,
+        'align': 'center',
+        'valign': 'vcenter',
+        'fg_color': '#4B88CB',
+        'font_color': 'white',
+        'border': 1
+    })
+
+    income_format = workbook.add_format({
+        'num_format': '#,##0.00',
+        'align': 'right',
+        'fg_color': '#E6F2FF'
+    })
+
+    expense_format = workbook.add_format({
+        'num_format': '#,##0.00',
+        'align': 'right',
+        'fg_color': '#FFECEC'
+    })
+
+    balance_format = workbook.add_format({
+        'num_format': '#,##0.00',
+        'align': 'right',
+        'bold': True
+    })
+
+    datetime_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm'})
+
+    currency = summary["base_currency"]
+
+    # Лист 1: Сводка по месяцам (в базовой валюте пользователя)
+    worksheet = workbook.add_worksheet('Сводка по месяцам')
+    worksheet.set_column('A:A', 15)  # Столбец с месяцем
+    worksheet.set_column('B:D', 14)  # Столбцы с суммами
+    worksheet.write_row(0, 0, ['Месяц', f'Доход, {currency}', f'Расход, {currency}', f'Баланс, {currency}'], header_format)
+    for row_num, month in enumerate(months, start=1):
+        income = income_by_month.get(month, 0)
+        expense = expense_by_month.get(month, 0)
+        worksheet.write_string(row_num, 0, month)
+        worksheet.write_number(row_num, 1, float(income), income_format)
+        worksheet.write_number(row_num, 2, float(expense), expense_format)
+        worksheet.write_number(row_num, 3, float(income - expense), balance_format)
+
+    # Лист 2: Итоги в исходных валютах и курсы, по которым они пересчитаны
+    ws = workbook.add_worksheet('По валютам')
+    ws.set_column('A:A', 10)
+    ws.set_column('B:D', 14)
+    ws.write_row(0, 0, ['Валюта', 'Доход', 'Расход', f'Курс к {currency}'], header_format)
+    rates = summary["rates"]
+    for row_num, (cur, totals) in enumerate(sorted(summary["by_currency"].items()), start=1):
+        ws.write_string(row_num, 0, cur)
+        ws.write_number(row_num, 1, float(totals["income"]), income_format)
+        ws.write_number(row_num, 2, float(totals["expense"]), expense_format)
+        if cur in rates:
+            ws.write_number(row_num, 3, float(rates[cur] / rates[currency]))
+        else:
+            ws.write_string(row_num, 3, 'нет курса')
+
+    # Листы 3 и 4: Доходы и расходы по дням и категориям (агрегируются и пересчитываются в SQL)
+    for sheet_name, table, amount_format in (
+        ('Доходы по дням', 'incomes', income_format),
+        ('Расходы по дням', 'expenses', expense_format),
+    ):
+        rows = await export.fetch_daily_totals(conn, table, user_id, summary)
+        if not rows:
+            continue
+        ws = workbook.add_worksheet(sheet_name)
+        ws.set_column('A:A', 15)  # Дата
+        ws.set_column('B:B', 20)  # Категория
+        ws.set_column('C:C', 12)  # Сумма
+        ws.write_row(0, 0, ['Дата', 'Категория', f'Сумма, {currency}'], header_format)
+        for row_num, (day, category, total) in enumerate(rows, start=1):
+            ws.write_string(row_num, 0, day)
+            ws.write(row_num, 1, category)
+            ws.write_number(row_num, 2, float(total), amount_format)
+
+    # Листы 5 и 6: Детальные данные в исходных валютах — потоково из серверного курсора, пачками
+    for sheet_name, table in (('Детальные доходы', 'incomes'), ('Детальные расходы', 'expenses')):
+        ws = None
+        row_num = 0
+        async with conn.transaction():
+            async for chunk in export.iter_transaction_chunks(conn, table, user_id):
+                if ws is None:
+                    ws = workbook.add_worksheet(sheet_name)
+                    ws.set_column('A:C', 12)
+                    ws.set_column('D:D', 18)
+                    ws.write_row(0, 0, ['amount', 'currency', 'category', 'created_at'])
+                for amount, currency, category, created_at in chunk:
+                    row_num += 1
+                    ws.write_number(row_num, 0, float(amount))
+                    ws.write(row_num, 1, currency)
+                    ws.write(row_num, 2, category)
+                    ws.write_datetime(row_num, 3, created_at, datetime_format)
@@ -0,0 +1,29 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from utils.metrics import HANDLER_SECONDS, HANDLER_ERRORS
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: к этому моменту aiogram уже выбрал хендлер (data["handler"]),
+    поэтому время и ошибки считаются по конкретной функции. Роутеры в боте безымянные
+    (по одному на модуль), так что вместо имени роутера берётся модуль хендлера.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        labels = (getattr(callback, "__module__", ""), getattr(callback, "__name__", ""))
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, *labels)
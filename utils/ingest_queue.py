@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict
+from aiohttp import web
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE = os.getenv("INGEST_QUEUE", "0") == "1"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 32))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 5000))
+# Сколько ждать места в очереди, прежде чем ответить Telegram 503 (он повторит доставку позже)
+INGEST_PUT_TIMEOUT = float(os.getenv("INGEST_PUT_TIMEOUT", 1))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", 25))
+
+# Работающая очередь процесса — для /metrics
+_active = None
+
+INGEST_UPDATES = metrics.Counter(
+    "planbot_ingest_updates_total",
+    "Апдейты очереди (INGEST_QUEUE=1): accepted, rejected (ответы 503), processed, failed", ("result",),
+)
+INGEST_WAIT_SECONDS = metrics.Histogram(
+    "planbot_ingest_queue_wait_seconds", "Ожидание апдейта в очереди до начала обработки",
+)
+
+def ordering_key(update: Dict[str, Any]):
+    """
+    Ключ упорядочивания апдейта — id отправителя (from.id), от него зависят FSM-сценарии.
+    Апдейты без отправителя упорядочивать не нужно.
+    """
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"].get("id")
+    return ("update", update.get("update_id"))
+
+class IngestQueue:
+    """
+    Ограниченная очередь входящих апдейтов.
+
+    Апдейты одного пользователя обрабатываются строго по порядку (у ключа есть
+    своя очередь, и её в каждый момент держит не больше одного воркера), апдейты
+    разных пользователей — параллельно в INGEST_WORKERS воркерах.
+    """
+    def __init__(self, dispatcher, bot, workers: int = INGEST_WORKERS, maxsize: int = INGEST_QUEUE_SIZE, **data):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.data = data
+        self.workers = workers
+        self.maxsize = maxsize
+        self.size = 0
+        self._per_key: Dict[Any, deque] = {}
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._tasks = []
+        self._accepting = True
+
+    def start(self):
+        global _active
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            _active = self
+
+    async def put(self, update: Dict[str, Any], timeout: float = INGEST_PUT_TIMEOUT) -> bool:
+        """
+        :return: False, если очередь заполнена (или идёт остановка) и место не освободилось за timeout
+        """
+        if not self._accepting:
+            INGEST_UPDATES.inc("rejected")
+            return False
+        if self.size >= self.maxsize:
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self.size < self.maxsize), timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    INGEST_UPDATES.inc("rejected")
+                    return False
+        key = ordering_key(update)
+        items = self._per_key.get(key)
+        if items is None:
+            items = self._per_key[key] = deque()
+            self._ready.put_nowait(key)
+        items.append((time.monotonic(), update))
+        self.size += 1
+        INGEST_UPDATES.inc("accepted")
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            items = self._per_key[key]
+            enqueued_at, update = items.popleft()
+            INGEST_WAIT_SECONDS.observe(time.monotonic() - enqueued_at)
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+                INGEST_UPDATES.inc("processed")
+            except Exception:
+                INGEST_UPDATES.inc("failed")
+                logger.exception("Ошибка обработки апдейта из очереди")
+            finally:
+                self.size -= 1
+                # Следующий апдейт этого пользователя — в конец общей очереди, чтобы не занимать воркер
+                if items:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._per_key[key]
+                async with self._space:
+                    self._space.notify()
+                self._ready.task_done()
+
+    async def drain(self, timeout: float = INGEST_DRAIN_TIMEOUT):
+        """
+        Перестаёт принимать апдейты, дожидается обработки очереди и останавливает воркеров.
+        """
+        global _active
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь апдейтов не успела опустеть: осталось %d", self.size)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if _active is self:
+            _active = None
+
+    def oldest_age(self) -> float:
+        now = time.monotonic()
+        return max((now - items[0][0] for items in self._per_key.values() if items), default=0.0)
+
+    def max_user_backlog(self) -> int:
+        return max((len(items) for items in self._per_key.values()), default=0)
+
+def _active_value(read):
+    # Без работающей очереди (INGEST_QUEUE=0) значения не экспортируются
+    return lambda: None if _active is None else read(_active)
+
+metrics.Gauge(
+    "planbot_ingest_queue_depth", "Апдейты в очереди, включая обрабатываемые",
+    function=_active_value(lambda queue: queue.size),
+)
+metrics.Gauge(
+    "planbot_ingest_queue_users", "Пользователи с апдейтами в очереди",
+    function=_active_value(lambda queue: len(queue._per_key)),
+)
+metrics.Gauge(
+    "planbot_ingest_queue_max_user_backlog", "Самая длинная очередь одного пользователя",
+    function=_active_value(lambda queue: queue.max_user_backlog()),
+)
+metrics.Gauge(
+    "planbot_ingest_queue_oldest_age_seconds", "Возраст самого старого необработанного апдейта",
+    function=_active_value(lambda queue: queue.oldest_age()),
+)
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    Вебхук, который сразу отвечает Telegram 200 и кладёт апдейт в IngestQueue.
+    Если очередь заполнена — отвечает 503, и Telegram доставит апдейт повторно.
+    """
+    def __init__(self, dispatcher, bot, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.queue = IngestQueue(dispatcher, bot, **self.data)
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        async def on_startup(app: web.Application):
+            self.queue.start()
+
+        app.on_startup.append(on_startup)
+        # Дренируем очередь до закрытия сессии бота (_handle_close) и пула соединений
+        app.on_shutdown.append(self._drain)
+        super().register(app, path=path, **kwargs)
+
+    async def _drain(self, app: web.Application):
+        await self.queue.drain()
+
+    async def _handle_request_background(self, bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if not await self.queue.put(update):
+            return web.Response(status=503, text="Queue is full")
+        return web.json_response({}, dumps=bot.session.json_dumps)
@@ -1,15 +1,34 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+import json
+from typing import Optional
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+# Реестр неизменяемых клавиатур: id(клавиатуры) -> (клавиатура, готовый JSON для Bot API).
+# Клавиатуры строятся и сериализуются один раз при импорте; сессия бота (utils.bot_session)
+# подставляет готовый JSON вместо повторной сериализации. Зарегистрированные клавиатуры не изменять
+_prepared = {}
+
+def prepared(markup):
+    _prepared[id(markup)] = (markup, json.dumps(markup.model_dump(exclude_none=True), ensure_ascii=False))
+    return markup
+
+def serialized(markup) -> Optional[str]:
+    """
+    :return: готовый JSON клавиатуры или None, если она не из реестра
+    """
+    item = _prepared.get(id(markup))
+    if item is None or item[0] is not markup:
+        return None
+    return item[1]
+
+INCOME_CATEGORIES = ["Зарплата", "Фриланс", "Подарок", "Продажа", "Бонус", "Стипендия", "Инвестиции", "Другое"]
+EXPENSE_CATEGORIES = ["Еда", "Транспорт", "Коммуналка", "Связь", "Одежда", "Здоровье", "Образование", "Развлечения", "Подарки", "Путешествия", "Дом", "Дети", "Другое"]
+REMINDER_HOURS = range(8, 21)
+REMINDER_MINUTES = (0, 15, 30, 45)
+# Совпадает с database.fx.SUPPORTED_CURRENCIES (модуль базы здесь не импортируется)
+CURRENCIES = ("TJS", "USD", "EUR", "RUB")
 
 def main_menu_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Добавить доход"), KeyboardButton(text="Добавить расход")],
-            [KeyboardButton(text="Статистика")],
-            [KeyboardButton(text="Советы")],
-            [KeyboardButton(text="Главное меню")],
-        ],
-        resize_keyboard=True
-    )
+    return MAIN_MENU_KB
 
 # Универсальная функция для сценариев
 
@@ -18,3 +37,72 @@ def scenario_kb(options):
         keyboard=[[KeyboardButton(text=opt)] for opt in options] + [[KeyboardButton(text="Главное меню")]],
         resize_keyboard=True
     )
+
+MAIN_MENU_KB = prepared(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Добавить доход"), KeyboardButton(text="Добавить расход")],
+        [KeyboardButton(text="Статистика"), KeyboardButton(text="История")],
+        [KeyboardButton(text="Советы")],
+        [KeyboardButton(text="Главное меню")],
+    ],
+    resize_keyboard=True
+))
+INCOME_CATEGORIES_KB = prepared(scenario_kb(INCOME_CATEGORIES))
+EXPENSE_CATEGORIES_KB = prepared(scenario_kb(EXPENSE_CATEGORIES))
+
+# Выбор времени напоминания: часы и минуты для каждого часа
+REMINDER_HOURS_KB = prepared(InlineKeyboardMarkup(
+    inline_keyboard=[[
+        InlineKeyboardButton(text=f"{h:02d}:00", callback_data=f"set_hour_{h}") for h in REMINDER_HOURS
+    ]]
+))
+REMINDER_MINUTES_KB = {
+    hour: prepared(InlineKeyboardMarkup(
+        inline_keyboard=[[
+            InlineKeyboardButton(text=f"{minute:02d}", callback_data=f"set_minute_{hour}_{minute}") for minute in REMINDER_MINUTES
+        ]]
+    ))
+    for hour in REMINDER_HOURS
+}
+# Повтор напоминания: set_repeat_<daily|weekly|monthly|none>
+REMINDER_REPEAT_KB = prepared(InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="Не повторять", callback_data="set_repeat_none")],
+        [InlineKeyboardButton(text="Каждый день", callback_data="set_repeat_daily"),
+         InlineKeyboardButton(text="Каждую неделю", callback_data="set_repeat_weekly"),
+         InlineKeyboardButton(text="Каждый месяц", callback_data="set_repeat_monthly")],
+    ]
+))
+
+# Выбор базовой валюты отчётов (/currency)
+BASE_CURRENCY_KB = prepared(InlineKeyboardMarkup(
+    inline_keyboard=[[
+        InlineKeyboardButton(text=currency, callback_data=f"base_currency:{currency}") for currency in CURRENCIES
+    ]]
+))
+
+# Выбор периода под сводкой «Статистика»
+STATS_PERIOD_KB = prepared(InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="Этот месяц", callback_data="stats:month"),
+         InlineKeyboardButton(text="Прошлый месяц", callback_data="stats:prev")],
+        [InlineKeyboardButton(text="Этот год", callback_data="stats:year"),
+         InlineKeyboardButton(text="Свой период", callback_data="stats:custom")],
+        [InlineKeyboardButton(text="История операций", callback_data="hist:new")],
+    ]
+))
+
+def history_kb(kind: str, older: str = None, newer: str = None):
+    """
+    Листание истории: kind — "i" (доходы) или "e" (расходы), older/newer — курсоры соседних страниц.
+    """
+    nav = []
+    if newer is not None:
+        nav.append(InlineKeyboardButton(text="« Новее", callback_data=f"hist:{kind}:n:{newer}"))
+    if older is not None:
+        nav.append(InlineKeyboardButton(text="Старее »", callback_data=f"hist:{kind}:o:{older}"))
+    switch = [
+        InlineKeyboardButton(text=("• " if kind == code else "") + label, callback_data=f"hist:{code}")
+        for code, label in (("i", "Доходы"), ("e", "Расходы"))
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[nav, switch] if nav else [switch])
@@ -0,0 +1,192 @@
+import os
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+
+# Метрики в формате Prometheus на /metrics того же aiohttp-приложения, что и вебхук.
+# Всё считается в процессе, внешний клиент или агент не нужен.
+# Модуль импортируется и в воркерах отчётов, поэтому aiohttp/aiogram здесь не подключаются
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def samples(self):
+        """
+        :return: итератор (имя, имена меток, значения меток, значение)
+        """
+        return iter(())
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, self.labelnames, labels, value
+
+class Gauge(Metric):
+    """
+    Текущее значение. Если задана function, значения снимаются в момент запроса
+    /metrics: она возвращает число или dict {значения меток: число}.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function: Callable = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values = {}
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        values = self._values
+        if self.function is not None:
+            values = self.function()
+            if values is None:
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        for labels, value in values.items():
+            yield self.name, self.labelnames, labels, value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # значения меток -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._values = {}
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        bucket_labelnames = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", bucket_labelnames, labels + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, total
+            yield f"{self.name}_count", self.labelnames, labels, count
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+async def handle_metrics(request):
+    from aiohttp import web
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+def setup_metrics(app):
+    if METRICS_ENABLED:
+        app.router.add_get(METRICS_PATH, handle_metrics)
+
+# === Хендлеры ===
+HANDLER_SECONDS = Histogram(
+    "planbot_handler_duration_seconds", "Время выполнения хендлера", ("router", "handler"),
+)
+HANDLER_ERRORS = Counter(
+    "planbot_handler_errors_total", "Исключения в хендлерах", ("router", "handler"),
+)
+
+# === База данных ===
+DB_QUERY_SECONDS = Histogram(
+    "planbot_db_query_duration_seconds", "Время выполнения SQL-запроса", ("operation",),
+)
+DB_QUERY_ERRORS = Counter(
+    "planbot_db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ("operation",),
+)
+DB_ACQUIRE_SECONDS = Histogram(
+    "planbot_db_pool_acquire_seconds", "Ожидание соединения из пула",
+)
+
+def observe_query(record):
+    """
+    Колбэк asyncpg Connection.add_query_logger: операция — первое слово запроса.
+    """
+    words = record.query.split(None, 1)
+    operation = words[0].lower() if words else ""
+    DB_QUERY_SECONDS.observe(record.elapsed, operation)
+    if record.exception is not None:
+        DB_QUERY_ERRORS.inc(operation)
+
+# === Отчёты ===
+REPORT_RENDER_SECONDS = Histogram(
+    "planbot_report_render_seconds", "Время генерации отчёта, включая ожидание в очереди", ("kind",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+REPORT_SIZE_BYTES = Histogram(
+    "planbot_report_size_bytes", "Размер готового отчёта", ("kind",),
+    buckets=(10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000, 50_000_000),
+)
+REPORT_ERRORS = Counter(
+    "planbot_report_errors_total", "Ошибки генерации отчёта", ("kind",),
+)
+
+async def timed_report(kind: str, rendering: Awaitable[bytes]) -> bytes:
+    """
+    Ждёт генерацию отчёта и записывает её время и размер результата.
+    """
+    started = time.perf_counter()
+    try:
+        data = await rendering
+    except Exception:
+        REPORT_ERRORS.inc(kind)
+        raise
+    REPORT_RENDER_SECONDS.observe(time.perf_counter() - started, kind)
+    REPORT_SIZE_BYTES.observe(len(data), kind)
+    return data
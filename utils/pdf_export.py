@@ -1,162 +1,194 @@
 import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+import os
+import asyncio
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import pandas as pd
-from datetime import datetime
+from database import db
+from database import export
+from database import stats
+from utils import metrics
+from utils import report_pool
 
-# Используем стандартные шрифты ReportLab, которые всегда доступны
-# В ReportLab есть встроенные шрифты: Helvetica, Helvetica-Bold, Courier, Times-Roman и т.д.
+# По умолчанию используются встроенные шрифты ReportLab (Helvetica), в них нет кириллицы.
+# Если указан TTF-шрифт с кириллицей (например, DejaVuSans), он регистрируется и используется
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+PDF_FONT_BOLD_PATH = os.getenv("PDF_FONT_BOLD_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+# Сколько строк в одной таблице: ReportLab раскладывает таблицу целиком, поэтому
+# длинную историю режем на куски, каждый со своим повторяющимся заголовком
+PDF_TABLE_CHUNK_ROWS = int(os.getenv("PDF_TABLE_CHUNK_ROWS", 500))
 
-def generate_pdf_report(user_id: int, incomes: list, expenses: list) -> io.BytesIO:
+_fonts = None
+
+def get_fonts():
+    global _fonts
+    if _fonts is None:
+        _fonts = ("Helvetica", "Helvetica-Bold")
+        if os.path.exists(PDF_FONT_PATH) and os.path.exists(PDF_FONT_BOLD_PATH):
+            pdfmetrics.registerFont(TTFont("ReportFont", PDF_FONT_PATH))
+            pdfmetrics.registerFont(TTFont("ReportFont-Bold", PDF_FONT_BOLD_PATH))
+            _fonts = ("ReportFont", "ReportFont-Bold")
+    return _fonts
+
+async def generate_pdf_report(user_id: int, summary: dict = None) -> io.BytesIO:
     """
-    Создаёт PDF-файл с таблицей доходов и расходов по категориям и дням.
-    :param user_id: Telegram user id
-    :param incomes: список доходов (dict с amount, category, created_at)
-    :param expenses: список расходов (dict с amount, category, created_at)
+    Создаёт PDF-файл со сводкой по месяцам и таблицами доходов и расходов по категориям и дням.
+    Рендеринг выполняется в пуле воркеров (utils.report_pool).
+    :param user_id: внутренний users.id
+    :param summary: помесячные итоги из database.stats.fetch_summary; если не переданы — читаются воркером
     :return: BytesIO с PDF-файлом
+    :raises report_pool.ReportQueueFull: если очередь на генерацию отчётов заполнена
+    """
+    data = await metrics.timed_report("pdf", report_pool.run(render_pdf_report, user_id, summary))
+    return io.BytesIO(data)
+
+def render_pdf_report(user_id: int, summary: dict = None) -> bytes:
+    """
+    Синхронная точка входа для воркера: читает уже агрегированные данные и строит PDF.
+    """
+    async def fetch():
+        conn = await db.connect()
+        try:
+            nonlocal summary
+            if summary is None:
+                summary = await stats.fetch_summary(conn, user_id)
+            incomes = await export.fetch_daily_totals(conn, "incomes", user_id, summary)
+            expenses = await export.fetch_daily_totals(conn, "expenses", user_id, summary)
+            return summary, [tuple(r) for r in incomes], [tuple(r) for r in expenses]
+        finally:
+            await conn.close()
+    return build_pdf_report(*asyncio.run(fetch()))
+
+def table_style(header_color, font, bold_font):
+    return TableStyle([
+        # Основные рамки
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('INNERGRID', (0, 0), (-1, -1), 1, colors.black),
+        # Заголовок - белый текст на цветном фоне
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        # Данные - простой черный текст на белом фоне
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        # Выравнивание и шрифты
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), bold_font),
+        ('FONTNAME', (0, 1), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),  # заголовок
+        ('FONTSIZE', (0, 1), (-1, -1), 10),  # данные
+    ])
+
+def chunked_tables(header: list, rows: list, col_widths: list, style: TableStyle) -> list:
+    """
+    Делит строки на LongTable по PDF_TABLE_CHUNK_ROWS строк; заголовок повторяется на каждой странице.
+    """
+    tables = []
+    for i in range(0, len(rows), PDF_TABLE_CHUNK_ROWS):
+        tbl = LongTable([header] + rows[i:i + PDF_TABLE_CHUNK_ROWS], colWidths=col_widths, repeatRows=1)
+        tbl.setStyle(style)
+        tables.append(tbl)
+    return tables
+
+def build_pdf_report(summary: dict, incomes: list, expenses: list) -> bytes:
     """
-    try:
-        # Готовим DataFrame для доходов и расходов
-        df_incomes = pd.DataFrame(incomes) if incomes else pd.DataFrame()
-        df_expenses = pd.DataFrame(expenses) if expenses else pd.DataFrame()
-        
-        # Группируем по дате и категории
-        def group_by_day_and_category(df, value_col="amount"):
-            if df.empty:
-                return pd.DataFrame(columns=["Дата", "Категория", value_col])
-            df["Дата"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d")
-            grouped = df.groupby(["Дата", "category"])[value_col].sum().reset_index()
-            return grouped
-
-        income_table = group_by_day_and_category(df_incomes)
-        expense_table = group_by_day_and_category(df_expenses)
-
-        # Создаём PDF в простой текстовой форме (без сложных стилей)
-        output = io.BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=A4)
-        elements = []
-        
-        # Используем встроенный стиль и создаем свой для заголовков
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Title'],
-            fontName='Helvetica-Bold',
-            fontSize=18,
-            textColor=colors.black,
-            alignment=1,  # центрирование
-            spaceAfter=12
-        )
-        
-        # Стиль для подзаголовков
-        heading_style = ParagraphStyle(
-            'Heading',
-            parent=styles['Heading2'],
-            fontName='Helvetica-Bold',
-            fontSize=16,
-            textColor=colors.black,
-            alignment=1,
-            spaceAfter=8
-        )
-        
-        # Заголовок
-        elements.append(Paragraph("Отчёт по доходам и расходам по категориям и дням", title_style))
+    Строит PDF из агрегированных данных.
+    :param summary: dict с income_by_month и expense_by_month; base_currency и by_currency — если есть
+    :param incomes: строки (день, категория, сумма) по доходам
+    :param expenses: строки (день, категория, сумма) по расходам
+    :return: содержимое PDF
+    """
+    font, bold_font = get_fonts()
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    elements = []
+
+    # Используем встроенный стиль и создаем свой для заголовков
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'Title',
+        parent=styles['Title'],
+        fontName=bold_font,
+        fontSize=18,
+        textColor=colors.black,
+        alignment=1,  # центрирование
+        spaceAfter=12
+    )
+
+    # Стиль для подзаголовков
+    heading_style = ParagraphStyle(
+        'Heading',
+        parent=styles['Heading2'],
+        fontName=bold_font,
+        fontSize=16,
+        textColor=colors.black,
+        alignment=1,
+        spaceAfter=8
+    )
+    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontName=font, textColor=colors.black)
+
+    # Заголовок
+    elements.append(Paragraph("Отчёт по доходам и расходам по категориям и дням", title_style))
+    elements.append(Spacer(1, 20))
+
+    # Суммы в валюте пользователя; без base_currency (benchmarks.pdf_render) — без подписи
+    currency = summary.get("base_currency")
+    suffix = f", {currency}" if currency else ""
+
+    # === СВОДКА ПО МЕСЯЦАМ ===
+    income_by_month = summary["income_by_month"]
+    expense_by_month = summary["expense_by_month"]
+    months = sorted(set(income_by_month) | set(expense_by_month))
+    if months:
+        elements.append(Paragraph("СВОДКА ПО МЕСЯЦАМ", heading_style))
+        elements.append(Spacer(1, 10))
+        monthly_rows = []
+        for m in months:
+            income = income_by_month.get(m, 0)
+            expense = expense_by_month.get(m, 0)
+            monthly_rows.append([m, f"{income:.2f}", f"{expense:.2f}", f"{income - expense:.2f}"])
+        elements.extend(chunked_tables(
+            ["Месяц", f"Доход{suffix}", f"Расход{suffix}", f"Баланс{suffix}"], monthly_rows, [90, 110, 110, 110],
+            table_style(colors.darkblue, font, bold_font),
+        ))
         elements.append(Spacer(1, 20))
 
-        # === ДОХОДЫ - формируем простую таблицу без сложного форматирования ===
-        elements.append(Paragraph("ДОХОДЫ", heading_style))
+    # === ПО ВАЛЮТАМ === (исходные суммы, если валют несколько)
+    by_currency = summary.get("by_currency") or {}
+    missing_rates = summary.get("missing_rates") or []
+    if len(by_currency) > 1 or missing_rates:
+        elements.append(Paragraph("ПО ВАЛЮТАМ", heading_style))
         elements.append(Spacer(1, 10))
-        
-        if not income_table.empty:
-            # Преобразуем данные в строки текста
-            income_data = [["Дата", "Категория", "Сумма"]]
-            
-            for _, row in income_table.iterrows():
-                income_data.append([row['Дата'], str(row['category']), f"{float(row['amount']):.2f}"])
-                
-            # Создаем простую таблицу
-            income_tbl = Table(income_data, colWidths=[100, 150, 100])
-            income_tbl.setStyle(TableStyle([
-                # Основные рамки
-                ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                ('INNERGRID', (0, 0), (-1, -1), 1, colors.black),
-                # Заголовок - белый текст на синем фоне
-                ('BACKGROUND', (0, 0), (-1, 0), colors.blue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                # Данные - простой черный текст на белом фоне
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                # Выравнивание и шрифты
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),  # заголовок
-                ('FONTSIZE', (0, 1), (-1, -1), 10),  # данные
-            ]))
-            elements.append(income_tbl)
-        else:
-            p = Paragraph("Нет данных по доходам", styles["Normal"])
-            p.style.textColor = colors.black
-            elements.append(p)
-            
+        currency_rows = [[cur, f"{t['income']:.2f}", f"{t['expense']:.2f}"] for cur, t in sorted(by_currency.items())]
+        elements.extend(chunked_tables(
+            ["Валюта", "Доход", "Расход"], currency_rows, [90, 110, 110],
+            table_style(colors.darkgreen, font, bold_font),
+        ))
+        if missing_rates:
+            elements.append(Spacer(1, 6))
+            elements.append(Paragraph(f"Нет курса для {', '.join(missing_rates)} — эти суммы не вошли в сводку.", normal_style))
         elements.append(Spacer(1, 20))
-        
-        # === РАСХОДЫ - формируем простую таблицу без сложного форматирования ===
-        elements.append(Paragraph("РАСХОДЫ", heading_style))
+
+    # === ДОХОДЫ И РАСХОДЫ ПО ДНЯМ ===
+    for title, rows, header_color, empty_text in (
+        ("ДОХОДЫ", incomes, colors.blue, "Нет данных по доходам"),
+        ("РАСХОДЫ", expenses, colors.red, "Нет данных по расходам"),
+    ):
+        elements.append(Paragraph(title, heading_style))
         elements.append(Spacer(1, 10))
-        
-        if not expense_table.empty:
-            # Преобразуем данные в строки текста
-            expense_data = [["Дата", "Категория", "Сумма"]]
-            
-            for _, row in expense_table.iterrows():
-                expense_data.append([row['Дата'], str(row['category']), f"{float(row['amount']):.2f}"])
-                
-            # Создаем простую таблицу
-            expense_tbl = Table(expense_data, colWidths=[100, 150, 100])
-            expense_tbl.setStyle(TableStyle([
-                # Основные рамки
-                ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                ('INNERGRID', (0, 0), (-1, -1), 1, colors.black),
-                # Заголовок - белый текст на красном фоне
-                ('BACKGROUND', (0, 0), (-1, 0), colors.red),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                # Данные - простой черный текст на белом фоне
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                # Выравнивание и шрифты
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),  # заголовок
-                ('FONTSIZE', (0, 1), (-1, -1), 10),  # данные
-            ]))
-            elements.append(expense_tbl)
+        if rows:
+            data = [[day, str(category), f"{total:.2f}"] for day, category, total in rows]
+            elements.extend(chunked_tables(
+                ["Дата", "Категория", f"Сумма{suffix}"], data, [100, 150, 110],
+                table_style(header_color, font, bold_font),
+            ))
         else:
-            p = Paragraph("Нет данных по расходам", styles["Normal"])
-            p.style.textColor = colors.black
-            elements.append(p)
-            
-        elements.append(Spacer(1, 12))
-        
-        # Завершаем построение документа
-        doc.build(elements)
-        output.seek(0)
-        return output
-        
-    except Exception as e:
-        # В случае ошибки создаем простой PDF с сообщением об ошибке
-        output = io.BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=A4)
-        elements = []
-        styles = getSampleStyleSheet()
-        elements.append(Paragraph(f"Произошла ошибка при создании отчета: {str(e)}", styles["Title"]))
-        doc.build(elements)
-        output.seek(0)
-        return output
+            elements.append(Paragraph(empty_text, normal_style))
+        elements.append(Spacer(1, 20))
+
+    # Завершаем построение документа
+    doc.build(elements)
+    return output.getvalue()
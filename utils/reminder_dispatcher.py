@@ -0,0 +1,245 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from utils.bot_session import bulk_lane
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LOOKAHEAD = float(os.getenv("REMINDER_LOOKAHEAD", 120))
+REMINDER_POLL_INTERVAL = float(os.getenv("REMINDER_POLL_INTERVAL", 5))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 500))
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", 300))
+REMINDER_SEND_CONCURRENCY = int(os.getenv("REMINDER_SEND_CONCURRENCY", 25))
+REMINDER_SCAN_LIMIT = int(os.getenv("REMINDER_SCAN_LIMIT", 200000))
+
+# remind_at — местное время без часового пояса, как его выбрал пользователь. «Сейчас» для кучи
+# берётся из базы (LOCALTIMESTAMP при скане плюс время, прошедшее по monotonic), поэтому
+# куча и аренда в SQL считают время в одном поясе — TimeZone сессии (DB_TIMEZONE),
+# даже если часовой пояс контейнера бота другой
+CLOCK_SQL = "SELECT COALESCE(MAX(id), 0), LOCALTIMESTAMP FROM reminders"
+
+# Новое окно по remind_at (частичный индекс по неотправленным) и строки, вставленные
+# после прошлого скана (диапазон по первичному ключу). Просроченные, но не отправленные
+# напоминания (например, упавший экземпляр не снял аренду) подбираются по тому же индексу.
+SCAN_SQL = """
+    SELECT id, remind_at FROM reminders
+    WHERE sent_at IS NULL AND remind_at > $1 AND remind_at <= $2
+    UNION
+    SELECT id, remind_at FROM reminders
+    WHERE sent_at IS NULL AND id > $3 AND remind_at <= $2
+    UNION
+    SELECT id, remind_at FROM reminders
+    WHERE sent_at IS NULL AND remind_at <= $4
+      AND (leased_until IS NULL OR leased_until < LOCALTIMESTAMP)
+    ORDER BY remind_at
+    LIMIT $5
+"""
+
+# Аренда пачки: строки, уже заблокированные другим экземпляром, пропускаются
+LEASE_SQL = """
+    UPDATE reminders r
+    SET leased_until = LOCALTIMESTAMP + make_interval(secs => $2)
+    FROM (
+        SELECT id FROM reminders
+        WHERE id = ANY($1::int[]) AND sent_at IS NULL
+          AND (leased_until IS NULL OR leased_until < LOCALTIMESTAMP)
+        FOR UPDATE SKIP LOCKED
+    ) due, users u
+    WHERE r.id = due.id AND u.id = r.user_id
+    RETURNING r.id, r.text, r.remind_at, u.telegram_id
+"""
+
+# Одним UPDATE на пачку: разовые отмечаются sent_at, у повторяющихся remind_at
+# переносится на следующее срабатывание (reminder_next_occurrence), и они снова ждут
+MARK_SENT_SQL = """
+    UPDATE reminders r
+    SET remind_at = COALESCE(n.next_at, r.remind_at),
+        sent_at = CASE WHEN n.next_at IS NULL THEN LOCALTIMESTAMP END,
+        leased_until = NULL
+    FROM (
+        SELECT id, CASE WHEN is_repeated
+            THEN reminder_next_occurrence(remind_at, repeat_anchor, repeat_type, LOCALTIMESTAMP)
+        END AS next_at
+        FROM reminders WHERE id = ANY($1::int[])
+    ) n
+    WHERE r.id = n.id
+"""
+
+# Недоставляемые (бот заблокирован) больше не повторяются
+STOP_SQL = """
+    UPDATE reminders SET sent_at = LOCALTIMESTAMP, leased_until = NULL
+    WHERE id = ANY($1::int[])
+"""
+
+SENT, STOPPED, RETRY = "sent", "stopped", "retry"
+
+class ReminderDispatcher:
+    """
+    Фоновая рассылка напоминаний.
+
+    Раз в poll_interval читает из базы напоминания на lookahead секунд вперёд и
+    держит их в min-heap по remind_at. Наступившие напоминания арендуются пачками
+    через FOR UPDATE SKIP LOCKED, поэтому несколько экземпляров бота делят
+    нагрузку без повторной отправки, после отправки помечаются sent_at, а у
+    повторяющихся remind_at переносится на следующее срабатывание.
+    """
+    def __init__(
+        self,
+        bot,
+        pool,
+        lookahead: float = REMINDER_LOOKAHEAD,
+        poll_interval: float = REMINDER_POLL_INTERVAL,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        lease_seconds: int = REMINDER_LEASE_SECONDS,
+        send_concurrency: int = REMINDER_SEND_CONCURRENCY,
+        scan_limit: int = REMINDER_SCAN_LIMIT,
+    ):
+        self.bot = bot
+        self.pool = pool
+        self.lookahead = timedelta(seconds=lookahead)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.scan_limit = scan_limit
+        self._send_semaphore = asyncio.Semaphore(send_concurrency)
+        self._heap = []
+        self._known = set()
+        self._horizon = datetime.min
+        self._max_id = 0
+        # (LOCALTIMESTAMP базы, time.monotonic() в тот же момент) с последнего скана
+        self._clock = None
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def now(self) -> datetime:
+        """
+        Текущее время в часовом поясе сессии базы; до первого скана — datetime.min.
+        """
+        if self._clock is None:
+            return datetime.min
+        db_now, measured_at = self._clock
+        return db_now + timedelta(seconds=time.monotonic() - measured_at)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_scan = 0.0
+        while True:
+            try:
+                if loop.time() >= next_scan:
+                    await self.scan()
+                    next_scan = loop.time() + self.poll_interval
+                await self.dispatch_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка рассылки напоминаний")
+            # Спим до ближайшего напоминания в куче или до следующего скана
+            timeout = next_scan - loop.time()
+            if self._heap:
+                until_due = (self._heap[0][0] - self.now()).total_seconds()
+                timeout = min(timeout, until_due)
+            await asyncio.sleep(max(timeout, 0))
+
+    async def scan(self) -> int:
+        """
+        Загружает напоминания из окна просмотра в кучу.
+        :return: количество новых напоминаний в куче
+        """
+        async with self.pool.acquire() as conn:
+            max_id, now = await conn.fetchrow(CLOCK_SQL)
+            self._clock = (now, time.monotonic())
+            horizon = now + self.lookahead
+            rows = await conn.fetch(
+                SCAN_SQL,
+                self._horizon, horizon, self._max_id,
+                now - timedelta(seconds=self.lease_seconds), self.scan_limit,
+            )
+        added = 0
+        for row in rows:
+            if row["id"] in self._known:
+                continue
+            self._known.add(row["id"])
+            heapq.heappush(self._heap, (row["remind_at"], row["id"]))
+            added += 1
+        # Если упёрлись в лимит, окно сдвигаем только до последней прочитанной строки
+        if len(rows) >= self.scan_limit:
+            horizon = rows[-1]["remind_at"]
+        self._horizon = max(self._horizon, horizon)
+        self._max_id = max(self._max_id, max_id)
+        return added
+
+    async def dispatch_due(self) -> int:
+        """
+        Арендует и отправляет все наступившие напоминания из кучи.
+        :return: количество отправленных напоминаний
+        """
+        now = self.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            self._known.discard(reminder_id)
+            due.append(reminder_id)
+        sent = 0
+        for i in range(0, len(due), self.batch_size):
+            sent += await self._dispatch_batch(due[i:i + self.batch_size])
+        return sent
+
+    async def _dispatch_batch(self, ids: list) -> int:
+        async with self.pool.acquire() as conn:
+            leased = await conn.fetch(LEASE_SQL, ids, self.lease_seconds)
+        if not leased:
+            return 0
+        results = await asyncio.gather(*(self._send(row) for row in leased))
+        done = [row["id"] for row, result in zip(leased, results) if result == SENT]
+        stopped = [row["id"] for row, result in zip(leased, results) if result == STOPPED]
+        if done:
+            await self.mark_sent(done)
+        if stopped:
+            async with self.pool.acquire() as conn:
+                await conn.execute(STOP_SQL, stopped)
+        return len(done)
+
+    async def mark_sent(self, ids: list):
+        async with self.pool.acquire() as conn:
+            await conn.execute(MARK_SENT_SQL, ids)
+
+    async def _send(self, row) -> str:
+        """
+        :return: SENT — отправлено, STOPPED — доставить нельзя и повторять не нужно,
+            RETRY — отправить повторно после истечения аренды
+        """
+        async with self._send_semaphore:
+            try:
+                # Рассылка идёт низкоприоритетной полосой и не задерживает ответы пользователям
+                with bulk_lane():
+                    await self.bot.send_message(row["telegram_id"], f"Напоминание: {row['text']}")
+                self.sent += 1
+                return SENT
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — повторять бессмысленно
+                logger.info("Напоминание %s не доставлено: %s", row["id"], e)
+                self.failed += 1
+                return STOPPED
+            except Exception:
+                # Аренда истечёт, и напоминание будет отправлено повторно
+                logger.exception("Ошибка отправки напоминания %s", row["id"])
+                self.failed += 1
+                return RETRY
@@ -0,0 +1,60 @@
+import os
+from collections import OrderedDict
+
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+class ReportCache:
+    """
+    LRU-кэш готовых отчётов, ограниченный суммарным размером в байтах.
+    Ключ — (users.id, вид отчёта); запись действительна, пока совпадает watermark
+    данных пользователя. Помимо байтов хранится file_id Telegram после первой
+    отправки, чтобы повторно не загружать файл.
+    """
+    def __init__(self, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, user_id: int, kind: str, watermark):
+        key = (user_id, kind)
+        entry = self._data.get(key)
+        if entry is None or entry["watermark"] != watermark:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, user_id: int, kind: str, watermark, data: bytes):
+        key = (user_id, kind)
+        self._pop(key)
+        if len(data) > self.max_bytes:
+            return None
+        entry = {"watermark": watermark, "data": data, "file_id": None}
+        self._data[key] = entry
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, old = self._data.popitem(last=False)
+            self.size -= len(old["data"])
+        return entry
+
+    def set_file_id(self, user_id: int, kind: str, watermark, file_id: str):
+        entry = self._data.get((user_id, kind))
+        if entry is not None and entry["watermark"] == watermark:
+            entry["file_id"] = file_id
+
+    def invalidate(self, user_id: int):
+        for key in [k for k in self._data if k[0] == user_id]:
+            self._pop(key)
+
+    def _pop(self, key):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.size -= len(old["data"])
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+report_cache = ReportCache()
@@ -0,0 +1,61 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from utils import metrics
+
+# Генерация отчётов (Excel/PDF) нагружает CPU, поэтому выполняется вне event loop
+REPORT_EXECUTOR = os.getenv("REPORT_EXECUTOR", "process")  # process | thread
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+# Сколько отчётов может ждать свободного воркера, прежде чем мы начнём отказывать
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", 20))
+
+class ReportQueueFull(Exception):
+    """Очередь на генерацию отчётов переполнена."""
+
+_executor = None
+_semaphore = None
+_pending = 0
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if REPORT_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+        else:
+            _executor = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+async def run(func, *args):
+    """
+    Выполняет func(*args) в пуле воркеров. Одновременно рендерится не больше
+    REPORT_WORKERS отчётов, остальные ждут в очереди длиной REPORT_QUEUE_SIZE.
+    :raises ReportQueueFull: если очередь заполнена
+    """
+    global _semaphore, _pending
+    if _pending >= REPORT_WORKERS + REPORT_QUEUE_SIZE:
+        raise ReportQueueFull()
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(REPORT_WORKERS)
+    _pending += 1
+    try:
+        async with _semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+def queue_depth() -> int:
+    return _pending
+
+metrics.Gauge("planbot_report_queue_depth", "Отчёты в работе и в очереди на генерацию", function=queue_depth)
+
+def shutdown():
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _semaphore = None
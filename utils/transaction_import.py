@@ -0,0 +1,292 @@
+import io
+import os
+import csv
+import codecs
+import asyncio
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
+from database import db
+from database import fx
+from database import importer
+from utils import metrics
+from utils import report_pool
+from utils.keyboards import INCOME_CATEGORIES, EXPENSE_CATEGORIES
+
+# Bot API отдаёт ботам файлы до 20 МБ
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 20 * 1024 * 1024))
+# Сколько строк разбирается и отправляется в базу за один COPY
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", 5000))
+# Сколько ошибок показать пользователю
+IMPORT_MAX_ERRORS = 5
+# Допустимые даты операций: не старше IMPORT_MAX_AGE_YEARS лет и не позже завтрашнего дня.
+# Опечатка в годе (2205) иначе создала бы секции incomes/expenses за произвольные месяцы
+IMPORT_MAX_AGE_YEARS = int(os.getenv("IMPORT_MAX_AGE_YEARS", 10))
+
+# Заголовки столбцов (без учёта регистра); подходит и файл из /csv
+HEADER_ALIASES = {
+    "created_at": ("created_at", "date", "datetime", "дата", "дата операции"),
+    "amount": ("amount", "sum", "сумма"),
+    "currency": ("currency", "валюта"),
+    "category": ("category", "категория"),
+    "kind": ("kind", "type", "тип"),
+}
+KINDS = {"income": "income", "доход": "income", "expense": "expense", "расход": "expense"}
+CATEGORIES = {
+    "income": {category.lower(): category for category in INCOME_CATEGORIES},
+    "expense": {category.lower(): category for category in EXPENSE_CATEGORIES},
+}
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y",
+)
+# NUMERIC(12,2)
+MAX_AMOUNT = Decimal("9999999999.99")
+CENT = Decimal("0.01")
+
+IMPORT_ROWS = metrics.Counter(
+    "planbot_import_rows_total", "Строки импортированных файлов: inserted, duplicate, invalid", ("result",),
+)
+
+class ImportFormatError(Exception):
+    """Файл нельзя импортировать целиком (формат, нет нужных столбцов)."""
+
+async def import_transactions(user_id: int, data: bytes, filename: str) -> dict:
+    """
+    Импортирует операции из CSV/XLSX. Разбор и загрузка выполняются в пуле воркеров
+    (utils.report_pool) со своим соединением с базой, event loop не блокируется.
+    :param user_id: внутренний users.id
+    :param data: содержимое файла
+    :param filename: имя файла, по расширению выбирается формат
+    :return: dict с inserted ({"income", "expense"}), duplicates, invalid и errors (первые ошибки)
+    :raises ImportFormatError: если формат не поддерживается или нет столбцов даты и суммы
+    :raises report_pool.ReportQueueFull: если очередь воркеров заполнена
+    """
+    result = await report_pool.run(run_import, user_id, data, filename)
+    IMPORT_ROWS.inc("inserted", amount=sum(result["inserted"].values()))
+    IMPORT_ROWS.inc("duplicate", amount=result["duplicates"])
+    IMPORT_ROWS.inc("invalid", amount=result["invalid"])
+    return result
+
+def run_import(user_id: int, data: bytes, filename: str) -> dict:
+    """
+    Синхронная точка входа для воркера.
+    """
+    return asyncio.run(_run_import(user_id, data, filename))
+
+async def _run_import(user_id: int, data: bytes, filename: str) -> dict:
+    problems = {"invalid": 0, "errors": []}
+    parsed = iter_chunks(read_rows(data, filename), problems)
+    valid = 0
+    conn = await db.connect()
+    try:
+        # Один импорт — одна транзакция: файл загружается целиком или не загружается
+        async with conn.transaction():
+            await importer.begin_import(conn, user_id)
+            for chunk in parsed:
+                await importer.load_chunk(conn, chunk)
+                valid += len(chunk)
+            # Секции за месяцы файла создаются отдельным соединением в короткой транзакции:
+            # CREATE TABLE ... PARTITION OF блокирует incomes/expenses целиком, и в транзакции
+            # импорта эта блокировка держалась бы до конца слияния
+            months = await importer.staged_months(conn)
+            if months:
+                partitions_conn = await db.connect()
+                try:
+                    await importer.create_month_partitions(partitions_conn, months)
+                finally:
+                    await partitions_conn.close()
+            inserted = await importer.merge(conn, user_id)
+    finally:
+        await conn.close()
+    return {
+        "inserted": inserted,
+        "duplicates": valid - sum(inserted.values()),
+        "invalid": problems["invalid"],
+        "errors": problems["errors"],
+    }
+
+def read_rows(data: bytes, filename: str):
+    """
+    Строки файла как списки значений, первая — заголовок. Файл читается потоково.
+    """
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return read_csv(data)
+    if name.endswith(".xlsx"):
+        return read_xlsx(data)
+    raise ImportFormatError("Поддерживаются файлы .csv и .xlsx")
+
+def read_csv(data: bytes):
+    # Excel в русской локали сохраняет CSV в cp1251 и с «;»
+    encoding = "utf-8-sig"
+    try:
+        codecs.decode(data[:65536], "utf-8-sig")
+    except UnicodeDecodeError as e:
+        # Обрыв многобайтного символа на границе фрагмента — это всё ещё UTF-8
+        if e.start < min(len(data), 65536) - 3:
+            encoding = "cp1251"
+    text = io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(text, dialect)
+
+def read_xlsx(data: bytes):
+    from openpyxl import load_workbook  # нужен только для .xlsx
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception:
+        raise ImportFormatError("Не удалось открыть файл Excel")
+    # Первый лист; read_only читает строки по мере обхода, не загружая книгу целиком
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def map_header(header) -> dict:
+    """
+    :return: {поле: номер столбца}
+    :raises ImportFormatError: если нет столбцов даты или суммы
+    """
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for field, aliases in HEADER_ALIASES.items():
+            if title in aliases and field not in columns:
+                columns[field] = index
+    missing = [name for field, name in (("created_at", "дата"), ("amount", "сумма")) if field not in columns]
+    if missing:
+        raise ImportFormatError(f"В первой строке нет столбцов: {', '.join(missing)}. Подробнее: /import")
+    return columns
+
+def parse_amount(value) -> Decimal:
+    if isinstance(value, float) and abs(value - round(value, 2)) < 1e-9:
+        # Ячейки Excel хранятся как double: 12.1 может прийти как 12.099999999999
+        amount = Decimal(str(round(value, 2)))
+    elif isinstance(value, (int, float)):
+        amount = Decimal(str(value))
+    else:
+        text = str(value or "").strip().replace("\u00a0", "").replace(" ", "")
+        if "," in text and "." not in text:
+            text = text.replace(",", ".")
+        amount = Decimal(text)
+    if not amount.is_finite() or amount != amount.quantize(CENT) or amount == 0 or abs(amount) > MAX_AMOUNT:
+        raise ValueError(f"некорректная сумма {value!r}")
+    return amount
+
+def local_naive(value: datetime) -> datetime:
+    # created_at — местное время без часового пояса, как LOCALTIMESTAMP
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+def parse_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return local_naive(value)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    try:
+        # Наша выгрузка /csv: isoformat с микросекундами
+        return local_naive(datetime.fromisoformat(text))
+    except ValueError:
+        raise ValueError(f"некорректная дата {value!r}")
+
+def import_window(now: datetime = None) -> tuple:
+    """
+    :return: (самая ранняя, самая поздняя) допустимая дата операции
+    """
+    now = now or datetime.now()
+    earliest = datetime(now.year - IMPORT_MAX_AGE_YEARS, 1, 1)
+    latest = datetime.combine(now.date() + timedelta(days=2), datetime.min.time())
+    return earliest, latest
+
+def cell(values, columns: dict, field: str):
+    index = columns.get(field)
+    if index is None or index >= len(values):
+        return None
+    return values[index]
+
+def parse_row(values, columns: dict, window: tuple = None) -> tuple:
+    """
+    Проверяет строку файла: сумма с точностью до копеек, валюта из поддерживаемых,
+    категория из тех же списков, что на клавиатурах сценариев (пустая — «Другое»),
+    дата в пределах window (по умолчанию import_window()).
+    :return: (kind, amount, currency, category, created_at)
+    :raises ValueError: с описанием ошибки
+    """
+    try:
+        amount = parse_amount(cell(values, columns, "amount"))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"некорректная сумма {cell(values, columns, 'amount')!r}")
+    kind_value = str(cell(values, columns, "kind") or "").strip().lower()
+    if kind_value:
+        kind = KINDS.get(kind_value)
+        if kind is None:
+            raise ValueError(f"неизвестный тип {kind_value!r}")
+        if amount < 0:
+            raise ValueError("отрицательная сумма")
+    else:
+        # Выписки банков: расход — со знаком минус
+        kind = "expense" if amount < 0 else "income"
+        amount = abs(amount)
+    currency = str(cell(values, columns, "currency") or fx.PIVOT_CURRENCY).strip().upper()
+    if currency not in fx.SUPPORTED_CURRENCIES:
+        raise ValueError(f"неизвестная валюта {currency!r}")
+    category_value = str(cell(values, columns, "category") or "").strip()
+    category = CATEGORIES[kind].get(category_value.lower()) if category_value else "Другое"
+    if category is None:
+        raise ValueError(f"категории {category_value!r} нет в списке")
+    created_at = parse_date(cell(values, columns, "created_at"))
+    earliest, latest = window or import_window()
+    if not earliest <= created_at < latest:
+        raise ValueError(f"дата {created_at:%d.%m.%Y} вне допустимого диапазона")
+    return kind, amount, currency, category, created_at
+
+def iter_chunks(rows, problems: dict, chunk_size: int = IMPORT_CHUNK_ROWS):
+    """
+    Пачки проверенных записей (line, kind, amount, currency, category, created_at) для COPY.
+    Ошибочные строки пропускаются: problems["invalid"] — их число, problems["errors"] —
+    первые IMPORT_MAX_ERRORS описаний «строка N: причина».
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError("Файл пустой")
+    columns = map_header(header)
+    window = import_window()
+    chunk = []
+    for line, values in enumerate(rows, start=2):
+        if not values or all(value in (None, "") for value in values):
+            continue
+        try:
+            chunk.append((line, *parse_row(values, columns, window)))
+        except ValueError as e:
+            problems["invalid"] += 1
+            if len(problems["errors"]) < IMPORT_MAX_ERRORS:
+                problems["errors"].append(f"строка {line}: {e}")
+            continue
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def format_result(result: dict) -> str:
+    inserted = result["inserted"]
+    lines = [
+        "Импорт завершён.",
+        f"Добавлено доходов: {inserted['income']}, расходов: {inserted['expense']}",
+    ]
+    if result["duplicates"]:
+        lines.append(f"Пропущено как уже загруженные: {result['duplicates']}")
+    if result["invalid"]:
+        lines.append(f"Строк с ошибками: {result['invalid']}")
+        lines.extend(f"• {error}" for error in result["errors"])
+    return "\n".join(lines)